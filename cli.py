@@ -0,0 +1,371 @@
+"""Command line entry of the application. It runs the reconstruction without the user interface, Qt is never imported,
+so it works on servers without display and starts quickly.
+
+Example:
+    python3 cli.py run -i images/ -o output/ -m 1200 -x
+    python3 cli.py batch queue.json --add manifest.json --memory-budget 64
+    python3 cli.py serve queue.json --socket /tmp/building_mapping_drone.sock
+    python3 cli.py submit --server /tmp/building_mapping_drone.sock -i images/ -o output/
+    python3 cli.py sweep -i images/ -o output/ --vary decimate=1,0.5,0.25 --vary smoothing_iterations=0,2
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+from src.batch import FAILED, PENDING, BatchQueue, BatchRunner, read_manifest
+from src.dataset_scan import format_scan, recommend_settings, scan_dataset
+from src.job_server import DEFAULT_PORT, JobServer, send_request
+from src.pipeline import PipelineCancelled, PipelineError
+from src.progress import print_event
+from src.resources import REPORT_NAME, format_duration, format_report
+from src.reconstruction import (MESHERS, POISSON_DEPTH, ProcessingOptions, build_pipeline, estimate_duration,
+                                read_dataset)
+from src.sweep import REPORT_NAME as SWEEP_REPORT_NAME, build_sweep_pipeline, compare_variants, format_table, \
+    write_sweep_report
+
+
+def add_processing_arguments(parser: argparse.ArgumentParser):
+    """
+    Add options of a single reconstruction to the parser, flags are the same as the ones of ProcessingOptions.
+
+    Args:
+        - parser (argparse.ArgumentParser): Parser of the command
+
+    """
+    parser.add_argument("-i", "--input", required=True, help="directory with images of the building")
+    parser.add_argument("-o", "--output", required=True, help="directory where the results are stored")
+    parser.add_argument("-m", "--max-resolution", type=int, default=800,
+                        help="images are scaled to this resolution during densification (default: %(default)s)")
+    parser.add_argument("-e", "--estimate-roi", type=int, choices=(0, 1, 2), default=1,
+                        help="0 - do not estimate ROI, 1 - estimate ROI, 2 - adaptive estimation "
+                             "(default: %(default)s)")
+    parser.add_argument("-v", "--verbosity", type=int, choices=range(5), default=2,
+                        help="verbosity of OpenMVS tools (default: %(default)s)")
+    parser.add_argument("-s", "--decimate", type=float, default=1.0,
+                        help="decimation factor in range 0 to 1 applied to the surface (default: %(default)s)")
+    parser.add_argument("-d", "--remove-dmaps", action="store_true", help="remove depth-maps after densification")
+    parser.add_argument("--compress-dmaps", action="store_true",
+                        help="compress kept depth-maps after densification, it reduces disk space they keep after the "
+                             "run, not the peak disk usage of densification")
+    parser.add_argument("-r", "--integrate-only-roi", action="store_true",
+                        help="integrate only points inside the ROI while meshing")
+    parser.add_argument("-t", "--smoothing-iterations", type=int, default=2,
+                        help="number of smoothing iterations of the surface (default: %(default)s)")
+    parser.add_argument("-p", "--min-point-distance", type=int, default=3,
+                        help="minimal distance in pixels between projections of two 3D points "
+                             "(default: %(default)s)")
+    parser.add_argument("--mesher", choices=MESHERS, default="openmvs",
+                        help="openmvs - ReconstructMesh, bpa - ball pivoting, poisson - Poisson reconstruction of "
+                             "Open3D (default: %(default)s)")
+    parser.add_argument("--voxel-size", type=float, default=0.0,
+                        help="voxel size of downsampling before meshing of Open3D, 0 means derived from "
+                             "--target-points")
+    parser.add_argument("--target-points", type=int, default=0,
+                        help="number of points left by downsampling before meshing of Open3D, 0 means no "
+                             "downsampling")
+    parser.add_argument("--poisson-depth", type=int, default=POISSON_DEPTH,
+                        help="depth of the octree of Poisson reconstruction (default: %(default)s)")
+    parser.add_argument("--lod", action="store_true",
+                        help="write also decimated levels of detail of the mesh with a manifest for viewers")
+    parser.add_argument("-x", "--export-ply", action="store_true", help="export the mesh as .ply instead of .obj")
+    parser.add_argument("--memory-budget", type=int, default=0,
+                        help="memory available for the reconstruction in GB, 0 means no budget "
+                             "(default: %(default)s)")
+    parser.add_argument("--cache-dir", help="directory of caches shared by all reconstructions")
+    parser.add_argument("--downscale-images", action="store_true",
+                        help="scale images to max resolution already before feature extraction, it is faster, but "
+                             "finds fewer features (scaled images are cached)")
+    parser.add_argument("--no-preflight", action="store_true", help="do not exclude blurred or badly exposed images")
+    parser.add_argument("--no-dedup", action="store_true", help="do not drop near-duplicate frames")
+    parser.add_argument("--exhaustive-pairs", action="store_true", help="match all pairs of images")
+
+
+def processing_options(args: argparse.Namespace) -> ProcessingOptions:
+    """
+    Args:
+        - args (argparse.Namespace): Parsed arguments with options from add_processing_arguments
+
+    Returns:
+        - ProcessingOptions: Options used to build the reconstruction pipeline
+    """
+    return ProcessingOptions(
+        input_directory=args.input,
+        output_directory=args.output,
+        max_resolution=args.max_resolution,
+        estimate_roi=args.estimate_roi,
+        verbosity=args.verbosity,
+        decimate=args.decimate,
+        remove_dmaps=args.remove_dmaps,
+        compress_dmaps=args.compress_dmaps,
+        mesher=args.mesher,
+        voxel_size=args.voxel_size,
+        target_points=args.target_points,
+        poisson_depth=args.poisson_depth,
+        lod=args.lod,
+        integrate_only_roi=args.integrate_only_roi,
+        smoothing_iterations=args.smoothing_iterations,
+        min_point_distance=args.min_point_distance,
+        export_ply=args.export_ply,
+        cache_directory=args.cache_dir,
+        downscale_images=args.downscale_images,
+        preflight=not args.no_preflight,
+        deduplicate=not args.no_dedup,
+        guided_pairs=not args.exhaustive_pairs,
+        memory_budget=args.memory_budget,
+    )
+
+
+def cancel_on_signals(cancel):
+    """
+    Call cancel on SIGINT and SIGTERM instead of stopping immediately. Commands of the pipeline run in their own
+    sessions, so they would not receive the signal from the terminal and would keep running.
+
+    Args:
+        - cancel (func): Callable without arguments, e.g. Pipeline.cancel
+
+    """
+    for number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(number, lambda *_: cancel())
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    Run a single reconstruction.
+
+    Args:
+        - args (argparse.Namespace): Parsed arguments of the run command
+
+    Returns:
+        - int: Exit code, 0 on success, 130 if cancelled
+    """
+    options = processing_options(args)
+    metadata = read_dataset(options)
+    if args.fit_budget:
+        recommendation = recommend_settings(options, metadata, options.memory_budget_bytes or None,
+                                            args.time_budget * 60 if args.time_budget else None)
+        options = options.copy(max_resolution=recommendation["max_resolution"],
+                               remove_dmaps=recommendation["remove_dmaps"])
+        print(f"Max resolution fitted to the budget: {options.max_resolution}"
+              + (", depth-maps are removed after densification" if options.remove_dmaps else ""))
+        if not recommendation["fits"]:
+            print("Even the lowest resolution does not fit into the budget.", file=sys.stderr)
+    scan = scan_dataset(options, metadata)
+    print(format_scan(scan))
+    if args.estimate_only:
+        for name, seconds in estimate_duration(options, list(build_pipeline(options).stages)).items():
+            print(f"  {name}: {format_duration(seconds)}")
+        return 0
+    if not scan["fits_memory"] and not args.force:
+        print("The reconstruction does not fit into memory, use --force to run it anyway.", file=sys.stderr)
+        return 1
+    pipeline = build_pipeline(options, resume=not args.no_resume)
+    pipeline.listeners.append(print_event)
+    cancel_on_signals(pipeline.cancel)
+    try:
+        pipeline.run()
+    except PipelineCancelled:
+        print("Pipeline was cancelled.", file=sys.stderr)
+        return 130
+    except PipelineError as e:
+        print(f"Pipeline failed at stage {e.stage}: {e}", file=sys.stderr)
+        return 1
+    print("Finished stages:", ", ".join(pipeline.completed))
+    print("Skipped already finished stages:", ", ".join(pipeline.skipped))
+    with open(options.output_path(REPORT_NAME)) as report_file:
+        print(format_report(json.load(report_file)))
+    return 0
+
+
+def batch(args: argparse.Namespace) -> int:
+    """
+    Add jobs of the manifest to the queue and run all pending jobs, or only print the state of the queue.
+
+    Args:
+        - args (argparse.Namespace): Parsed arguments of the batch command
+
+    Returns:
+        - int: Exit code, 0 if no job failed
+    """
+    queue = BatchQueue(args.queue)
+    for manifest in args.add or []:
+        for options in read_manifest(manifest):
+            queue.add(options)
+    if args.retry:
+        for job in queue.jobs:
+            if job["status"] == FAILED:
+                queue.update(job, status=PENDING, stage=None, error=None)
+    if not args.status:
+        runner = BatchRunner(queue, args.workers, args.memory_budget)
+        cancel_on_signals(runner.cancel)
+        runner.run()
+    for job in queue.jobs:
+        failure = f" at stage {job['stage']}" if job["stage"] else ""
+        failure += f": {job['error']}" if job["error"] else ""
+        print(f"{job['id']:>4} {job['status']:<9} {job['options']['output_directory']}{failure}")
+    return 1 if queue.summary()[FAILED] else 0
+
+
+def serve(args: argparse.Namespace) -> int:
+    """
+    Run the job server until SIGINT or SIGTERM.
+
+    Args:
+        - args (argparse.Namespace): Parsed arguments of the serve command
+
+    Returns:
+        - int: Exit code
+    """
+    server = JobServer(BatchQueue(args.queue), args.workers, args.memory_budget)
+    asyncio.run(server.serve(socket_path=args.socket, port=args.port))
+    return 0
+
+
+def submit(args: argparse.Namespace) -> int:
+    """
+    Add the reconstruction to the queue of a running job server.
+
+    Args:
+        - args (argparse.Namespace): Parsed arguments of the submit command
+
+    Returns:
+        - int: Exit code, 0 if the server accepted the job
+    """
+    options = processing_options(args).to_dict()
+    # The server may run in another directory
+    options["input_directory"] = os.path.abspath(options["input_directory"])
+    options["output_directory"] = os.path.abspath(options["output_directory"])
+    try:
+        job = send_request(args.server, "POST", "/jobs", options)
+    except (OSError, RuntimeError) as e:
+        print(f"Job was not submitted: {e}", file=sys.stderr)
+        return 1
+    print(f"Job {job['id']} submitted")
+    return 0
+
+
+def parse_grid(items: list) -> dict:
+    """
+    Args:
+        - items (list): Values of --vary arguments, e.g. ["decimate=1,0.5", "integrate_only_roi=true,false"]
+
+    Returns:
+        - dict: Option name -> list of values
+    """
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if not values:
+            raise argparse.ArgumentTypeError(f"{item} is not in form NAME=VALUE1,VALUE2")
+        grid[name.replace("-", "_")] = [json.loads(value.lower()) for value in values.split(",")]
+    return grid
+
+
+def sweep(args: argparse.Namespace) -> int:
+    """
+    Reconstruct and densify the images once, then mesh them with every combination of the varied options and print
+    the comparison of variants.
+
+    Args:
+        - args (argparse.Namespace): Parsed arguments of the sweep command
+
+    Returns:
+        - int: Exit code, 0 if all variants finished
+    """
+    options = processing_options(args)
+    try:
+        pipeline, variants = build_sweep_pipeline(options, parse_grid(args.vary), resume=not args.no_resume)
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    pipeline.listeners.append(print_event)
+    cancel_on_signals(pipeline.cancel)
+    exit_code = 0
+    try:
+        pipeline.run()
+    except PipelineCancelled:
+        print("Sweep was cancelled.", file=sys.stderr)
+        exit_code = 130
+    except PipelineError as e:
+        print(f"Sweep failed at stage {e.stage}: {e}", file=sys.stderr)
+        exit_code = 1
+    with open(options.output_path(REPORT_NAME)) as report_file:
+        rows = compare_variants(variants, json.load(report_file))
+    write_sweep_report(options.output_path(SWEEP_REPORT_NAME), rows)
+    print(format_table(rows))
+    return exit_code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns:
+        - argparse.ArgumentParser: Parser of all commands
+    """
+    parser = argparse.ArgumentParser(description="Building mapping drone - 3D reconstruction of buildings from images.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="reconstruct the building from a directory of images")
+    add_processing_arguments(run_parser)
+    run_parser.add_argument("--no-resume", action="store_true", help="run all stages again, ignore finished ones")
+    run_parser.add_argument("--estimate-only", action="store_true",
+                            help="only print the scan of the dataset with predicted memory, disk usage and time")
+    run_parser.add_argument("--fit-budget", action="store_true",
+                            help="choose the largest max resolution (and removal of depth-maps) fitting into the "
+                                 "memory budget (RAM if not set) and the time budget")
+    run_parser.add_argument("--time-budget", type=float, metavar="MINUTES",
+                            help="time available for the reconstruction, used with --fit-budget and history of runs")
+    run_parser.add_argument("--force", action="store_true", help="run even if the dataset does not fit into memory")
+    run_parser.set_defaults(handler=run)
+
+    sweep_parser = commands.add_parser("sweep", help="compare meshing options on one dataset")
+    add_processing_arguments(sweep_parser)
+    sweep_parser.add_argument("--vary", action="append", required=True, metavar="NAME=VALUES",
+                              help="option and comma separated values, e.g. decimate=1,0.5 (repeatable)")
+    sweep_parser.add_argument("--no-resume", action="store_true", help="run all stages again, ignore finished ones")
+    sweep_parser.set_defaults(handler=sweep)
+
+    batch_parser = commands.add_parser("batch", help="run a queue of reconstructions of many datasets")
+    batch_parser.add_argument("queue", help="queue file, it keeps state of jobs between runs")
+    batch_parser.add_argument("--add", nargs="+", metavar="MANIFEST", help="add jobs of JSON manifests to the queue")
+    batch_parser.add_argument("--workers", type=int, help="number of jobs run at the same time")
+    batch_parser.add_argument("--memory-budget", type=int, help="memory available for all jobs in GB")
+    batch_parser.add_argument("--retry", action="store_true", help="run failed jobs again")
+    batch_parser.add_argument("--status", action="store_true", help="only print state of jobs")
+    batch_parser.set_defaults(handler=batch)
+
+    serve_parser = commands.add_parser("serve", help="run jobs submitted by other programs over a local socket")
+    serve_parser.add_argument("queue", help="queue file, it keeps state of jobs between runs")
+    address = serve_parser.add_mutually_exclusive_group()
+    address.add_argument("--socket", help="path of the Unix socket to listen on")
+    address.add_argument("--port", type=int, default=DEFAULT_PORT,
+                         help="localhost TCP port to listen on (default: %(default)s)")
+    serve_parser.add_argument("--workers", type=int, help="number of jobs run at the same time")
+    serve_parser.add_argument("--memory-budget", type=int, help="memory available for all jobs in GB")
+    serve_parser.set_defaults(handler=serve)
+
+    submit_parser = commands.add_parser("submit", help="add a reconstruction to the queue of a running server")
+    add_processing_arguments(submit_parser)
+    submit_parser.add_argument("--server", default=f"127.0.0.1:{DEFAULT_PORT}",
+                               help="Unix socket path or host:port of the server (default: %(default)s)")
+    submit_parser.set_defaults(handler=submit)
+    return parser
+
+
+def main(arguments: list = None) -> int:
+    """
+    Parse arguments and run chosen command.
+
+    Args:
+        - arguments (list): Command line arguments, None means sys.argv
+
+    Returns:
+        - int: Exit code
+    """
+    args = build_parser().parse_args(arguments)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
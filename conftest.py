@@ -0,0 +1,5 @@
+"""Configuration of pytest. This file at the root of the repository also puts the root on sys.path, so tests import
+the application as the package src."""
+
+# Manual check of the Windows console, it only sleeps and has no tests
+collect_ignore = ["src/test_win.py"]
@@ -1,7 +1,9 @@
 """This is the main function of the whole project. Here you can find MainWindow class which purpose is to process
 interaction with the user and running of other scripts. There are specific params connected with animations,
 display options and communication."""
+import json
 import multiprocessing
+import os
 import sys
 import threading
 import markdown2
@@ -10,13 +12,20 @@ import numpy as np
 import subprocess
 
 from PySide2.QtGui import QPixmap, QCursor, QTransform
-from PySide2.QtWidgets import QStackedWidget, QApplication, QMainWindow, QFileDialog, QLabel
+from PySide2.QtWidgets import QStackedWidget, QApplication, QMainWindow, QFileDialog, QLabel, QMessageBox
 from PySide2.QtUiTools import QUiLoader
-from PySide2.QtCore import Qt, QTimer, QPoint
-
+from PySide2.QtCore import Qt, QTimer, QPoint, QObject, Signal
+
+from src.cost_model import GIGABYTE
+from src.dataset_scan import format_scan, recommend_settings, scan_dataset
+from src.pipeline import PipelineCancelled, PipelineError
+from src.progress import STAGE_FINISHED, STAGE_OUTPUT, STAGE_PROGRESS, STAGE_SKIPPED, STAGE_STARTED, print_event
+from src.reconstruction import ProcessingOptions, build_pipeline, build_test_pipeline, estimate_duration, read_dataset
+from src.resources import REPORT_NAME as RUN_REPORT_NAME, format_duration, format_report
 from srcUI.images import main_ui_bit
 
 WRONG_DIRECTORY_MESSAGE = 'Please select correct directory.'
+LOADING_MESSAGE = 'This may take over an hour...'
 
 ANIMATION_X_POS = 100
 ANIMATION_Y_POS = 245
@@ -25,6 +34,33 @@ TRAMPOLINE_Y_POS = 475
 
 TEST_MODE_ON = False
 
+# Purposes of scans of the input directory
+SCAN_SHOW = "show"
+SCAN_START = "start"
+SCAN_FIT = "fit"
+
+
+class PipelineSignals(QObject):
+    """
+    Signals emitted by the thread which runs the pipeline. The object lives in the UI thread, so connected slots are
+    queued and executed by the UI thread as soon as a signal is emitted.
+
+    - progress: progress event of the pipeline (dict);
+    - finished: names of finished and skipped stages (list, list);
+    - failed: name of the failed stage, exit code of its command (None if unknown), error message and last lines of
+      the output of the command (str, object, str, list);
+    - cancelled: the pipeline was stopped by the user;
+    - estimate: predicted durations of stages in seconds (dict);
+    - scanned: purpose of the scan, options the input directory was scanned with (JSON) and result of the scan
+      (str, str, dict), a scan with purpose SCAN_FIT gives the result of recommend_settings.
+    """
+    progress = Signal(dict)
+    estimate = Signal(dict)
+    scanned = Signal(str, str, dict)
+    finished = Signal(list, list)
+    failed = Signal(str, object, str, list)
+    cancelled = Signal()
+
 
 class MainWindow(QMainWindow):
     """
@@ -42,10 +78,21 @@ class MainWindow(QMainWindow):
         # Application parameters
         self.input_directory = None
         self.output_directory = None
-        self.script_completed = False  # Initialize the flag
-        self.process_timer = QTimer()
-        self.process_timer.timeout.connect(self.check_script_status)
         self.process_not_finished = True
+        self.pipeline = None
+        self.cancel_requested = False
+        self.run_report_path = None
+        self.stage_estimates = {}  # Predicted seconds of stages which did not finish yet
+        self.dataset_scan = None
+        self.dataset_scan_key = None
+        self.start_requested = False
+        self.pipeline_signals = PipelineSignals()
+        self.pipeline_signals.progress.connect(self.show_progress)
+        self.pipeline_signals.estimate.connect(self.show_estimate)
+        self.pipeline_signals.finished.connect(self.processing_finished)
+        self.pipeline_signals.failed.connect(self.processing_failed)
+        self.pipeline_signals.cancelled.connect(self.processing_cancelled)
+        self.pipeline_signals.scanned.connect(self.show_scan)
 
         """LOAD AND CONFIGURE MAIN UI"""
         loader = QUiLoader()
@@ -53,6 +100,7 @@ class MainWindow(QMainWindow):
 
         # Connect signals to main_ui
         self.window.close_butt.clicked.connect(self.close_app)
+        self.window.cancel_butt.clicked.connect(self.cancel_processing)
         self.window.input_dir_butt.clicked.connect(self.select_input_directory)
         self.window.output_dir_butt.clicked.connect(self.select_output_directory)
         self.window.options_butt.clicked.connect(self.options_dialog)
@@ -89,11 +137,14 @@ class MainWindow(QMainWindow):
         self.options_window.apply_butt.clicked.connect(self.apply_options)
         # Connect sliders to sliders update
         self.options_window.options_1_max_res_slid.valueChanged.connect(self.options_value_changed)
+        self.options_window.options_1_fit_butt.clicked.connect(self.fit_max_resolution)
+        self.options_window.options_1_mem_budget_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_1_est_roi_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_1_verb_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_2_decim_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_2_smot_iter_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_2_min_dis_slid.valueChanged.connect(self.options_value_changed)
+        self.options_window.options_2_bpa_points_slid.valueChanged.connect(self.options_value_changed)
         self.options_window.options_2_ext_type_rad.clicked.connect(self.options_value_changed)
 
         # Load the image for background of options_ui
@@ -131,6 +182,7 @@ class MainWindow(QMainWindow):
         self.loading_label = None
         self.trampoline_label = None
         self.window.loading_mess_butt.setVisible(False)
+        self.window.cancel_butt.setVisible(False)
 
         """WINDOW MOVEMENT VARIABLES"""
         self.dragging = False
@@ -195,8 +247,9 @@ class MainWindow(QMainWindow):
 
     def close_app(self):
         """
-        Save close of whole application
+        Save close of whole application, the running reconstruction is cancelled together with all its processes
         """
+        self.cancel_processing()
         if self.cloud_process is not None:
             self.cloud_process.terminate()
         if self.mesh_process is not None:
@@ -216,6 +269,7 @@ class MainWindow(QMainWindow):
         ):
             self.input_directory = directory
             self.window.input_text_browser.setPlainText(directory)
+            self.scan_input_directory()
         else:
             self.window.input_text_browser.setPlainText(WRONG_DIRECTORY_MESSAGE)
 
@@ -231,6 +285,7 @@ class MainWindow(QMainWindow):
         ):
             self.output_directory = directory
             self.window.output_text_browser.setPlainText(directory)
+            self.scan_input_directory()
         else:
             self.window.output_text_browser.setPlainText(WRONG_DIRECTORY_MESSAGE)
 
@@ -267,6 +322,41 @@ class MainWindow(QMainWindow):
 
         # Show the new main window
         self.window.show()
+        # Predictions depend on max resolution, memory budget and removal of depth-maps
+        self.scan_input_directory()
+
+    def fit_max_resolution(self):
+        """
+        Find the largest Max resolution whose reconstruction of the input images fits into the memory budget in the
+        background, the result is applied by apply_recommendation.
+        """
+        if not self.input_directory:
+            QMessageBox.information(self.options_window, "Fit to budget", "Please select input directory first.")
+            return
+        self.options_window.options_1_fit_butt.setEnabled(False)
+        self.scan_input_directory(SCAN_FIT)
+
+    def apply_recommendation(self, recommendation: dict):
+        """
+        Set Max resolution recommended by recommend_settings and check removal of depth-maps if they would not fit on
+        the disk.
+
+        Args:
+            - recommendation (dict): Result of recommend_settings, empty if the input directory could not be scanned
+
+        """
+        self.options_window.options_1_fit_butt.setEnabled(True)
+        if not recommendation:
+            return
+        slider = self.options_window.options_1_max_res_slid
+        slider.setValue(recommendation["max_resolution"])
+        if recommendation["remove_dmaps"]:
+            self.options_window.options_1_rem_dmaps_rad.setChecked(True)
+        if not recommendation["fits"]:
+            QMessageBox.warning(self.options_window, "Fit to budget",
+                                f"Even the lowest Max resolution needs about "
+                                f"{recommendation['peak_memory'] / GIGABYTE:.1f} GB of memory, use fewer images or "
+                                f"a bigger memory budget.")
 
     def options_value_changed(self):
         """
@@ -274,6 +364,9 @@ class MainWindow(QMainWindow):
         """
         self.options_window.options_1_max_res_butt.setText(f"Max resolution: "
                                                            f"{self.options_window.options_1_max_res_slid.value()}")
+        memory_budget = self.options_window.options_1_mem_budget_slid.value()
+        memory_budget_text = f"{memory_budget} GB" if memory_budget else "off"
+        self.options_window.options_1_mem_budget_butt.setText(f"Memory budget: {memory_budget_text}")
         self.options_window.options_1_est_roi_butt.setText(f"Estimate roi: "
                                                            f"{self.options_window.options_1_est_roi_slid.value()}")
         self.options_window.options_1_verb_butt.setText(f"Verbosity: "
@@ -284,6 +377,9 @@ class MainWindow(QMainWindow):
                                                              f"{self.options_window.options_2_smot_iter_slid.value()}")
         self.options_window.options_2_min_dis_butt.setText(f"Minimal point distance: "
                                                            f"{self.options_window.options_2_min_dis_slid.value()}")
+        bpa_points = self.options_window.options_2_bpa_points_slid.value()
+        bpa_points_text = f"{bpa_points}M points" if bpa_points else "off"
+        self.options_window.options_2_bpa_points_butt.setText(f"BPA meshing: {bpa_points_text}")
         if self.options_window.options_2_ext_type_rad.isChecked():
             self.options_window.options_2_ext_type_rad.setText("Export type: .ply")
         else:
@@ -327,73 +423,310 @@ class MainWindow(QMainWindow):
 
     def run_processing_script(self, test_windows: bool = False):
         """
-        Here is called execution of main application .sh script on chosen data or test_win.py script depends on flags.
+        Here is called execution of the reconstruction pipeline on chosen data or test_win.py script depends on flags.
 
         Args:
 
             - test_windows (bool): Indicates to call test_win.py from src package instead of starting execution of script
 
         """
+        options = None if test_windows else self.processing_options()
+        self.run_report_path = None if test_windows else options.output_path(RUN_REPORT_NAME)
+        self.stage_estimates = {}
+        self.pipeline = None
+        self.cancel_requested = False
+
         def run_script():
             try:
                 if test_windows:
-                    command = ["python3", "src/test_win.py"]
+                    pipeline = build_test_pipeline()
                 else:
-                    # Build the command as a list of strings
-                    command = ["./tools/pipeline.sh"]
-                    command.extend(["-i", str(self.input_directory),
-                                    "-o", str(self.output_directory),
-                                    "-m", str(self.options_window.options_1_max_res_slid.value()),
-                                    "-e", str(self.options_window.options_1_est_roi_slid.value()),
-                                    "-v", str(self.options_window.options_1_verb_slid.value()),
-                                    "-s", str(float(self.options_window.options_2_decim_slid.value() / 10)),
-                                    "-d", str(int(self.options_window.options_1_rem_dmaps_rad.isChecked())),
-                                    "-r", str(int(self.options_window.options_2_integrate_roi_rad.isChecked())),
-                                    "-t", str(self.options_window.options_2_smot_iter_slid.value()),
-                                    "-p", str(self.options_window.options_2_min_dis_slid.value()),
-                                    "-x", str(int(self.options_window.options_2_ext_type_rad.isChecked())),
-                                    ])
-                result = subprocess.run(command, check=True, text=True)
-                self.script_completed = result.returncode == 0
-                print("Script output:", result.stdout)
-
-            except subprocess.CalledProcessError as e:
-                print(f"Script failed with exit code {e.returncode}. Error message: {e.stderr}")
-
-        # Start the timer to periodically check the script status
-        self.process_timer.start(1000)  # Check every 1 second
+                    # Stages finished by a previous, interrupted run are not repeated
+                    pipeline = build_pipeline(options, resume=True)
+                    self.pipeline_signals.estimate.emit(estimate_duration(options, list(pipeline.stages)))
+                pipeline.listeners += [print_event, self.forward_event]
+                self.pipeline = pipeline
+                if self.cancel_requested:
+                    pipeline.cancel()
+                pipeline.run()
+                print("Finished stages:", ", ".join(pipeline.completed))
+                print("Skipped already finished stages:", ", ".join(pipeline.skipped))
+                self.pipeline_signals.finished.emit(pipeline.completed, pipeline.skipped)
+
+            except PipelineCancelled:
+                print("Pipeline was cancelled.")
+                self.pipeline_signals.cancelled.emit()
+            except PipelineError as e:
+                print(f"Pipeline failed at stage {e.stage}: {e}")
+                self.pipeline_signals.failed.emit(e.stage or "", e.returncode, str(e), e.output)
+            except Exception as e:
+                print(f"Pipeline could not be run: {e}")
+                self.pipeline_signals.failed.emit("", None, str(e), [])
+
         # Run the script in a separate thread
         script_thread = threading.Thread(target=run_script)
         script_thread.start()
 
-    def check_script_status(self):
+    def scan_options(self) -> tuple:
+        """
+        Returns:
+            - tuple: Options the input directory is scanned with (output directory falls back to the input one) and
+              their JSON used to match the scan with current options
+        """
+        options = self.processing_options()
+        if not self.output_directory:
+            options = options.copy(output_directory=options.input_directory)
+        return options, json.dumps(options.to_dict(), sort_keys=True)
+
+    def scan_input_directory(self, purpose: str = SCAN_SHOW):
+        """
+        Scan headers of input images in the background and predict memory, disk usage and time of the reconstruction
+        with current options, the result is handled by show_scan in the UI thread.
+
+        Args:
+            - purpose (str): SCAN_SHOW only shows the result, SCAN_START also starts the reconstruction if the user
+              confirms it and SCAN_FIT recommends Max resolution
+
         """
-        Purpose of this function is to check every 1 second if algorithm ended. It is done via connection with QTimer.
-        When process ends a few things takes place:
+        if not self.input_directory:
+            return
+        options, key = self.scan_options()
+        slider = self.options_window.options_1_max_res_slid
+        resolutions = slider.minimum(), slider.maximum()
+
+        def run_scan():
+            try:
+                if purpose == SCAN_FIT:
+                    result = recommend_settings(options, read_dataset(options), options.memory_budget_bytes or None,
+                                                min_resolution=resolutions[0], max_resolution=resolutions[1])
+                else:
+                    result = scan_dataset(options)
+                self.pipeline_signals.scanned.emit(purpose, key, result)
+            except OSError as e:
+                print(f"Input directory could not be scanned: {e}")
+                if purpose in (SCAN_START, SCAN_FIT):
+                    self.pipeline_signals.scanned.emit(purpose, key, {})
+
+        threading.Thread(target=run_scan, daemon=True).start()
+
+    def show_scan(self, purpose: str, key: str, scan: dict):
+        """
+        Show summary of the scan next to the input directory, the full report is in its tooltip. Scans made with
+        options which were changed since then are ignored, a scan requested by start_process is then repeated.
+        Recommendations of fit_max_resolution are passed to apply_recommendation.
+
+        Args:
+            - purpose (str): Purpose given to scan_input_directory
+
+            - key     (str): Options the scan was made with
+
+            - scan   (dict): Result of scan_dataset, empty if the input directory could not be scanned
+
+        """
+        if purpose == SCAN_FIT:
+            self.apply_recommendation(scan)
+            return
+        if not self.input_directory:
+            return
+        if key != self.scan_options()[1]:
+            if purpose == SCAN_START:
+                self.scan_input_directory(SCAN_START)
+            return
+        if scan:
+            self.dataset_scan = scan
+            self.dataset_scan_key = key
+            summary = (f"{scan['image_count']} images, {scan['peak_memory'] / GIGABYTE:.1f} GB RAM, "
+                       f"{scan['disk_usage'] / GIGABYTE:.1f} GB disk"
+                       + (", check warnings" if scan["warnings"] else ""))
+            self.window.input_text_browser.setPlainText(f"{self.input_directory}\n{summary}")
+            self.window.input_text_browser.setToolTip(format_scan(scan))
+        if purpose == SCAN_START and self.start_requested:
+            self.start_requested = False
+            self.window.start_butt.setEnabled(True)
+            if self.confirm_dataset():
+                self.start_reconstruction()
+
+    def confirm_dataset(self) -> bool:
+        """
+        Warn the user before starting a reconstruction which will not fit into memory or on the disk. The last scan
+        is used, start_process makes sure it was made with current options.
+
+        Returns:
+            - bool: True if the reconstruction should start
+        """
+        if self.dataset_scan_key != self.scan_options()[1] or not self.dataset_scan["warnings"]:
+            return True
+        answer = QMessageBox.question(self.window, "Check of the dataset",
+                                      f"{format_scan(self.dataset_scan)}\n\nStart the reconstruction anyway?",
+                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        return answer == QMessageBox.Yes
+
+    def processing_options(self) -> ProcessingOptions:
+        """
+        Collect options of the reconstruction from chosen directories and from options_ui.
+
+        Returns:
+            - ProcessingOptions: Options used to build the reconstruction pipeline
+        """
+        return ProcessingOptions(
+            input_directory=str(self.input_directory),
+            output_directory=str(self.output_directory),
+            max_resolution=self.options_window.options_1_max_res_slid.value(),
+            memory_budget=self.options_window.options_1_mem_budget_slid.value(),
+            estimate_roi=self.options_window.options_1_est_roi_slid.value(),
+            verbosity=self.options_window.options_1_verb_slid.value(),
+            decimate=self.options_window.options_2_decim_slid.value() / 10,
+            remove_dmaps=self.options_window.options_1_rem_dmaps_rad.isChecked(),
+            integrate_only_roi=self.options_window.options_2_integrate_roi_rad.isChecked(),
+            smoothing_iterations=self.options_window.options_2_smot_iter_slid.value(),
+            min_point_distance=self.options_window.options_2_min_dis_slid.value(),
+            # Ball pivoting is used only with a limit of points, it is too slow for full dense clouds
+            mesher="bpa" if self.options_window.options_2_bpa_points_slid.value() else "openmvs",
+            target_points=self.options_window.options_2_bpa_points_slid.value() * 1000000,
+            export_ply=self.options_window.options_2_ext_type_rad.isChecked(),
+            preflight=self.options_window.options_1_preflight_rad.isChecked(),
+            deduplicate=self.options_window.options_1_dedup_rad.isChecked(),
+        )
+
+    def forward_event(self, event: dict):
+        """
+        Listener of the pipeline, it is called in the pipeline thread and passes the event to the UI thread. Lines of
+        tools output are only printed, so they do not flood the UI.
+
+        Args:
+            - event (dict): Progress event of the pipeline
+
+        """
+        if event["event"] != STAGE_OUTPUT:
+            self.pipeline_signals.progress.emit(event)
+
+    def show_estimate(self, estimates: dict):
+        """
+        Show predicted duration of the whole reconstruction, it is based on the history of runs on this machine.
+
+        Args:
+            - estimates (dict): Stage name -> predicted seconds, empty if there is no history
+
+        """
+        self.stage_estimates = dict(estimates)
+        if estimates:
+            self.window.loading_mess_butt.setText(f"Estimated time: {format_duration(sum(estimates.values()))}")
+
+    def remaining_time(self, stage: str, percent: float = 0.0) -> str:
+        """
+        Args:
+            - stage     (str): Running stage
+
+            - percent (float): Progress of the running stage
+
+        Returns:
+            - str: Predicted time until the end of the reconstruction, empty if it is not known
+        """
+        if not self.stage_estimates:
+            return ""
+        remaining = sum(self.stage_estimates.values()) - self.stage_estimates.get(stage, 0.0) * percent / 100
+        return f", {format_duration(max(remaining, 0.0))} left"
+
+    def show_progress(self, event: dict):
+        """
+        Show the running stage, its progress and remaining time in the message under the animation.
+
+        Args:
+            - event (dict): Progress event of the pipeline
+
+        """
+        if event["event"] == STAGE_STARTED:
+            self.window.loading_mess_butt.setText(f"{event['stage']}{self.remaining_time(event['stage'])}")
+        elif event["event"] == STAGE_PROGRESS:
+            self.window.loading_mess_butt.setText(f"{event['stage']} {event['percent']:.0f}%"
+                                                  f"{self.remaining_time(event['stage'], event['percent'])}")
+        elif event["event"] == STAGE_SKIPPED:
+            self.stage_estimates.pop(event["stage"], None)
+            self.window.loading_mess_butt.setText(f"Stage {event['stage']} already finished")
+        elif event["event"] == STAGE_FINISHED:
+            self.stage_estimates.pop(event["stage"], None)
+
+    def cancel_processing(self):
+        """
+        Stop the running reconstruction. The pipeline kills its processes and removes partial outputs, then the
+        cancelled signal ends the loading screen.
+        """
+        self.cancel_requested = True
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+        self.window.cancel_butt.setEnabled(False)
+        self.window.loading_mess_butt.setText("Cancelling...")
+
+    def processing_cancelled(self):
+        """
+        Called in the UI thread when the cancelled pipeline stopped.
+        """
+        self.end_loading_screen()
+
+    def processing_finished(self, completed: list, skipped: list):
+        """
+        Called in the UI thread when the pipeline finished successfully. Summary of used resources (time, memory,
+        disk) is shown to the user.
+
+        Args:
+            - completed (list): Names of stages executed by this run
+
+            - skipped   (list): Names of stages finished by previous runs
+
+        """
+        print("Script completed successfully.")
+        self.end_loading_screen()
+        # Set flag for display
+        self.process_not_finished = False
+        if self.run_report_path is not None and os.path.isfile(self.run_report_path):
+            with open(self.run_report_path) as report_file:
+                summary = format_report(json.load(report_file))
+            print(summary)
+            QMessageBox.information(self.window, "Processing finished", summary)
+
+    def processing_failed(self, stage: str, returncode, message: str, output: list):
+        """
+        Called in the UI thread when the pipeline failed. The failing stage, exit code of its command and the last
+        lines of its output are shown to the user.
+
+        Args:
+            - stage      (str): Name of the failed stage, empty if the pipeline could not be started
+
+            - returncode (int): Exit code of the command of the stage, None if it is not known
+
+            - message    (str): Description of the error
+
+            - output    (list): Last lines of the output of the command
+
+        """
+        self.end_loading_screen()
+        title = f"Stage {stage} failed" if stage else "Processing failed"
+        if returncode is not None:
+            title += f" with exit code {returncode}"
+        QMessageBox.warning(self.window, "Processing failed", "\n\n".join([title, message, "\n".join(output)]).strip())
+
+    def end_loading_screen(self):
+        """
+        Purpose of this function is to restore the main window after the processing ended:
 
         - turning off animation;
         - checking back background to previous one;
         - enabling functional buttons again.
         """
-        if self.script_completed:
-            print("Script completed successfully.")
-            # When process ends change status of buttons for display and animation
-            self.loading_label.close()
-            self.loading_label = None
-            self.trampoline_label.close()
-            self.trampoline_label = None
-            self.rotation = 0
-            # Stop animation, hide message
-            self.animation_timer.stop()
-            self.window.loading_mess_butt.setVisible(False)
-            # Change background
-            self.window.background.setPixmap(QPixmap(':/labels/background'))
-            # Show ui buttons and so on
-            self.set_main_window_status(True)
-            self.script_completed = False
-            self.process_timer.stop()
-            # Set flag for display
-            self.process_not_finished = False
+        # When process ends change status of buttons for display and animation
+        self.loading_label.close()
+        self.loading_label = None
+        self.trampoline_label.close()
+        self.trampoline_label = None
+        self.rotation = 0
+        # Stop animation, hide message
+        self.animation_timer.stop()
+        self.window.loading_mess_butt.setVisible(False)
+        self.window.cancel_butt.setVisible(False)
+        # Change background
+        self.window.background.setPixmap(QPixmap(':/labels/background'))
+        # Show ui buttons and so on
+        self.set_main_window_status(True)
 
     def set_main_window_status(self, flag: bool):
         """
@@ -431,14 +764,26 @@ class MainWindow(QMainWindow):
         """
         if self.input_directory:
             if self.output_directory:
-                # Init loading gui and run
-                self.loading_screen()
-                self.run_processing_script(test_windows=TEST_MODE_ON)
+                if TEST_MODE_ON or self.dataset_scan_key == self.scan_options()[1]:
+                    if TEST_MODE_ON or self.confirm_dataset():
+                        self.start_reconstruction()
+                elif not self.start_requested:
+                    # Options changed since the last scan, the reconstruction starts when the new scan is confirmed
+                    self.start_requested = True
+                    self.window.start_butt.setEnabled(False)
+                    self.scan_input_directory(SCAN_START)
             else:
                 self.window.output_text_browser.setPlainText(WRONG_DIRECTORY_MESSAGE)
         else:
             self.window.input_text_browser.setPlainText(WRONG_DIRECTORY_MESSAGE)
 
+    def start_reconstruction(self):
+        """
+        Show the loading screen and run the reconstruction.
+        """
+        self.loading_screen()
+        self.run_processing_script(test_windows=TEST_MODE_ON)
+
     """
     LOADING SCREEN'S ANIMATION AND TEXT
     """
@@ -464,7 +809,10 @@ class MainWindow(QMainWindow):
         self.window.background.setPixmap(QPixmap(':/labels/background_no_drone'))
         # Start animation, display message
         self.animation_timer.start(10)
+        self.window.loading_mess_butt.setText(LOADING_MESSAGE)
         self.window.loading_mess_butt.setVisible(True)
+        self.window.cancel_butt.setEnabled(True)
+        self.window.cancel_butt.setVisible(True)
 
     def animate_drone(self):
         """
@@ -515,7 +863,7 @@ class MainWindow(QMainWindow):
         """
 
         def run_mesh_display():
-            subprocess.run(["python3", "src/mesh_lib.py", str(self.process_not_finished),
+            subprocess.run(["python3", "-m", "src.mesh_lib", str(self.process_not_finished),
                             self.window.output_text_browser.toPlainText()])
 
         if self.mesh_process is None:
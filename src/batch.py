@@ -0,0 +1,342 @@
+"""This module runs reconstructions of many datasets one after another or side by side. Jobs are kept in a JSON queue
+file, so the state of every job survives restarts, and interrupted jobs continue from their last finished stage."""
+import functools
+import json
+import os
+import threading
+import time
+
+from src.cost_model import GIGABYTE
+from src.pipeline import PipelineCancelled, PipelineError
+from src.reconstruction import ProcessingOptions, build_pipeline
+
+PENDING = "pending"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+JOB_THREADS = 4
+# Workers waiting for new jobs check the queue at least this often (seconds)
+QUEUE_POLL_INTERVAL = 1.0
+
+
+def read_manifest(manifest_path: str) -> list:
+    """
+    Read jobs from the manifest. It is a JSON object with list "jobs" of objects with "input", "output" and optional
+    "options" (arguments of ProcessingOptions), options given at the top level are shared by all jobs, e.g.
+    {"options": {"max_resolution": 1200}, "jobs": [{"input": "a/images", "output": "a/model"}]}.
+
+    Args:
+        - manifest_path (str): Path to the manifest
+
+    Returns:
+        - list: ProcessingOptions of the jobs
+    """
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    base_directory = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for job in manifest.get("jobs", []):
+        options = dict(manifest.get("options", {}), **job.get("options", {}))
+        options["input_directory"] = os.path.join(base_directory, job["input"])
+        options["output_directory"] = os.path.join(base_directory, job["output"])
+        jobs.append(ProcessingOptions(**options))
+    return jobs
+
+
+class BatchQueue:
+    """
+    Queue of reconstruction jobs persisted in a JSON file. Every change of a job is written to the file immediately.
+    Jobs which were running when the previous process ended are returned to the queue.
+
+    Args:
+        - path (str): Path of the queue file, it is created if it does not exist
+
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.jobs = []
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path) as queue_file:
+                self.jobs = json.load(queue_file)["jobs"]
+            for job in self.jobs:
+                if job["status"] == RUNNING:
+                    job["status"] = PENDING
+
+    def save(self):
+        """
+        Write the queue to its file. The file is replaced atomically, so it is never left half written.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as queue_file:
+            json.dump({"jobs": self.jobs}, queue_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def add(self, options: ProcessingOptions) -> dict:
+        """
+        Add job to the end of the queue. A job writing to the same output directory as a queued one replaces it,
+        unless the queued job is running.
+
+        Args:
+            - options (ProcessingOptions): Options of the reconstruction
+
+        Returns:
+            - dict: The job
+        """
+        with self._lock:
+            output_directory = os.path.abspath(options.output_directory)
+            for job in self.jobs:
+                if os.path.abspath(job["options"]["output_directory"]) == output_directory and job["status"] != RUNNING:
+                    job.update(options=options.to_dict(), status=PENDING, stage=None, error=None)
+                    break
+            else:
+                job = {"id": max((job["id"] for job in self.jobs), default=0) + 1, "options": options.to_dict(),
+                       "status": PENDING, "stage": None, "error": None, "started": None, "finished": None,
+                       "completed_stages": [], "skipped_stages": []}
+                self.jobs.append(job)
+            self.save()
+            return job
+
+    def take(self) -> dict:
+        """
+        Mark the first pending job as running.
+
+        Returns:
+            - dict: The job, None if no job is pending
+        """
+        with self._lock:
+            for job in self.jobs:
+                if job["status"] == PENDING:
+                    job.update(status=RUNNING, started=time.time(), finished=None, stage=None, error=None)
+                    self.save()
+                    return job
+            return None
+
+    def update(self, job: dict, **fields):
+        """
+        Change fields of the job and save the queue.
+
+        Args:
+            - job   (dict): Job of this queue
+
+            - fields: New values of job fields
+
+        """
+        with self._lock:
+            job.update(fields)
+            self.save()
+
+    def cancel(self, job: dict) -> bool:
+        """
+        Mark the job as cancelled if it did not start yet.
+
+        Args:
+            - job (dict): Job of this queue
+
+        Returns:
+            - bool: True if the job was pending
+        """
+        with self._lock:
+            if job["status"] != PENDING:
+                return False
+            job.update(status=CANCELLED, finished=time.time())
+            self.save()
+            return True
+
+    def find(self, job_id: int) -> dict:
+        """
+        Args:
+            - job_id (int): Id of the job
+
+        Returns:
+            - dict: The job, None if the queue does not contain it
+        """
+        with self._lock:
+            return next((job for job in self.jobs if job["id"] == job_id), None)
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            - dict: Number of jobs in every status
+        """
+        with self._lock:
+            counts = {status: 0 for status in (PENDING, RUNNING, FINISHED, FAILED, CANCELLED)}
+            for job in self.jobs:
+                counts[job["status"]] += 1
+            return counts
+
+
+def default_workers() -> int:
+    """
+    OpenMVG and OpenMVS tools use several threads each, so one job is run per JOB_THREADS CPUs.
+
+    Returns:
+        - int: Number of jobs run at the same time
+    """
+    return max(1, (os.cpu_count() or 1) // JOB_THREADS)
+
+
+class BatchRunner:
+    """
+    Runs all pending jobs of the queue on a pool of worker threads. Every job runs the same pipeline as the user
+    interface (with resume). A job is started only if its estimated peak memory fits into the memory budget next to
+    already running jobs, a job which alone exceeds the budget is run when nothing else is running.
+
+    Args:
+        - queue         (BatchQueue): Queue of jobs
+
+        - max_workers          (int): Maximal number of jobs running at the same time, None means default_workers()
+
+        - memory_budget        (int): Memory available for all jobs in GB, None means no limit
+
+        - wait_for_jobs       (bool): Keep workers waiting for new jobs when the queue is empty (used by the server)
+
+        - listeners           (list): Callables receiving the job and every event of its pipeline
+
+    """
+    def __init__(self, queue: BatchQueue, max_workers: int = None, memory_budget: int = None,
+                 wait_for_jobs: bool = False, listeners: list = None):
+        self.queue = queue
+        self.max_workers = max_workers or default_workers()
+        self.memory_budget = memory_budget
+        self.wait_for_jobs = wait_for_jobs
+        self.listeners = listeners or []
+        self.cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._reserved = {}
+        self._running = {}
+        self._cancelled_jobs = set()
+
+    def run(self) -> dict:
+        """
+        Run jobs until the queue has no pending job or the runner is cancelled.
+
+        Returns:
+            - dict: Number of jobs in every status after the run
+        """
+        workers = [threading.Thread(target=self.worker) for _ in range(self.max_workers)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return self.queue.summary()
+
+    def cancel(self):
+        """
+        Stop taking new jobs and cancel running pipelines, it can be called from any thread (e.g. a signal handler).
+        Cancelled jobs are returned to the queue and continue from their last finished stage next time.
+        """
+        self.cancelled.set()
+        with self._condition:
+            for pipeline in self._reserved:
+                pipeline.cancel()
+            self._condition.notify_all()
+
+    def wake(self):
+        """
+        Tell waiting workers that jobs were added to the queue.
+        """
+        with self._condition:
+            self._condition.notify_all()
+
+    def cancel_job(self, job_id: int) -> bool:
+        """
+        Cancel a single job. A pending job is only marked as cancelled, the pipeline of a running job is cancelled and
+        the job keeps its finished stages, so it continues from them when it is added again.
+
+        Args:
+            - job_id (int): Id of the job
+
+        Returns:
+            - bool: True if the job was pending or running
+        """
+        job = self.queue.find(job_id)
+        if job is None:
+            return False
+        if self.queue.cancel(job):
+            return True
+        with self._condition:
+            if job_id not in self._running:
+                return False
+            self._cancelled_jobs.add(job_id)
+            self._running[job_id].cancel()
+            self._condition.notify_all()
+            return True
+
+    def fits(self, memory: int) -> bool:
+        """
+        Args:
+            - memory (int): Estimated peak memory of the job in bytes
+
+        Returns:
+            - bool: True if the job can be started next to running jobs
+        """
+        if not self._reserved or self.memory_budget is None:
+            return True
+        return sum(self._reserved.values()) + memory <= self.memory_budget * GIGABYTE
+
+    def worker(self):
+        """
+        Take jobs from the queue and run them one by one.
+        """
+        while not self.cancelled.is_set():
+            job = self.queue.take()
+            if job is None:
+                if not self.wait_for_jobs:
+                    return
+                with self._condition:
+                    self._condition.wait(QUEUE_POLL_INTERVAL)
+                continue
+            # A broken job must not end the worker, the job would stay running in the queue
+            try:
+                options = ProcessingOptions(**job["options"])
+                print(f"Job {job['id']}: {options.input_directory} -> {options.output_directory}")
+                pipeline = build_pipeline(options, resume=True)
+            except Exception as e:
+                self.queue.update(job, status=FAILED, error=str(e), finished=time.time())
+                print(f"Job {job['id']} failed: {e}")
+                continue
+            pipeline.listeners += [functools.partial(listener, job) for listener in self.listeners]
+            memory = max((stage.memory for stage in pipeline.stages.values()), default=0)
+            with self._condition:
+                self._running[job["id"]] = pipeline
+                self._condition.wait_for(lambda: self.cancelled.is_set() or pipeline.cancelled.is_set()
+                                         or self.fits(memory))
+                if self.cancelled.is_set():
+                    del self._running[job["id"]]
+                    self.queue.update(job, status=PENDING)
+                    return
+                # A job cancelled while waiting for memory ends in pipeline.run() right away
+                self._reserved[pipeline] = memory
+            try:
+                pipeline.run()
+            except PipelineCancelled as e:
+                # Jobs cancelled one by one are finished, the ones stopped with the whole runner are run again
+                status = CANCELLED if job["id"] in self._cancelled_jobs else PENDING
+                self.queue.update(job, status=status, stage=e.stage, completed_stages=pipeline.completed,
+                                  skipped_stages=pipeline.skipped)
+                print(f"Job {job['id']} cancelled")
+            except PipelineError as e:
+                self.queue.update(job, status=FAILED, stage=e.stage, error=str(e), finished=time.time(),
+                                  completed_stages=pipeline.completed, skipped_stages=pipeline.skipped)
+                print(f"Job {job['id']} failed at stage {e.stage}: {e}")
+            except Exception as e:
+                self.queue.update(job, status=FAILED, error=str(e), finished=time.time(),
+                                  completed_stages=pipeline.completed, skipped_stages=pipeline.skipped)
+                print(f"Job {job['id']} failed: {e}")
+            else:
+                self.queue.update(job, status=FINISHED, finished=time.time(),
+                                  completed_stages=pipeline.completed, skipped_stages=pipeline.skipped)
+                print(f"Job {job['id']} finished")
+            finally:
+                with self._condition:
+                    del self._reserved[pipeline]
+                    del self._running[job["id"]]
+                    self._cancelled_jobs.discard(job["id"])
+                    self._condition.notify_all()
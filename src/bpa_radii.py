@@ -0,0 +1,150 @@
+"""This module chooses radii of the ball pivoting algorithm from the distribution of distances between neighbouring
+points. Density of clouds of buildings varies a lot (dense ground, sparse facades), so a single radius derived from the
+mean distance leaves holes in sparse parts and wastes time in dense ones. Radii are taken from percentiles of local
+point spacing, optionally of every region of the cloud, and close radii are merged, so BPA runs as few passes as
+possible."""
+import numpy as np
+
+KNN_NEIGHBOURS = 8
+RADIUS_PERCENTILES = (10, 50, 90, 98)
+# Ball has to reach neighbours a few spacings away to pivot over small gaps
+RADIUS_SCALE = 2.5
+# Radii closer than this ratio are merged into one pass
+MIN_RADIUS_RATIO = 1.4
+MAX_PASSES = 5
+REGION_GRID = 4
+MIN_REGION_POINTS = 100
+
+
+def local_spacing(distances: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        - param distances (np.ndarray): Array (n, k) of distances to k nearest neighbours sorted in every row
+
+    Returns:
+        - np.ndarray: Spacing of every point, the mean distance to its neighbours (more robust than the nearest one)
+    """
+    return distances.mean(axis=1)
+
+
+def merge_radii(radii: np.ndarray, min_ratio: float = MIN_RADIUS_RATIO, max_passes: int = MAX_PASSES) -> list:
+    """
+    Merge radii which are so close that an extra pass would add almost no triangles.
+
+    Args:
+        - param radii     (np.ndarray): Candidate radii
+
+        - param min_ratio      (float): Minimal ratio of two consecutive radii
+
+        - param max_passes       (int): Maximal number of radii, the largest ones are kept
+
+    Returns:
+        - list: Increasing radii
+    """
+    merged = []
+    for radius in np.sort(radii[radii > 0]):
+        if not merged or radius >= merged[-1] * min_ratio:
+            merged.append(float(radius))
+    # The largest radius closes the biggest holes, the smallest one the finest details
+    if len(merged) > max_passes:
+        merged = merged[:1] + merged[len(merged) - max_passes + 1:]
+    return merged
+
+
+def region_labels(points: np.ndarray, grid: int = REGION_GRID) -> np.ndarray:
+    """
+    Split the cloud into grid x grid regions in the horizontal plane.
+
+    Args:
+        - param points (np.ndarray): Array (n, 3) of points
+
+        - param grid          (int): Number of regions along each horizontal axis
+
+    Returns:
+        - np.ndarray: Region index of every point
+    """
+    horizontal = points[:, :2]
+    minimum = horizontal.min(axis=0)
+    size = np.maximum(horizontal.max(axis=0) - minimum, 1e-12)
+    cells = np.minimum((grid * (horizontal - minimum) / size).astype(int), grid - 1)
+    return cells[:, 0] * grid + cells[:, 1]
+
+
+def pivoting_cost(spacing: np.ndarray, radii: list) -> list:
+    """
+    Estimate work of every BPA pass. A ball of radius r on a surface with spacing s touches about pi * (r / s)^2
+    points, every point is a seed candidate, so the cost of a pass grows with the sum of these counts.
+
+    Args:
+        - param spacing (np.ndarray): Spacing of points
+
+        - param radii         (list): Radii of passes
+
+    Returns:
+        - list: Dictionary for every pass with radius, mean number of neighbours inside the ball, share of points
+          whose spacing allows pivoting with this radius and relative cost (1 for the first pass)
+    """
+    passes = []
+    first_cost = None
+    for radius in radii:
+        neighbours = np.pi * (radius / np.maximum(spacing, 1e-12)) ** 2
+        cost = float(neighbours.sum())
+        first_cost = first_cost or cost
+        passes.append({"radius": radius, "neighbours": float(neighbours.mean()),
+                       "coverage": float(np.mean(spacing * RADIUS_SCALE <= radius)),
+                       "relative_cost": cost / first_cost if first_cost else 0.0})
+    return passes
+
+
+def plan_radii(points: np.ndarray, distances: np.ndarray, per_region: bool = True,
+               percentiles: tuple = RADIUS_PERCENTILES) -> dict:
+    """
+    Choose the radius schedule of ball pivoting.
+
+    Args:
+        - param points      (np.ndarray): Array (n, 3) of points whose neighbour distances are given
+
+        - param distances   (np.ndarray): Array (n, k) of distances to nearest neighbours
+
+        - param per_region        (bool): Add the median spacing of every region of the cloud, so sparse facades and
+          dense ground both get their own radius
+
+        - param percentiles      (tuple): Percentiles of spacing of the whole cloud turned into radii
+
+    Returns:
+        - dict: Radii, percentiles of spacing, median spacing of regions and estimated cost of passes
+    """
+    spacing = local_spacing(distances)
+    spacing_percentiles = np.percentile(spacing, percentiles)
+    candidates = [RADIUS_SCALE * spacing_percentiles]
+    regions = {}
+    if per_region:
+        labels = region_labels(points)
+        counts = np.bincount(labels)
+        for label in np.flatnonzero(counts >= MIN_REGION_POINTS):
+            regions[int(label)] = float(np.median(spacing[labels == label]))
+        candidates.append(RADIUS_SCALE * np.array(list(regions.values())))
+    radii = merge_radii(np.concatenate(candidates))
+    return {
+        "radii": radii,
+        "spacing_percentiles": dict(zip(map(str, percentiles), map(float, spacing_percentiles))),
+        "region_spacing": regions,
+        "passes": pivoting_cost(spacing, radii),
+    }
+
+
+def format_plan(plan: dict) -> str:
+    """
+    Args:
+        - param plan (dict): Result of plan_radii
+
+    Returns:
+        - str: Radii and estimated cost of passes as text
+    """
+    lines = ["Spacing percentiles: " + ", ".join(f"p{key}={value:.4g}"
+                                                 for key, value in plan["spacing_percentiles"].items())]
+    for number, bpa_pass in enumerate(plan["passes"], 1):
+        lines.append(f"Pass {number}: radius {bpa_pass['radius']:.4g}, {bpa_pass['neighbours']:.1f} neighbours, "
+                     f"{100 * bpa_pass['coverage']:.0f}% of points covered, relative cost "
+                     f"{bpa_pass['relative_cost']:.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,180 @@
+"""This module contains persistent, size-bounded cache of files shared by all reconstructions of the user. Entries are
+addressed by keys derived from content of the source files and from parameters, the least recently used entries are
+removed when the cache exceeds its size."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from src.image_utils import link_or_copy
+
+CACHE_DIRECTORY = os.environ.get("BMD_CACHE_DIR",
+                                 os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                              "building_mapping_drone"))
+INDEX_NAME = "index.sqlite"
+
+
+def cache_key(*parts) -> str:
+    """
+    Create key of the cache entry.
+
+    Args:
+        - parts: Digests of source files and parameters which decide about the content of the entry
+
+    Returns:
+        - str: Hex digest of all parts
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ContentCache:
+    """
+    Directory of files indexed by keys with LRU eviction by total size in bytes. Order of usage is kept in SQLite index,
+    so the cache can be used by several threads and processes at once.
+
+    Args:
+        - directory   (str): Directory of the cache, it is created if needed
+
+        - max_bytes   (int): Maximal total size of entries
+
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                               "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(os.path.join(self.directory, INDEX_NAME), timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def entry_path(self, key: str) -> str:
+        """
+        Returns:
+            - str: Path where the entry with given key is stored
+        """
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> str:
+        """
+        Find entry and mark it as recently used.
+
+        Args:
+            - key (str): Key of the entry
+
+        Returns:
+            - str: Path of the cached file, None if there is no such entry
+        """
+        path = self.entry_path(key)
+        with self._lock, self._connect() as connection:
+            if not os.path.isfile(path):
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            updated = connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            if updated.rowcount == 0:
+                connection.execute("INSERT INTO entries VALUES (?, ?, ?)", (key, os.path.getsize(path), time.time()))
+        return path
+
+    def fetch(self, key: str, target: str) -> bool:
+        """
+        Link cached entry to target path.
+
+        Args:
+            - key     (str): Key of the entry
+
+            - target  (str): Path where the entry should appear
+
+        Returns:
+            - bool: True if the entry was found
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+        link_or_copy(path, target)
+        return True
+
+    def put(self, key: str, source: str) -> str:
+        """
+        Store copy of the file as an entry, then evict least recently used entries if the cache is too big.
+
+        Args:
+            - key     (str): Key of the entry
+
+            - source  (str): File to store
+
+        Returns:
+            - str: Path of the cached file
+        """
+        temporary_path = self._temporary_path(key)
+        link_or_copy(source, temporary_path)
+        return self._store(key, temporary_path)
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        """
+        Store given content as an entry, see put.
+
+        Args:
+            - key   (str): Key of the entry
+
+            - data (bytes): Content of the entry
+
+        Returns:
+            - str: Path of the cached file
+        """
+        temporary_path = self._temporary_path(key)
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        return self._store(key, temporary_path)
+
+    def _temporary_path(self, key: str) -> str:
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def _store(self, key: str, temporary_path: str) -> str:
+        # Entry appears atomically, readers never see partially written file
+        path = self.entry_path(key)
+        os.replace(temporary_path, path)
+        with self._lock, self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                               (key, os.path.getsize(path), time.time()))
+        self.evict()
+        return path
+
+    def size(self) -> int:
+        """
+        Returns:
+            - int: Total size of all entries in bytes
+        """
+        with self._lock, self._connect() as connection:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """
+        Remove least recently used entries until total size fits into max_bytes.
+        """
+        with self._lock, self._connect() as connection:
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.entry_path(key))
+                except FileNotFoundError:
+                    pass
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
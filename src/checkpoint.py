@@ -0,0 +1,129 @@
+"""This module stores completion markers of pipeline stages. A marker holds the fingerprint of the stage command and of
+its input files, so an interrupted reconstruction can be resumed from the first stage which is not valid anymore."""
+import hashlib
+import json
+import os
+import time
+
+CHECKPOINT_DIRECTORY = ".checkpoints"
+
+
+def path_signature(path: str) -> list:
+    """
+    Describe current state of a file or of a whole directory without reading its content.
+
+    Args:
+        - path (str): Path to file or directory
+
+    Returns:
+        - list: Sizes and modification times of the file or of all files in the directory, None if path is missing
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    if os.path.isdir(path):
+        signature = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                signature.append([os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns])
+        return signature
+    return None
+
+
+class CheckpointStore:
+    """
+    Completion markers of stages kept as JSON files in a directory, usually inside the output directory.
+
+    Args:
+        - directory (str): Directory where markers are stored
+
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def marker_path(self, stage) -> str:
+        """
+        Returns:
+            - str: Path of the marker file of given stage
+        """
+        return os.path.join(self.directory, f"{stage.name}.json")
+
+    def fingerprint(self, stage) -> str:
+        """
+        Compute hash of everything that decides about the result of the stage: its command with all options, its
+        parameters, its declared outputs and the current state of its inputs.
+
+        Args:
+            - stage (Stage): Stage to describe
+
+        Returns:
+            - str: Hex digest of the stage
+        """
+        description = {
+            "name": stage.name,
+            "command": stage.command,
+            "parameters": stage.parameters,
+            "outputs": stage.outputs,
+            "inputs": {path: path_signature(path) for path in stage.inputs},
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_valid(self, stage) -> bool:
+        """
+        Check if the stage was already finished with the same command and inputs and its outputs are untouched.
+
+        Args:
+            - stage (Stage): Stage to check
+
+        Returns:
+            - bool: True if the stage does not have to be run again
+        """
+        try:
+            with open(self.marker_path(stage), "r") as marker_file:
+                marker = json.load(marker_file)
+        except (OSError, ValueError):
+            return False
+        if marker.get("fingerprint") != self.fingerprint(stage):
+            return False
+        outputs = marker.get("outputs", {})
+        return all(outputs.get(path) is not None and outputs[path] == path_signature(path) for path in stage.outputs)
+
+    def invalidate(self, stage):
+        """
+        Remove marker of the stage, it is done before the stage is started so a crash leaves it invalid.
+
+        Args:
+            - stage (Stage): Stage which marker is removed
+
+        """
+        try:
+            os.remove(self.marker_path(stage))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, stage, fingerprint: str):
+        """
+        Write marker of successfully finished stage.
+
+        Args:
+            - stage       (Stage): Finished stage
+
+            - fingerprint   (str): Fingerprint computed before the stage was started
+
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        marker = {
+            "stage": stage.name,
+            "fingerprint": fingerprint,
+            "command": stage.command,
+            "parameters": stage.parameters,
+            "outputs": {path: path_signature(path) for path in stage.outputs},
+            "finished": time.time(),
+        }
+        temporary_path = self.marker_path(stage) + ".tmp"
+        with open(temporary_path, "w") as marker_file:
+            json.dump(marker, marker_file, indent=2, default=str)
+        os.replace(temporary_path, self.marker_path(stage))
@@ -0,0 +1,102 @@
+"""This module splits large image sets into overlapping spatial chunks which are reconstructed separately, so the
+reconstruction fits into a memory budget. Chunks are created by recursive median splits of camera GPS positions, every
+chunk is then extended by the nearest images of its neighbours to give the merge step common geometry."""
+import math
+
+import numpy as np
+
+from src.pair_selection import local_positions
+
+CHUNK_OVERLAP = 0.2
+DISTANCE_BLOCK = 1024
+
+
+def split_positions(positions: np.ndarray, indices: np.ndarray, chunk_size: int) -> list:
+    """
+    Recursively split cameras into halves along the horizontal axis with the biggest spread, until every part has at
+    most chunk_size cameras. Whole height of the building stays in one chunk.
+
+    Args:
+        - positions (np.ndarray): Array (n, 3) of camera positions in metres
+
+        - indices   (np.ndarray): Indices of cameras to split
+
+        - chunk_size       (int): Maximal number of cameras in a chunk
+
+    Returns:
+        - list: Arrays of camera indices
+    """
+    if len(indices) <= chunk_size:
+        return [indices]
+    parts = math.ceil(len(indices) / chunk_size)
+    horizontal = positions[indices, :2]
+    axis = int(np.argmax(np.ptp(horizontal, axis=0)))
+    order = indices[np.argsort(horizontal[:, axis], kind="stable")]
+    # Split proportionally, so e.g. 3 chunks are not created as 2 + 2
+    middle = len(order) * (parts // 2) // parts
+    return split_positions(positions, order[:middle], chunk_size) + \
+        split_positions(positions, order[middle:], chunk_size)
+
+
+def nearest_outside(positions: np.ndarray, members: np.ndarray, count: int) -> np.ndarray:
+    """
+    Find cameras outside of the chunk which are closest to any camera of the chunk.
+
+    Args:
+        - positions (np.ndarray): Array (n, 3) of camera positions
+
+        - members   (np.ndarray): Indices of cameras of the chunk
+
+        - count            (int): Number of cameras to find
+
+    Returns:
+        - np.ndarray: Indices of the closest outside cameras
+    """
+    outside = np.setdiff1d(np.arange(len(positions)), members)
+    if count <= 0 or len(outside) == 0:
+        return np.empty(0, dtype=np.int64)
+    distances = np.empty(len(outside))
+    for start in range(0, len(outside), DISTANCE_BLOCK):
+        block = positions[outside[start:start + DISTANCE_BLOCK]]
+        differences = block[:, None, :] - positions[members][None, :, :]
+        distances[start:start + len(block)] = np.einsum("ijk,ijk->ij", differences, differences).min(axis=1)
+    return outside[np.argsort(distances, kind="stable")[:count]]
+
+
+def plan_chunks(metadata: list, chunk_size: int, overlap: float = CHUNK_OVERLAP) -> list:
+    """
+    Split images into overlapping chunks. Images without GPS are assigned to the chunk of the previous image in
+    capture (file) order.
+
+    Args:
+        - metadata  (list): Metadata of images from read_metadata
+
+        - chunk_size (int): Maximal number of own images of a chunk
+
+        - overlap  (float): Fraction of the chunk size added from neighbouring chunks
+
+    Returns:
+        - list: Sorted lists of image indices, one list per chunk
+    """
+    count = len(metadata)
+    if count <= chunk_size:
+        return [list(range(count))]
+    located = np.array([item.get("latitude") is not None for item in metadata])
+    if not located.any():
+        raise ValueError("Chunked reconstruction needs GPS positions of images.")
+    positions = local_positions(metadata)
+    owner = np.full(count, -1)
+    chunks = split_positions(positions, np.flatnonzero(located), chunk_size)
+    for number, members in enumerate(chunks):
+        owner[members] = number
+    for index in range(count):
+        if owner[index] < 0:
+            owner[index] = owner[index - 1] if index > 0 and owner[index - 1] >= 0 else 0
+    filled = positions.copy()
+    filled[~located] = np.nanmean(positions[located], axis=0)
+    planned = []
+    for number in range(len(chunks)):
+        members = np.flatnonzero(owner == number)
+        extra = nearest_outside(filled, members, math.ceil(overlap * len(members)))
+        planned.append(sorted(np.concatenate([members, extra]).tolist()))
+    return planned
@@ -0,0 +1,85 @@
+"""This module estimates resources needed by the reconstruction. The model is calibrated on the experience described in
+default/drone_instruction.txt: 400 images processed at the default "Max resolution" need about 60GB of memory."""
+import math
+
+GIGABYTE = 1024 ** 3
+MEMORY_BASE_BYTES = 2 * GIGABYTE
+MEMORY_PER_IMAGE_BYTES = 50 * 1024 ** 2
+MEMORY_PER_PIXEL_BYTES = 200
+DISK_BASE_BYTES = GIGABYTE
+# Scaled and undistorted copies of images, features and matches
+DISK_PER_IMAGE_BYTES = 20 * 1024 ** 2
+DISK_PER_PIXEL_BYTES = 4
+# Depth, normal and confidence (20 bytes) of every pixel of a depth-map, OpenMVS halves both sides of images by default
+DEPTH_MAP_BYTES_PER_PIXEL = 5
+
+
+def scaled_pixels(width: int, height: int, max_resolution: int) -> int:
+    """
+    Args:
+        - width           (int): Width of the original image
+
+        - height          (int): Height of the original image
+
+        - max_resolution  (int): Maximal size of the longer side after scaling
+
+    Returns:
+        - int: Number of pixels of the image scaled to max resolution (images are never enlarged)
+    """
+    scale = min(1.0, max_resolution / max(width, height))
+    return int(round(width * scale) * round(height * scale))
+
+
+def estimate_peak_memory(image_count: int, pixels_per_image: float) -> int:
+    """
+    Estimate peak memory of the reconstruction, it is reached during densification and grows linearly with the
+    number of images and their resolution.
+
+    Args:
+        - image_count         (int): Number of images
+
+        - pixels_per_image  (float): Average number of pixels of a scaled image
+
+    Returns:
+        - int: Peak memory in bytes
+    """
+    return int(MEMORY_BASE_BYTES + image_count * (MEMORY_PER_IMAGE_BYTES + MEMORY_PER_PIXEL_BYTES * pixels_per_image))
+
+
+def images_per_chunk(memory_budget: int, pixels_per_image: float, overlap: float) -> int:
+    """
+    Find the number of images (including overlap) one chunk of chunked reconstruction may have to fit into the budget.
+
+    Args:
+        - memory_budget       (int): Memory available for a single chunk in bytes
+
+        - pixels_per_image  (float): Average number of pixels of a scaled image
+
+        - overlap           (float): Fraction of images shared with neighbouring chunks
+
+    Returns:
+        - int: Number of own images of one chunk, at least 1
+    """
+    per_image = MEMORY_PER_IMAGE_BYTES + MEMORY_PER_PIXEL_BYTES * pixels_per_image
+    capacity = (memory_budget - MEMORY_BASE_BYTES) / per_image
+    return max(1, math.floor(capacity / (1 + overlap)))
+
+
+def estimate_disk_usage(image_count: int, pixels_per_image: float, keep_depth_maps: bool = True) -> int:
+    """
+    Estimate disk space taken by the outputs of the reconstruction, most of it are depth-maps of densification.
+
+    Args:
+        - image_count         (int): Number of images
+
+        - pixels_per_image  (float): Average number of pixels of a scaled image
+
+        - keep_depth_maps    (bool): False if depth-maps are removed after densification
+
+    Returns:
+        - int: Disk usage in bytes
+    """
+    per_image = DISK_PER_IMAGE_BYTES + DISK_PER_PIXEL_BYTES * pixels_per_image
+    if keep_depth_maps:
+        per_image += DEPTH_MAP_BYTES_PER_PIXEL * pixels_per_image
+    return int(DISK_BASE_BYTES + image_count * per_image)
@@ -0,0 +1,180 @@
+"""This module scans the input directory before the reconstruction starts. Only headers of images are read (in a thread
+pool, images are never decoded), and the size of the dataset is turned into predicted peak memory, disk usage and
+duration, so a run which would not fit into memory or on the disk is reported before it starts."""
+import os
+import shutil
+from collections import Counter
+
+from src.cost_model import GIGABYTE, estimate_disk_usage, estimate_peak_memory
+from src.reconstruction import (DEFAULT_IMAGE_SIZE, ProcessingOptions, dataset_size, estimate_duration,
+                                plan_reconstruction_chunks, read_dataset)
+from src.resources import format_duration
+from src.run_history import HISTORY_NAME, RunHistory
+
+MIN_RESOLUTION = 320
+RESOLUTION_STEP = 64
+
+
+def system_memory() -> tuple:
+    """
+    Returns:
+        - tuple: Size of RAM and swap in bytes, swap is 0 if it can not be read
+    """
+    try:
+        with open("/proc/meminfo") as meminfo_file:
+            values = {name: int(value.split()[0]) * 1024 for name, value in
+                      (line.split(":", 1) for line in meminfo_file if ":" in line)}
+        return values["MemTotal"], values.get("SwapTotal", 0)
+    except (OSError, KeyError, ValueError):
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"), 0
+
+
+def free_disk_space(path: str) -> int:
+    """
+    Args:
+        - path (str): Directory which does not have to exist yet
+
+    Returns:
+        - int: Free bytes on the disk of the directory or of its nearest existing parent
+    """
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def scan_dataset(options: ProcessingOptions, metadata: list = None) -> dict:
+    """
+    Describe the dataset and predict resources of its reconstruction with given options.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction (max resolution, memory budget, depth-maps)
+
+        - metadata             (list): Metadata of input images from read_dataset, None means reading them
+
+    Returns:
+        - dict: Number of images, resolutions, camera models, megapixels, predicted peak memory, disk usage and
+          duration (None without history of runs), available memory and disk space, whether the peak memory fits into
+          RAM and swap and list of warnings
+    """
+    if metadata is None:
+        metadata = read_dataset(options)
+    image_count, pixels_per_image = dataset_size(metadata, options.max_resolution)
+    chunks, peak_memory = plan_reconstruction_chunks(options, metadata) if metadata else ([], 0)
+    # Images of overlapping chunks are processed more than once
+    disk_usage = estimate_disk_usage(sum(len(chunk) for chunk in chunks), pixels_per_image, not options.remove_dmaps)
+    durations = estimate_duration(options, metadata=metadata)
+    ram, swap = system_memory()
+    free_disk = free_disk_space(options.output_directory)
+    known_sizes = [item for item in metadata if item["width"] and item["height"]]
+    scan = {
+        "image_count": image_count,
+        "unknown_size": image_count - len(known_sizes),
+        "resolutions": dict(Counter(f"{item['width']}x{item['height']}" for item in known_sizes).most_common()),
+        "camera_models": dict(Counter(" ".join(filter(None, (item.get("make"), item.get("model")))) or "unknown"
+                                      for item in metadata).most_common()),
+        "megapixels": sum(item["width"] * item["height"] for item in known_sizes) / 1e6,
+        "scaled_megapixels": image_count * pixels_per_image / 1e6,
+        "chunks": len(chunks),
+        "peak_memory": peak_memory,
+        "disk_usage": disk_usage,
+        "duration": sum(durations.values()) if durations else None,
+        "ram": ram,
+        "swap": swap,
+        "free_disk": free_disk,
+        "fits_memory": peak_memory <= ram + swap,
+        "warnings": [],
+    }
+    if not image_count:
+        scan["warnings"].append("The input directory does not contain any images.")
+    if not scan["fits_memory"]:
+        scan["warnings"].append(f"Estimated peak memory {peak_memory / GIGABYTE:.1f} GB exceeds RAM and swap "
+                                f"({(ram + swap) / GIGABYTE:.1f} GB), the reconstruction will most likely fail. "
+                                f"Lower Max resolution, use fewer images or set Memory budget.")
+    elif peak_memory > ram:
+        scan["warnings"].append(f"Estimated peak memory {peak_memory / GIGABYTE:.1f} GB exceeds RAM "
+                                f"({ram / GIGABYTE:.1f} GB), the reconstruction will swap and run very slowly.")
+    if disk_usage > free_disk:
+        scan["warnings"].append(f"Outputs need about {disk_usage / GIGABYTE:.1f} GB, but only "
+                                f"{free_disk / GIGABYTE:.1f} GB are free in the output directory.")
+    return scan
+
+
+def format_scan(scan: dict) -> str:
+    """
+    Args:
+        - scan (dict): Result of scan_dataset
+
+    Returns:
+        - str: Human readable summary of the scan with warnings at the end
+    """
+    resolutions = ", ".join(f"{resolution} ({count})" for resolution, count in scan["resolutions"].items())
+    cameras = ", ".join(f"{model} ({count})" for model, count in scan["camera_models"].items())
+    duration = "unknown (no history)" if scan["duration"] is None else format_duration(scan["duration"])
+    lines = [f"Images: {scan['image_count']}" + (f", {scan['unknown_size']} of unknown size"
+                                                 if scan["unknown_size"] else ""),
+             f"Resolutions: {resolutions or '-'}",
+             f"Cameras: {cameras or '-'}",
+             f"Megapixels: {scan['megapixels']:.0f} ({scan['scaled_megapixels']:.0f} after scaling)",
+             f"Peak memory: {scan['peak_memory'] / GIGABYTE:.1f} GB"
+             + (f" per chunk, {scan['chunks']} chunks" if scan["chunks"] > 1 else "")
+             + f" (RAM {scan['ram'] / GIGABYTE:.1f} GB, swap {scan['swap'] / GIGABYTE:.1f} GB)",
+             f"Disk usage: {scan['disk_usage'] / GIGABYTE:.1f} GB ({scan['free_disk'] / GIGABYTE:.1f} GB free)",
+             f"Estimated time: {duration}"]
+    lines += [f"Warning: {warning}" for warning in scan["warnings"]]
+    return "\n".join(lines)
+
+
+def recommend_settings(options: ProcessingOptions, metadata: list, memory_budget: int = None,
+                       time_budget: float = None, min_resolution: int = MIN_RESOLUTION,
+                       max_resolution: int = None) -> dict:
+    """
+    Find the largest max resolution (in steps of RESOLUTION_STEP) whose reconstruction fits into the memory budget
+    and, if the history of runs allows to predict it, into the time budget. Depth-maps are removed after
+    densification when they would not fit on the disk of the output directory.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+        - metadata             (list): Metadata of input images from read_dataset
+
+        - memory_budget         (int): Memory in bytes, None means RAM of this machine (swap is not used)
+
+        - time_budget         (float): Duration in seconds, None means no limit
+
+        - min_resolution        (int): The lowest resolution recommended
+
+        - max_resolution        (int): The highest resolution tried, None means the longer side of the largest image
+
+    Returns:
+        - dict: Recommended max_resolution and remove_dmaps, their predicted peak memory, disk usage and duration
+          (None without history) and whether they fit into the budgets
+    """
+    if memory_budget is None:
+        memory_budget = system_memory()[0]
+    if max_resolution is None:
+        max_resolution = max((max(item["width"] or DEFAULT_IMAGE_SIZE[0], item["height"] or DEFAULT_IMAGE_SIZE[1])
+                              for item in metadata), default=min_resolution)
+    # The scan only reads the history, all resolutions are predicted from the same samples
+    history = RunHistory(os.path.join(options.cache_directory, HISTORY_NAME), read_only=True)
+    samples = history.stage_samples()
+    free_disk = free_disk_space(options.output_directory)
+    recommendation = None
+    for resolution in range(max(max_resolution, min_resolution), min_resolution - 1, -RESOLUTION_STEP):
+        image_count, pixels_per_image = dataset_size(metadata, resolution)
+        durations = history.predict(image_count, image_count * pixels_per_image / 1e6, samples=samples)
+        remove_dmaps = options.remove_dmaps or estimate_disk_usage(image_count, pixels_per_image) > free_disk
+        recommendation = {
+            "max_resolution": resolution,
+            "remove_dmaps": remove_dmaps,
+            "peak_memory": estimate_peak_memory(image_count, pixels_per_image),
+            "disk_usage": estimate_disk_usage(image_count, pixels_per_image, not remove_dmaps),
+            "duration": sum(durations.values()) if durations else None,
+        }
+        recommendation["fits"] = (recommendation["peak_memory"] <= memory_budget
+                                  and recommendation["disk_usage"] <= free_disk
+                                  and (time_budget is None or recommendation["duration"] is None
+                                       or recommendation["duration"] <= time_budget))
+        if recommendation["fits"]:
+            break
+    return recommendation
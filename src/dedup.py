@@ -0,0 +1,215 @@
+"""This module removes near-duplicate frames, e.g. series of images taken while the drone was hovering. Every image gets
+a 64-bit difference hash, near-duplicates are found with a multi-index Hamming search and only the sharpest image of
+each group of near-duplicates is kept. Facades repeat identical windows and floors, so similar hashes alone do not mean
+a duplicate: images are grouped only if they were also taken from almost the same GPS position or, without GPS, at
+almost the same time."""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.exif import read_metadata
+from src.image_utils import link_images, list_images
+from src.pair_selection import local_positions
+
+HASH_SIZE = 8
+MAX_HASH_DISTANCE = 4
+# Drift of a hovering drone in metres
+MAX_GPS_DISTANCE = 1.0
+# Gap between capture times in seconds, EXIF times have a resolution of one second
+MAX_TIME_GAP = 2.0
+REPORT_NAME = "dedup_report.json"
+
+
+def hash_image(path: str) -> tuple:
+    """
+    Compute difference hash and sharpness of the image. It is executed in worker processes, so it has to stay a module
+    function.
+
+    Args:
+        - path (str): Path to the image
+
+    Returns:
+        - tuple: Hash as int (None for unreadable image) and sharpness (variance of Laplacian)
+    """
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None, 0.0
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return value, float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        - values (np.ndarray): Array of uint64
+
+    Returns:
+        - np.ndarray: Number of set bits of every value
+    """
+    return np.unpackbits(values.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class HammingIndex:
+    """
+    Multi-index hashing of 64-bit hashes. Hashes are split into max_distance + 1 chunks, two hashes which differ in at
+    most max_distance bits have at least one identical chunk, so only hashes sharing a chunk are compared.
+
+    Args:
+        - hashes     (np.ndarray): Array of uint64 hashes
+
+        - max_distance      (int): Maximal Hamming distance of near-duplicates
+
+    """
+    def __init__(self, hashes: np.ndarray, max_distance: int = MAX_HASH_DISTANCE):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.max_distance = max_distance
+        bounds = np.linspace(0, 64, max_distance + 2).astype(int)
+        self.buckets = []
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            chunk = (self.hashes >> np.uint64(low)) & np.uint64((1 << int(high - low)) - 1)
+            order = np.argsort(chunk, kind="stable")
+            values, starts = np.unique(chunk[order], return_index=True)
+            self.buckets.extend(group for group in np.split(order, starts[1:]) if len(group) > 1)
+
+    def pairs(self) -> np.ndarray:
+        """
+        Returns:
+            - np.ndarray: Array (n, 3) of index pairs i < j with their Hamming distance not bigger than max_distance
+        """
+        candidates = [np.stack(np.triu_indices(len(group), 1)) for group in self.buckets]
+        if not candidates:
+            return np.empty((0, 3), dtype=np.int64)
+        first = np.concatenate([group[indices[0]] for group, indices in zip(self.buckets, candidates)])
+        second = np.concatenate([group[indices[1]] for group, indices in zip(self.buckets, candidates)])
+        pairs = np.unique(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1), axis=0)
+        distances = popcount(self.hashes[pairs[:, 0]] ^ self.hashes[pairs[:, 1]])
+        close = distances <= self.max_distance
+        return np.column_stack([pairs[close], distances[close].astype(np.int64)])
+
+
+def nearby_pairs(pairs: np.ndarray, metadata: list, max_gps_distance: float = MAX_GPS_DISTANCE,
+                 max_time_gap: float = MAX_TIME_GAP) -> np.ndarray:
+    """
+    Check which pairs of images were taken from almost the same place. Pairs with GPS positions of both images are
+    judged by their distance, other pairs by the gap between capture times. Pairs with neither are not near.
+
+    Args:
+        - pairs        (np.ndarray): Array (n, 2+) of indices of images
+
+        - metadata           (list): Metadata of images from read_metadata
+
+        - max_gps_distance  (float): Maximal distance of GPS positions in metres
+
+        - max_time_gap      (float): Maximal gap between capture times in seconds
+
+    Returns:
+        - np.ndarray: Boolean mask of near pairs
+    """
+    first, second = pairs[:, 0], pairs[:, 1]
+    has_gps = np.array([item.get("latitude") is not None and item.get("longitude") is not None
+                        for item in metadata], dtype=bool)
+    both_gps = has_gps[first] & has_gps[second]
+    nearby = np.zeros(len(pairs), dtype=bool)
+    if both_gps.any():
+        positions = local_positions(metadata)
+        distances = np.linalg.norm(positions[first] - positions[second], axis=1)
+        nearby |= both_gps & (distances <= max_gps_distance)
+    timestamps = np.array([np.nan if item.get("timestamp") is None else item["timestamp"] for item in metadata],
+                          dtype=float)
+    gaps = np.abs(timestamps[first] - timestamps[second])
+    nearby |= ~both_gps & (gaps <= max_time_gap)
+    return nearby
+
+
+def group_duplicates(hashes: np.ndarray, sharpness: np.ndarray, max_distance: int = MAX_HASH_DISTANCE,
+                     metadata: list = None) -> list:
+    """
+    Group near-duplicate images. The sharpest not yet grouped image starts a group and takes all its not yet grouped
+    neighbours, so groups do not chain across slowly changing series of frames.
+
+    Args:
+        - hashes    (np.ndarray): Array of uint64 hashes
+
+        - sharpness (np.ndarray): Sharpness of images
+
+        - max_distance     (int): Maximal Hamming distance of near-duplicates
+
+        - metadata        (list): Metadata of images, only images near in space or time are grouped (see nearby_pairs),
+          None means grouping by hashes only
+
+    Returns:
+        - list: Groups as lists of indices, the first index of a group is the image to keep
+    """
+    pairs = HammingIndex(hashes, max_distance).pairs()
+    if metadata is not None:
+        pairs = pairs[nearby_pairs(pairs, metadata)]
+    neighbours = [[] for _ in range(len(hashes))]
+    for first, second, _ in pairs:
+        neighbours[first].append(second)
+        neighbours[second].append(first)
+    grouped = np.zeros(len(hashes), dtype=bool)
+    groups = []
+    for index in np.argsort(-np.asarray(sharpness), kind="stable"):
+        if grouped[index]:
+            continue
+        group = [int(index)] + [int(other) for other in neighbours[index] if not grouped[other]]
+        grouped[group] = True
+        groups.append(group)
+    return groups
+
+
+def run_dedup(input_directory: str, output_directory: str, report_path: str, max_workers: int = None,
+              max_distance: int = MAX_HASH_DISTANCE) -> dict:
+    """
+    Hash all images in a process pool, link the best image of every group of near-duplicates taken from almost the
+    same place to output directory and write the report.
+
+    Args:
+        - input_directory   (str): Directory with images
+
+        - output_directory  (str): Directory which receives links to kept images
+
+        - report_path       (str): Path of the JSON report
+
+        - max_workers       (int): Number of processes, None means number of CPUs
+
+        - max_distance      (int): Maximal Hamming distance of near-duplicates
+
+    Returns:
+        - dict: The report
+    """
+    images = list_images(input_directory)
+    if images:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(hash_image, images, chunksize=max(1, len(images) // 64)))
+            metadata = list(executor.map(read_metadata, images, chunksize=max(1, len(images) // 64)))
+    else:
+        results, metadata = [], []
+    readable = [index for index, (value, _) in enumerate(results) if value is not None]
+    hashes = np.array([results[index][0] for index in readable], dtype=np.uint64)
+    sharpness = np.array([results[index][1] for index in readable])
+    groups = [[readable[index] for index in group]
+              for group in group_duplicates(hashes, sharpness, max_distance, [metadata[index] for index in readable])]
+    # Unreadable images are passed on, the pre-flight check or OpenMVG reports them
+    kept = sorted([group[0] for group in groups] +
+                  [index for index, (value, _) in enumerate(results) if value is None])
+    link_images([images[index] for index in kept], output_directory)
+    report = {
+        "images": len(images),
+        "kept": len(kept),
+        "max_distance": max_distance,
+        "max_gps_distance": MAX_GPS_DISTANCE,
+        "max_time_gap": MAX_TIME_GAP,
+        "duplicates": {os.path.basename(images[group[0]]): [os.path.basename(images[index]) for index in group[1:]]
+                       for group in groups if len(group) > 1},
+    }
+    with open(report_path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    return report
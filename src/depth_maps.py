@@ -0,0 +1,128 @@
+"""This module compresses depth-maps kept after densification. OpenMVS fuses all depth-maps at the end of
+DensifyPointCloud, so they are all on the disk until the fusion and compression does not lower the peak disk usage of
+densification, it only reduces the space the depth-maps keep after it. They are compressed one by one (every original
+is removed as soon as its compressed copy is written), so compression itself does not raise the peak. Compressed
+depth-maps are restored before densification runs again, so OpenMVS reuses them instead of estimating them anew."""
+import glob
+import gzip
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+DMAP_EXTENSION = ".dmap"
+COMPRESSED_EXTENSION = ".gz"
+COMPRESSION_LEVEL = 3
+COPY_BUFFER_SIZE = 1024 ** 2
+
+
+def remove_temporary(path: str):
+    """
+    Args:
+        - path (str): Temporary file which does not have to exist
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def compress_file(path: str) -> tuple:
+    """
+    Replace the file by its gzip copy.
+
+    Args:
+        - path (str): Path to the file
+
+    Returns:
+        - tuple: Size of the file before and after compression in bytes
+    """
+    compressed_path = path + COMPRESSED_EXTENSION
+    temporary_path = compressed_path + ".tmp"
+    try:
+        with open(path, "rb") as source, gzip.open(temporary_path, "wb", compresslevel=COMPRESSION_LEVEL) as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        os.replace(temporary_path, compressed_path)
+    finally:
+        # Partial copy left by a failed write (e.g. full disk) would only take space
+        remove_temporary(temporary_path)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size, os.path.getsize(compressed_path)
+
+
+def decompress_file(path: str) -> str:
+    """
+    Replace the gzip file by its original.
+
+    Args:
+        - path (str): Path to the compressed file
+
+    Returns:
+        - str: Path to the original file
+    """
+    original_path = path[:-len(COMPRESSED_EXTENSION)]
+    temporary_path = original_path + ".tmp"
+    try:
+        with gzip.open(path, "rb") as source, open(temporary_path, "wb") as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        os.replace(temporary_path, original_path)
+    finally:
+        remove_temporary(temporary_path)
+    os.remove(path)
+    return original_path
+
+
+def compress_depth_maps(directory: str, workers: int = None) -> tuple:
+    """
+    Compress all depth-maps of the directory in a thread pool (zlib releases the GIL).
+
+    Args:
+        - directory (str): Working directory of DensifyPointCloud
+
+        - workers   (int): Number of files compressed at the same time, None means number of CPUs
+
+    Returns:
+        - tuple: Number of depth-maps and their total size before and after compression in bytes
+    """
+    paths = sorted(glob.glob(os.path.join(glob.escape(directory), "*" + DMAP_EXTENSION)))
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        sizes = list(executor.map(compress_file, paths))
+    before = sum(size for size, _ in sizes)
+    after = sum(size for _, size in sizes)
+    if paths:
+        print(f"Compressed {len(paths)} depth-maps from {before / 1024 ** 3:.2f} GB to {after / 1024 ** 3:.2f} GB")
+    return len(paths), before, after
+
+
+def decompress_depth_maps(directory: str, workers: int = None) -> int:
+    """
+    Restore depth-maps compressed by compress_depth_maps.
+
+    Args:
+        - directory (str): Working directory of DensifyPointCloud
+
+        - workers   (int): Number of files decompressed at the same time, None means number of CPUs
+
+    Returns:
+        - int: Number of restored depth-maps
+    """
+    paths = glob.glob(os.path.join(glob.escape(directory), "*" + DMAP_EXTENSION + COMPRESSED_EXTENSION))
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        return len(list(executor.map(decompress_file, paths)))
+
+
+def restore_depth_maps(directory: str) -> bool:
+    """
+    Action of the densification stage, it restores compressed depth-maps of an earlier run, so DensifyPointCloud loads
+    them instead of estimating them again.
+
+    Args:
+        - directory (str): Working directory of DensifyPointCloud
+
+    Returns:
+        - bool: Always False, the command of the stage has to run
+    """
+    restored = decompress_depth_maps(directory)
+    if restored:
+        print(f"Restored {restored} compressed depth-maps")
+    return False
@@ -0,0 +1,136 @@
+"""This module reads image size and the EXIF tags used by the application (camera, time, GPS position) directly from
+file headers. Pixel data is never decoded, so even large datasets are scanned quickly."""
+import struct
+from datetime import datetime
+
+from src.image_utils import jpeg_segments
+
+HEADER_READ_SIZE = 256 * 1024
+
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_FOCAL_LENGTH = 0x920A
+TAG_GPS_LATITUDE_REF = 0x0001
+TAG_GPS_LATITUDE = 0x0002
+TAG_GPS_LONGITUDE_REF = 0x0003
+TAG_GPS_LONGITUDE = 0x0004
+TAG_GPS_ALTITUDE_REF = 0x0005
+TAG_GPS_ALTITUDE = 0x0006
+
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_ifd(tiff: bytes, offset: int, endian: str) -> dict:
+    """
+    Read one image file directory of TIFF structure.
+
+    Args:
+        - tiff      (bytes): TIFF data, offsets are relative to its beginning
+
+        - offset      (int): Offset of the directory
+
+        - endian      (str): "<" or ">" for struct module
+
+    Returns:
+        - dict: Values of tags, rationals are converted to floats, single values are unpacked from tuples
+    """
+    tags = {}
+    if offset + 2 > len(tiff):
+        return tags
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for index in range(count):
+        entry = offset + 2 + 12 * index
+        if entry + 12 > len(tiff):
+            break
+        tag, kind, number = struct.unpack(endian + "HHI", tiff[entry:entry + 8])
+        size = TYPE_SIZES.get(kind, 0) * number
+        if size == 0:
+            continue
+        if size <= 4:
+            data = tiff[entry + 8:entry + 8 + size]
+        else:
+            data_offset = struct.unpack(endian + "I", tiff[entry + 8:entry + 12])[0]
+            data = tiff[data_offset:data_offset + size]
+        if len(data) < size:
+            continue
+        if kind == 2:
+            value = data.split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+        elif kind in (5, 10):
+            numbers = struct.unpack(endian + ("I" if kind == 5 else "i") * (2 * number), data)
+            value = tuple(numbers[i] / numbers[i + 1] if numbers[i + 1] else 0.0 for i in range(0, len(numbers), 2))
+        else:
+            code = {1: "B", 3: "H", 4: "I", 7: "B", 9: "i"}[kind]
+            value = struct.unpack(endian + code * number, data)
+        if isinstance(value, tuple) and len(value) == 1:
+            value = value[0]
+        tags[tag] = value
+    return tags
+
+
+def parse_exif(tiff: bytes) -> dict:
+    """
+    Read tags of the main, EXIF and GPS directories.
+
+    Args:
+        - tiff (bytes): TIFF data from APP1 segment (after "Exif\\0\\0")
+
+    Returns:
+        - dict: Camera make and model, capture time, focal length and GPS coordinates if present
+    """
+    if tiff[:2] not in (b"II", b"MM"):
+        return {}
+    endian = "<" if tiff[:2] == b"II" else ">"
+    main = read_ifd(tiff, struct.unpack(endian + "I", tiff[4:8])[0], endian)
+    exif = read_ifd(tiff, main[TAG_EXIF_IFD], endian) if TAG_EXIF_IFD in main else {}
+    gps = read_ifd(tiff, main[TAG_GPS_IFD], endian) if TAG_GPS_IFD in main else {}
+    result = {
+        "make": main.get(TAG_MAKE),
+        "model": main.get(TAG_MODEL),
+        "focal_length": exif.get(TAG_FOCAL_LENGTH),
+        "timestamp": None,
+        "latitude": None,
+        "longitude": None,
+        "altitude": None,
+    }
+    try:
+        result["timestamp"] = datetime.strptime(exif[TAG_DATETIME_ORIGINAL], "%Y:%m:%d %H:%M:%S").timestamp()
+    except (KeyError, ValueError, TypeError):
+        pass
+    if isinstance(gps.get(TAG_GPS_LATITUDE), tuple) and isinstance(gps.get(TAG_GPS_LONGITUDE), tuple):
+        degrees = [value[0] + value[1] / 60 + value[2] / 3600
+                   for value in (gps[TAG_GPS_LATITUDE], gps[TAG_GPS_LONGITUDE])]
+        result["latitude"] = -degrees[0] if gps.get(TAG_GPS_LATITUDE_REF) == "S" else degrees[0]
+        result["longitude"] = -degrees[1] if gps.get(TAG_GPS_LONGITUDE_REF) == "W" else degrees[1]
+        if TAG_GPS_ALTITUDE in gps:
+            below_sea = gps.get(TAG_GPS_ALTITUDE_REF) == 1
+            result["altitude"] = -gps[TAG_GPS_ALTITUDE] if below_sea else gps[TAG_GPS_ALTITUDE]
+    return result
+
+
+def read_metadata(path: str) -> dict:
+    """
+    Read size and EXIF of JPEG image from the first HEADER_READ_SIZE bytes of the file. Size of other formats is
+    not known (None).
+
+    Args:
+        - path (str): Path to the image
+
+    Returns:
+        - dict: Path, width, height and tags from parse_exif
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER_READ_SIZE)
+    metadata = {"path": path, "width": None, "height": None}
+    for marker, start, end in jpeg_segments(header):
+        if marker == 0xE1 and header[start + 4:start + 10] == b"Exif\x00\x00" and "model" not in metadata:
+            try:
+                metadata.update(parse_exif(header[start + 10:end]))
+            except (struct.error, KeyError, IndexError):
+                pass
+        elif marker in SOF_MARKERS and end <= len(header):
+            metadata["height"], metadata["width"] = struct.unpack(">HH", header[start + 5:start + 9])
+    return metadata
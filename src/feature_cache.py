@@ -0,0 +1,103 @@
+"""This module keeps features, descriptors and putative matches computed by OpenMVG in the content cache. Changing only
+the meshing options (or reprocessing the same images in another output directory) then skips feature extraction and
+matching."""
+import os
+
+from src.cache import ContentCache, cache_key
+from src.image_utils import file_digest
+from src.sfm_data import read_views
+
+FEATURE_CACHE_BYTES = 20 * 1024 ** 3
+FEATURE_EXTENSIONS = (".feat", ".desc")
+FEATURE_CACHE_VERSION = 1
+
+
+def feature_keys(image_path: str, parameters: dict) -> dict:
+    """
+    Args:
+        - image_path  (str): Path to the image
+
+        - parameters (dict): Options of feature extraction, e.g. describer method and preset
+
+    Returns:
+        - dict: Cache keys of feature files of the image by extension
+    """
+    digest = file_digest(image_path)
+    return {extension: cache_key("features", FEATURE_CACHE_VERSION, digest, parameters, extension)
+            for extension in FEATURE_EXTENSIONS}
+
+
+def feature_paths(image_path: str, matches_directory: str) -> dict:
+    """
+    Returns:
+        - dict: Paths of feature files written by OpenMVG for the image by extension
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return {extension: os.path.join(matches_directory, stem + extension) for extension in FEATURE_EXTENSIONS}
+
+
+def restore_features(sfm_data_path: str, matches_directory: str, cache: ContentCache, parameters: dict) -> bool:
+    """
+    Action of the feature extraction stage, it links cached feature files of all views into the matches directory.
+    openMVG_main_ComputeFeatures skips views which already have both files, so only new images are processed.
+
+    Args:
+        - sfm_data_path      (str): Path to sfm_data.json with views
+
+        - matches_directory  (str): Directory where OpenMVG keeps features
+
+        - cache     (ContentCache): Cache of features
+
+        - parameters        (dict): Options of feature extraction
+
+    Returns:
+        - bool: Always False, the command of the stage has to run, it writes image_describer.json and features of
+          images which are not cached
+    """
+    restored = 0
+    for _, image_path in read_views(sfm_data_path):
+        keys = feature_keys(image_path, parameters)
+        paths = feature_paths(image_path, matches_directory)
+        cached = {extension: cache.get(keys[extension]) for extension in FEATURE_EXTENSIONS}
+        if all(cached.values()):
+            for extension in FEATURE_EXTENSIONS:
+                cache.fetch(keys[extension], paths[extension])
+            restored += 1
+        else:
+            # Stale files from other images with the same name must not be reused
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+    if restored:
+        print(f"Restored features of {restored} images from the cache")
+    return False
+
+
+def store_features(sfm_data_path: str, matches_directory: str, cache: ContentCache, parameters: dict):
+    """
+    Put feature files of all views into the cache, see restore_features.
+    """
+    for _, image_path in read_views(sfm_data_path):
+        keys = feature_keys(image_path, parameters)
+        for extension, path in feature_paths(image_path, matches_directory).items():
+            if os.path.isfile(path) and cache.get(keys[extension]) is None:
+                cache.put(keys[extension], path)
+
+
+def matches_key(sfm_data_path: str, pairs_path: str, parameters: dict) -> str:
+    """
+    Create cache key of putative matches. Matches file of OpenMVG refers to view ids, so the key contains content of
+    all images in view order together with the list of pairs and matching options.
+
+    Args:
+        - sfm_data_path  (str): Path to sfm_data.json with views
+
+        - pairs_path     (str): Path to the file with pairs to match
+
+        - parameters    (dict): Options of feature extraction and matching
+
+    Returns:
+        - str: Cache key
+    """
+    images = [file_digest(image_path) for _, image_path in read_views(sfm_data_path)]
+    return cache_key("matches", FEATURE_CACHE_VERSION, images, file_digest(pairs_path), parameters)
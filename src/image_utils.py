@@ -0,0 +1,136 @@
+"""This module contains small helpers for handling the input images: listing them, hashing their content, linking them
+into working directories and moving EXIF metadata between JPEG files."""
+import hashlib
+import os
+import shutil
+import struct
+import threading
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+HASH_CHUNK_SIZE = 1 << 20
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def list_images(directory: str) -> list:
+    """
+    Find images in given directory (not recursively).
+
+    Args:
+        - directory (str): Directory with images
+
+    Returns:
+        - list: Sorted paths of images, the same order is used by OpenMVG for numbering of views
+    """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(directory, name)))
+
+
+def file_digest(path: str) -> str:
+    """
+    Compute SHA-256 of the file content. Digests are remembered for the lifetime of the process as long as size and
+    modification time of the file do not change.
+
+    Args:
+        - path (str): Path to the file
+
+    Returns:
+        - str: Hex digest of the file
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        if key in _digests:
+            return _digests[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    with _digests_lock:
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def link_or_copy(source: str, target: str):
+    """
+    Make target a hard link of source, the file is copied if hard link can not be created (e.g. other file system).
+    Existing target is replaced.
+
+    Args:
+        - source (str): Existing file
+
+        - target (str): Path of the new file
+
+    """
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def link_images(images: list, directory: str):
+    """
+    Fill directory with links to given images, files which are not on the list are removed from it.
+
+    Args:
+        - images     (list): Paths of images
+
+        - directory   (str): Target directory
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    names = {os.path.basename(path) for path in images}
+    for name in os.listdir(directory):
+        if name not in names:
+            os.remove(os.path.join(directory, name))
+    for path in images:
+        link_or_copy(path, os.path.join(directory, os.path.basename(path)))
+
+
+def jpeg_segments(data: bytes):
+    """
+    Iterate over JPEG marker segments which precede the compressed image data.
+
+    Args:
+        - data (bytes): Content of JPEG file
+
+    Returns:
+        - generator: Tuples (marker, start, end) where start and end are offsets of the whole segment
+    """
+    if data[:2] != b"\xff\xd8":
+        return
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == 0xD9 or marker == 0xDA:  # end of image or start of scan
+            return
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        yield marker, position, position + 2 + length
+        position += 2 + length
+
+
+def copy_exif(source: bytes, target: bytes) -> bytes:
+    """
+    Put EXIF segment of the source JPEG into the target JPEG. OpenMVG needs EXIF focal length of resized images, but
+    OpenCV does not write it.
+
+    Args:
+        - source (bytes): Content of JPEG file with EXIF
+
+        - target (bytes): Content of JPEG file without EXIF
+
+    Returns:
+        - bytes: Target with EXIF segment, unchanged target if source has no EXIF
+    """
+    exif = [source[start:end] for marker, start, end in jpeg_segments(source)
+            if marker == 0xE1 and source[start + 4:start + 10] == b"Exif\x00\x00"]
+    if not exif:
+        return target
+    # JFIF header written by encoder is dropped, EXIF and JFIF headers should not be mixed
+    skipped = [(start, end) for marker, start, end in jpeg_segments(target) if marker == 0xE0]
+    body = target[skipped[-1][1]:] if skipped else target[2:]
+    return b"\xff\xd8" + exif[0] + body
@@ -0,0 +1,302 @@
+"""This module serves the batch queue to scripts and other tools. The server is an asyncio loop speaking a small subset
+of HTTP/1.1 with JSON bodies over a Unix socket or a localhost TCP port. Jobs are stored in the BatchQueue file and run
+by a BatchRunner in the background, so they are executed exactly like jobs of the batch command.
+
+Endpoints:
+    GET  /status                    - number of jobs in every status
+    GET  /jobs                      - all jobs
+    POST /jobs                      - add job, the body contains arguments of ProcessingOptions
+    GET  /jobs/<id>                 - job with progress of its running stages
+    GET  /jobs/<id>/events?since=N  - events of the job (progress and output of tools) from byte N of its event log,
+                                      the response tells N of the next request
+    POST /jobs/<id>/cancel          - cancel pending or running job
+
+Example:
+    curl --unix-socket /tmp/building_mapping_drone.sock http://localhost/jobs
+"""
+import asyncio
+import http.client
+import json
+import os
+import signal
+import socket
+import threading
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from src.batch import BatchQueue, BatchRunner
+from src.progress import (EVENT_LOG_NAME, PIPELINE_CANCELLED, PIPELINE_FAILED, PIPELINE_FINISHED, STAGE_CANCELLED,
+                          STAGE_FAILED, STAGE_FINISHED, STAGE_PROGRESS, STAGE_SKIPPED, STAGE_STARTED)
+from src.reconstruction import ProcessingOptions
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_SIZE = 1024 ** 2
+MAX_EVENTS = 1000
+REQUEST_TIMEOUT = 30
+
+
+class JobServer:
+    """
+    Local server accepting reconstruction jobs. Requests only read and change the queue, pipelines run on threads of
+    the runner, so the event loop is never blocked by a reconstruction.
+
+    Args:
+        - queue  (BatchQueue): Queue of jobs, it keeps jobs between restarts of the server
+
+        - max_workers   (int): Maximal number of jobs running at the same time, None means default number
+
+        - memory_budget (int): Memory available for all jobs in GB, None means no limit
+
+    """
+    def __init__(self, queue: BatchQueue, max_workers: int = None, memory_budget: int = None):
+        self.queue = queue
+        self.runner = BatchRunner(queue, max_workers, memory_budget, wait_for_jobs=True,
+                                  listeners=[self.track_progress])
+        self.progress = {}
+        self._lock = threading.Lock()
+
+    def track_progress(self, job: dict, event: dict):
+        """
+        Listener of pipelines of the runner, it keeps progress of running stages of every job.
+
+        Args:
+            - job   (dict): Job of the pipeline
+
+            - event (dict): Event of the pipeline
+
+        """
+        with self._lock:
+            stages = self.progress.setdefault(job["id"], {})
+            if event["event"] == STAGE_STARTED:
+                stages[event["stage"]] = 0.0
+            elif event["event"] == STAGE_PROGRESS:
+                stages[event["stage"]] = event["percent"]
+            elif event["event"] in (STAGE_FINISHED, STAGE_SKIPPED, STAGE_FAILED, STAGE_CANCELLED):
+                stages.pop(event["stage"], None)
+            elif event["event"] in (PIPELINE_FINISHED, PIPELINE_FAILED, PIPELINE_CANCELLED):
+                del self.progress[job["id"]]
+
+    def job_state(self, job: dict) -> dict:
+        """
+        Args:
+            - job (dict): Job of the queue
+
+        Returns:
+            - dict: Copy of the job with percent of its running stages
+        """
+        with self._lock:
+            return dict(job, progress=dict(self.progress.get(job["id"], {})))
+
+    def job_events(self, job: dict, since: int) -> dict:
+        """
+        Read events of the job from the given offset, so polling a long log reads only its new part.
+
+        Args:
+            - job   (dict): Job of the queue
+
+            - since  (int): Offset in the event log in bytes where the client stopped ("next" of its last response)
+
+        Returns:
+            - dict: At most MAX_EVENTS events and the offset to ask for next time
+        """
+        path = os.path.join(job["options"]["output_directory"], EVENT_LOG_NAME)
+        events = []
+        offset = since
+        try:
+            with open(path, "rb") as log_file:
+                log_file.seek(since)
+                for line in log_file:
+                    # The last line may be still written by the pipeline
+                    if not line.endswith(b"\n") or len(events) == MAX_EVENTS:
+                        break
+                    events.append(json.loads(line))
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        return {"events": events, "next": offset}
+
+    def dispatch(self, method: str, target: str, body: bytes) -> tuple:
+        """
+        Handle a single request.
+
+        Args:
+            - method (str): HTTP method
+
+            - target (str): Path of the request with query
+
+            - body (bytes): Body of the request
+
+        Returns:
+            - tuple: HTTP status and JSON serializable response
+        """
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["status"] and method == "GET":
+            return HTTPStatus.OK, self.queue.summary()
+        if parts == ["jobs"] and method == "GET":
+            return HTTPStatus.OK, [self.job_state(job) for job in list(self.queue.jobs)]
+        if parts == ["jobs"] and method == "POST":
+            try:
+                arguments = json.loads(body or b"{}")
+                for key in ("input_directory", "output_directory"):
+                    arguments[key] = os.path.abspath(arguments[key])
+                options = ProcessingOptions(**arguments)
+            except (KeyError, TypeError, ValueError) as e:
+                return HTTPStatus.BAD_REQUEST, {"error": f"Invalid job: {e!r}"}
+            job = self.queue.add(options)
+            self.runner.wake()
+            return HTTPStatus.CREATED, self.job_state(job)
+        if len(parts) in (2, 3) and parts[0] == "jobs" and parts[1].isdigit():
+            job = self.queue.find(int(parts[1]))
+            if job is None:
+                return HTTPStatus.NOT_FOUND, {"error": f"Job {parts[1]} does not exist."}
+            if len(parts) == 2 and method == "GET":
+                return HTTPStatus.OK, self.job_state(job)
+            if parts[2:] == ["events"] and method == "GET":
+                since = parse_qs(url.query).get("since", ["0"])[0]
+                if not since.isdigit():
+                    return HTTPStatus.BAD_REQUEST, {"error": "Parameter since has to be a number."}
+                return HTTPStatus.OK, self.job_events(job, int(since))
+            if parts[2:] == ["cancel"] and method == "POST":
+                if not self.runner.cancel_job(job["id"]):
+                    return HTTPStatus.CONFLICT, {"error": f"Job {job['id']} is {job['status']}."}
+                return HTTPStatus.OK, self.job_state(job)
+        return HTTPStatus.NOT_FOUND, {"error": f"Unknown request {method} {url.path}."}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Read one request from the connection, answer it and close the connection.
+
+        Args:
+            - reader (asyncio.StreamReader): Incoming data of the connection
+
+            - writer (asyncio.StreamWriter): Outgoing data of the connection
+
+        """
+        body = None
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_SIZE:
+                status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request is too large."}
+            else:
+                body = await asyncio.wait_for(reader.readexactly(length), REQUEST_TIMEOUT)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            status, response = HTTPStatus.BAD_REQUEST, {"error": "Malformed request."}
+        if body is not None:
+            try:
+                # Requests read files (e.g. event logs), so they run in a thread and do not hold up other clients
+                status, response = await asyncio.get_running_loop().run_in_executor(
+                    None, self.dispatch, method.upper(), target, body)
+            except Exception as e:
+                # The client gets an answer instead of waiting for its timeout
+                print(f"Request {method} {target} failed: {e!r}")
+                status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Request failed: {e!r}"}
+        content = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(content)}\r\nConnection: close\r\n\r\n".encode("latin-1") + content)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, socket_path: str = None, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        Run jobs and answer requests until SIGINT or SIGTERM. Running jobs are cancelled then and stay in the queue,
+        they continue from their last finished stage when the server is started again.
+
+        Args:
+            - socket_path (str): Path of the Unix socket, None means listening on TCP
+
+            - host        (str): Address of TCP server, it should stay local, the server has no authentication
+
+            - port        (int): Port of TCP server
+
+        """
+        loop = asyncio.get_running_loop()
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            os.chmod(socket_path, 0o600)
+            print(f"Serving jobs of {self.queue.path} on {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+            print(f"Serving jobs of {self.queue.path} on http://{host}:{port}")
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+        runner_thread = threading.Thread(target=self.runner.run)
+        runner_thread.start()
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            self.runner.cancel()
+            await loop.run_in_executor(None, runner_thread.join)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to a server listening on a Unix socket.
+
+    Args:
+        - socket_path (str): Path of the socket
+
+    """
+    def __init__(self, socket_path: str, timeout: float = REQUEST_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def send_request(address: str, method: str, path: str, payload=None):
+    """
+    Send request to the job server.
+
+    Args:
+        - address (str): Path of the Unix socket or "host:port" of the TCP server
+
+        - method  (str): HTTP method
+
+        - path    (str): Path of the request, e.g. "/jobs"
+
+        - payload: JSON serializable body of the request, None means no body
+
+    Returns:
+        - Decoded JSON response
+
+    Raises:
+        - RuntimeError: If the server answered with an error
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        connection = http.client.HTTPConnection(host, int(port), timeout=REQUEST_TIMEOUT)
+    else:
+        connection = UnixHTTPConnection(address)
+    try:
+        body = None if payload is None else json.dumps(payload)
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        content = json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise RuntimeError(content.get("error") if isinstance(content, dict) else response.reason)
+    return content
@@ -0,0 +1,119 @@
+"""This module describes level-of-detail pyramids of meshes. Next to the full mesh, decimated copies with fewer
+triangles are written (scene_dense_mesh_lod1.ply, scene_dense_mesh_lod2.ply, ...) together with a JSON manifest
+(scene_dense_mesh_lod.json), so the viewer and other consumers can load the smallest level which is detailed enough
+instead of a mesh of hundreds of MB. The pyramid is built by src.mesh_lib.build_lod_pyramid, this module only names the
+files and reads and writes the manifest, so it does not need Open3D."""
+import json
+import os
+
+# Target numbers of triangles of decimated levels, level 0 is always the full mesh
+LOD_TRIANGLES = (1000000, 250000, 50000)
+MANIFEST_SUFFIX = "_lod.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_path(mesh_path: str) -> str:
+    """
+    Args:
+        - mesh_path (str): Path to the full mesh
+
+    Returns:
+        - str: Path of the manifest of its pyramid
+    """
+    return os.path.splitext(mesh_path)[0] + MANIFEST_SUFFIX
+
+
+def level_path(mesh_path: str, level: int) -> str:
+    """
+    Args:
+        - mesh_path (str): Path to the full mesh
+
+        - level     (int): Level of the pyramid, 0 is the full mesh
+
+    Returns:
+        - str: Path of the mesh of the level, in the format of the full mesh
+    """
+    if level == 0:
+        return mesh_path
+    stem, extension = os.path.splitext(mesh_path)
+    return f"{stem}_lod{level}{extension}"
+
+
+def pyramid_paths(mesh_path: str, levels: int = len(LOD_TRIANGLES)) -> list:
+    """
+    Args:
+        - mesh_path (str): Path to the full mesh
+
+        - levels    (int): Number of decimated levels
+
+    Returns:
+        - list: Paths of all files of the pyramid written next to the full mesh, decimated levels and the manifest
+    """
+    return [level_path(mesh_path, level) for level in range(1, levels + 1)] + [manifest_path(mesh_path)]
+
+
+def write_manifest(mesh_path: str, levels: list) -> str:
+    """
+    Write the manifest of the pyramid. Paths of levels are stored relative to the manifest, so the directory with the
+    results can be moved.
+
+    Args:
+        - mesh_path (str): Path to the full mesh
+
+        - levels   (list): Dictionary for every level from the most detailed one with its path, number of triangles
+          and vertices
+
+    Returns:
+        - str: Path of the manifest
+    """
+    path = manifest_path(mesh_path)
+    directory = os.path.dirname(os.path.abspath(path))
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "levels": [dict(level, path=os.path.relpath(os.path.abspath(level["path"]), directory),
+                        size_bytes=os.path.getsize(level["path"])) for level in levels],
+    }
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temporary_path, path)
+    return path
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Args:
+        - path (str): Path to the manifest
+
+    Returns:
+        - dict: Manifest with absolute paths of levels
+
+    Raises:
+        - ValueError: If the manifest has unknown version or no levels
+    """
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("version") != MANIFEST_VERSION or not manifest.get("levels"):
+        raise ValueError(f"{path} is not a manifest of a mesh pyramid.")
+    directory = os.path.dirname(os.path.abspath(path))
+    for level in manifest["levels"]:
+        level["path"] = os.path.join(directory, level["path"])
+    return manifest
+
+
+def choose_level(manifest: dict, max_triangles: int) -> dict:
+    """
+    Choose the most detailed level which does not exceed the number of triangles.
+
+    Args:
+        - manifest      (dict): Result of read_manifest
+
+        - max_triangles  (int): Number of triangles the consumer can handle, None or 0 means the full mesh
+
+    Returns:
+        - dict: Chosen level, the smallest one if every level is bigger than max_triangles
+    """
+    levels = sorted(manifest["levels"], key=lambda level: level["triangles"], reverse=True)
+    if not max_triangles:
+        return levels[0]
+    return next((level for level in levels if level["triangles"] <= max_triangles), levels[-1])
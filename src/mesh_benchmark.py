@@ -0,0 +1,116 @@
+"""This module compares meshing algorithms of Open3D on one point cloud. Every algorithm runs as a separate process of
+src.mesh_cli in its own process group, so wall time, CPU time and peak memory are measured the same way as stages of
+the pipeline (including worker processes of tiled ball pivoting).
+
+Example:
+    python3 -m src.mesh_benchmark output/scene_dense.ply --target-points 2000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.resources import GroupSampler, command_resources, format_duration, wait_command
+from src.sweep import count_faces
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METHODS = {
+    "bpa": ["bpa", "--tile-points", "0"],
+    "bpa_tiled": ["bpa"],
+    "poisson": ["poisson"],
+}
+
+
+def run_method(method: str, cloud: str, output: str, downsampling: list) -> dict:
+    """
+    Mesh the cloud with one method and measure it.
+
+    Args:
+        - method        (str): Key of METHODS
+
+        - cloud         (str): Path to the point cloud
+
+        - output        (str): Path of the mesh
+
+        - downsampling (list): Downsampling arguments of src.mesh_cli
+
+    Returns:
+        - dict: Method, exit code, wall time, CPU times, peak memory, number of triangles and size of the mesh
+    """
+    command = [sys.executable, "-m", "src.mesh_cli", METHODS[method][0], cloud, output, *METHODS[method][1:],
+               *downsampling]
+    started = time.time()
+    process = subprocess.Popen(command, cwd=ROOT_DIRECTORY, start_new_session=True)
+    sampler = GroupSampler(process.pid)
+    sampler.start()
+    rusage = wait_command(process)
+    sampler.stop()
+    resources = command_resources(sampler, rusage)
+    return {
+        "method": method,
+        "returncode": process.returncode,
+        "wall_time": time.time() - started,
+        "cpu_time": resources["cpu_user"] + resources["cpu_system"],
+        "peak_rss": resources["peak_rss"],
+        "triangles": count_faces(output),
+        "size_bytes": os.path.getsize(output) if os.path.isfile(output) else None,
+    }
+
+
+def format_results(results: list) -> str:
+    """
+    Args:
+        - results (list): Results of run_method
+
+    Returns:
+        - str: Comparison of methods as a text table
+    """
+    lines = [f"{'method':<12}{'time':>12}{'CPU':>12}{'memory [GB]':>14}{'triangles':>12}"]
+    for result in results:
+        if result["returncode"] != 0:
+            lines.append(f"{result['method']:<12}  failed with exit code {result['returncode']}")
+            continue
+        lines.append(f"{result['method']:<12}{format_duration(result['wall_time']):>12}"
+                     f"{format_duration(result['cpu_time']):>12}{result['peak_rss'] / 1024 ** 3:>14.2f}"
+                     f"{result['triangles'] or 0:>12}")
+    return "\n".join(lines)
+
+
+def main(arguments: list = None) -> int:
+    """
+    Parse arguments, run chosen methods one after another and print the comparison.
+
+    Args:
+        - arguments (list): Command line arguments, None means sys.argv
+
+    Returns:
+        - int: Exit code, 0 if all methods finished
+    """
+    parser = argparse.ArgumentParser(description="Compare time, memory and triangle count of meshing algorithms.")
+    parser.add_argument("cloud", help="point cloud, e.g. scene_dense.ply from the output directory of a reconstruction")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS),
+                        help="compared methods (default: all)")
+    parser.add_argument("--voxel-size", type=float, default=0.0, help="voxel size of downsampling before meshing")
+    parser.add_argument("--target-points", type=int, default=0, help="number of points after downsampling")
+    parser.add_argument("--output-directory", help="directory where meshes are kept, default is a temporary one")
+    parser.add_argument("--report", help="path of JSON file with results")
+    args = parser.parse_args(arguments)
+
+    downsampling = ["--voxel-size", str(args.voxel_size), "--target-points", str(args.target_points)]
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.output_directory or temporary_directory
+        os.makedirs(directory, exist_ok=True)
+        results = [run_method(method, os.path.abspath(args.cloud), os.path.join(directory, f"{method}.ply"),
+                              downsampling) for method in args.methods]
+    print(format_results(results))
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump({"cloud": args.cloud, "results": results}, report_file, indent=2)
+    return 1 if any(result["returncode"] != 0 for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
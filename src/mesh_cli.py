@@ -0,0 +1,100 @@
+"""This module is the command line entry of mesh operations used as stages of the reconstruction pipeline. They are
+run as separate processes (python3 -m src.mesh_cli ...), so Open3D is never loaded into the user interface process."""
+import argparse
+import json
+
+import open3d as o3d
+
+from src.bpa_radii import format_plan
+from src.lod_pyramid import LOD_TRIANGLES
+from src.mesh_lib import (POISSON_DEPTH, POISSON_TRIM_QUANTILE, TILE_POINTS, MeshLib, bpa_radius_plan,
+                          build_lod_pyramid, convert_mesh, merge_chunks)
+
+
+def main(arguments: list = None):
+    """
+    Parse arguments and run chosen operation.
+
+    Args:
+        - arguments (list): Command line arguments, None means sys.argv
+
+    """
+    parser = argparse.ArgumentParser(description="Mesh operations of the building mapping drone pipeline.")
+    commands = parser.add_subparsers(dest="operation", required=True)
+
+    merge = commands.add_parser("merge", help="merge point clouds and meshes of reconstructed chunks")
+    merge.add_argument("--clouds", nargs="+", required=True, help="point clouds of chunks")
+    merge.add_argument("--meshes", nargs="+", required=True, help="meshes of chunks in the same order")
+    merge.add_argument("--cloud-output", required=True, help="path of the merged point cloud")
+    merge.add_argument("--mesh-output", required=True, help="path of the merged mesh")
+
+    convert = commands.add_parser("convert", help="convert mesh to format given by the output extension")
+    convert.add_argument("input", help="path to the mesh")
+    convert.add_argument("output", help="path of the converted mesh")
+
+    bpa = commands.add_parser("bpa", help="mesh point cloud with ball pivoting after voxel downsampling")
+    bpa.add_argument("cloud", help="path to the point cloud")
+    bpa.add_argument("output", help="path of the mesh")
+    bpa.add_argument("--voxel-size", type=float, default=0.0, help="voxel size of downsampling, 0 means derived "
+                                                                    "from --target-points")
+    bpa.add_argument("--target-points", type=int, default=0, help="number of points after downsampling, 0 with no "
+                                                                   "voxel size means no downsampling")
+    bpa.add_argument("--tile-points", type=int, default=TILE_POINTS,
+                     help="bigger clouds are meshed in tiles of this many points in parallel, 0 means no tiling "
+                          "(default: %(default)s)")
+    bpa.add_argument("--workers", type=int, help="number of processes meshing tiles (default: number of CPUs)")
+    bpa.add_argument("--lod", action="store_true", help="write also the level-of-detail pyramid of the mesh")
+
+    poisson = commands.add_parser("poisson", help="mesh point cloud with Poisson reconstruction after voxel "
+                                                  "downsampling")
+    poisson.add_argument("cloud", help="path to the point cloud")
+    poisson.add_argument("output", help="path of the mesh")
+    poisson.add_argument("--depth", type=int, default=POISSON_DEPTH, help="depth of the octree (default: %(default)s)")
+    poisson.add_argument("--trim-quantile", type=float, default=POISSON_TRIM_QUANTILE,
+                         help="share of vertices with the lowest density removed (default: %(default)s)")
+    poisson.add_argument("--voxel-size", type=float, default=0.0, help="voxel size of downsampling, 0 means "
+                                                                        "derived from --target-points")
+    poisson.add_argument("--target-points", type=int, default=0, help="number of points after downsampling, 0 with "
+                                                                       "no voxel size means no downsampling")
+    poisson.add_argument("--lod", action="store_true", help="write also the level-of-detail pyramid of the mesh")
+
+    lod = commands.add_parser("lod", help="write level-of-detail pyramid of the mesh with its manifest")
+    lod.add_argument("mesh", help="path to the mesh")
+    lod.add_argument("--triangles", type=int, nargs="+", default=list(LOD_TRIANGLES),
+                     help="numbers of triangles of decimated levels (default: %(default)s)")
+
+    radii = commands.add_parser("radii", help="print ball pivoting radii chosen for the point cloud and their cost")
+    radii.add_argument("cloud", help="path to the point cloud")
+    radii.add_argument("--global-only", action="store_true", help="do not add radii of regions of the cloud")
+    radii.add_argument("--json", action="store_true", help="print the plan as JSON")
+
+    args = parser.parse_args(arguments)
+    if args.operation == "merge":
+        if len(args.clouds) != len(args.meshes):
+            parser.error("number of clouds and meshes differs")
+        merge_chunks(args.clouds, args.meshes, args.cloud_output, args.mesh_output)
+    elif args.operation == "convert":
+        convert_mesh(args.input, args.output)
+    elif args.operation == "bpa":
+        mesh_lib = MeshLib(args.cloud, args.output)
+        mesh_lib.load_point_cloud()
+        mesh_lib.downsample(args.voxel_size, args.target_points)
+        mesh_lib.perform_bpa(args.tile_points, args.workers)
+        if args.lod:
+            mesh_lib.export_lod()
+    elif args.operation == "poisson":
+        mesh_lib = MeshLib(args.cloud, args.output)
+        mesh_lib.load_point_cloud()
+        mesh_lib.downsample(args.voxel_size, args.target_points)
+        mesh_lib.perform_poisson(args.depth, args.trim_quantile)
+        if args.lod:
+            mesh_lib.export_lod()
+    elif args.operation == "lod":
+        build_lod_pyramid(o3d.io.read_triangle_mesh(args.mesh), args.mesh, tuple(args.triangles))
+    elif args.operation == "radii":
+        plan = bpa_radius_plan(o3d.io.read_point_cloud(args.cloud), per_region=not args.global_only)
+        print(json.dumps(plan, indent=2) if args.json else format_plan(plan))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,29 @@
 """This is the library for displaying mesh data and point clouds. Contains also basic operation on mesh"""
+import math
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import open3d as o3d
 import sys
 
+from src.bpa_radii import KNN_NEIGHBOURS, format_plan, plan_radii
+from src.lod_pyramid import LOD_TRIANGLES, choose_level, level_path, manifest_path, read_manifest, write_manifest
+
+MAX_KNN_QUERIES = 200000
+VOXEL_SEARCH_ITERATIONS = 8
+VOXEL_SEARCH_TOLERANCE = 0.1
+TILE_POINTS = 1000000
+# Tiles are meshed with a margin of this many largest radii, so triangles at the border of their core are complete
+TILE_MARGIN_RADII = 3
+POISSON_DEPTH = 9
+# Share of vertices with the lowest density removed after Poisson reconstruction, they bridge holes of the cloud
+POISSON_TRIM_QUANTILE = 0.02
+NORMAL_ORIENTATION_NEIGHBOURS = 15
+# The viewer loads the most detailed level of the pyramid with at most this many triangles
+VIEWER_MAX_TRIANGLES = 2000000
+
 
 class MeshLib:
     """
@@ -53,47 +72,446 @@ class MeshLib:
         vis.run()
         vis.destroy_window()
 
-    def perform_bpa(self):
+    def downsample(self, voxel_size: float = None, target_points: int = None):
+        """
+        Voxel grid downsampling of the loaded point cloud, it runs before estimation of normals and meshing, whose
+        time grows quickly with the number of points.
+
+        Args:
+            - param voxel_size   (float): Size of the voxel in units of the cloud, None or 0 means it is derived from
+              target_points
+
+            - param target_points  (int): Number of points wanted after downsampling, None or 0 together with no voxel
+              size means no downsampling
+
         """
-        Ball pivoting algorithm, which convert point cloud into triangle mesh
+        count = len(self.point_cloud.points)
+        if not voxel_size:
+            if not target_points or count <= target_points:
+                return
+            voxel_size = voxel_size_for_target(self.point_cloud, target_points)
+        self.point_cloud = self.point_cloud.voxel_down_sample(voxel_size)
+        kept = len(self.point_cloud.points)
+        print(f"Voxel downsampling with voxel size {voxel_size:.4g}: kept {kept} of {count} points "
+              f"({100 * kept / max(count, 1):.1f}%)")
+
+    def perform_bpa(self, tile_points: int = None, max_workers: int = None):
+        """
+        Ball pivoting algorithm, which convert point cloud into triangle mesh. Radii are chosen from the distribution
+        of distances between neighbouring points (see src.bpa_radii). Clouds bigger than tile_points are split into
+        tiles meshed in parallel processes (see tiled_ball_pivoting).
+
+        Args:
+            - param tile_points  (int): Maximal number of points of one tile, None or 0 means no tiling
+
+            - param max_workers  (int): Number of processes meshing tiles, None means number of CPUs
+
         """
         pcd_with_normals = self.point_cloud
         if not pcd_with_normals.has_normals():
             pcd_with_normals.estimate_normals()
 
-        distances = pcd_with_normals.compute_nearest_neighbor_distance()
-        avg_dist = np.mean(distances)
-        radius = 3 * avg_dist
+        plan = bpa_radius_plan(pcd_with_normals)
+        print(format_plan(plan))
 
-        bpa_mesh = o3d.geometry.TriangleMesh.create_from_point_cloud_ball_pivoting(pcd_with_normals, o3d.utility.DoubleVector([radius, radius * 2]))
-        dec_mesh = bpa_mesh.simplify_quadric_decimation(100000)
-        dec_mesh.remove_degenerate_triangles()
-        dec_mesh.remove_duplicated_triangles()
-        dec_mesh.remove_duplicated_vertices()
-        dec_mesh.remove_non_manifold_edges()
+        if tile_points and len(pcd_with_normals.points) > tile_points:
+            bpa_mesh = tiled_ball_pivoting(pcd_with_normals, plan["radii"], tile_points, max_workers)
+        else:
+            bpa_mesh = o3d.geometry.TriangleMesh.create_from_point_cloud_ball_pivoting(
+                pcd_with_normals, o3d.utility.DoubleVector(plan["radii"]))
 
         o3d.io.write_triangle_mesh(self.output_mesh_path, bpa_mesh)
         self.mesh = bpa_mesh
 
-    def load_mesh(self):
+    def perform_poisson(self, depth: int = POISSON_DEPTH, trim_quantile: float = POISSON_TRIM_QUANTILE):
         """
-        Load file with triangle mesh
+        Screened Poisson surface reconstruction, which convert point cloud into watertight triangle mesh. Surface
+        supported by few points is trimmed and the mesh is cropped to the bounding box of the cloud, so holes of the
+        cloud are not closed by invented geometry.
+
+        Args:
+            - param depth             (int): Depth of the octree, resolution of the mesh doubles with every level
+
+            - param trim_quantile   (float): Share of vertices with the lowest density which are removed
+
         """
-        self.mesh = o3d.io.read_triangle_mesh(self.output_mesh_path)
+        pcd_with_normals = self.point_cloud
+        if not pcd_with_normals.has_normals():
+            pcd_with_normals.estimate_normals()
+            # Poisson needs normals pointing consistently outside of the surface
+            pcd_with_normals.orient_normals_consistent_tangent_plane(NORMAL_ORIENTATION_NEIGHBOURS)
+
+        poisson_mesh, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(pcd_with_normals,
+                                                                                            depth=depth)
+        trim_low_density(poisson_mesh, np.asarray(densities), trim_quantile)
+        poisson_mesh = poisson_mesh.crop(pcd_with_normals.get_axis_aligned_bounding_box())
+        print(f"Poisson reconstruction with depth {depth}: {len(poisson_mesh.triangles)} triangles")
+
+        o3d.io.write_triangle_mesh(self.output_mesh_path, poisson_mesh)
+        self.mesh = poisson_mesh
+
+    def export_lod(self, triangle_counts: tuple = LOD_TRIANGLES) -> dict:
+        """
+        Write the level-of-detail pyramid of the mesh next to the output mesh (see build_lod_pyramid).
+
+        Args:
+            - param triangle_counts (tuple): Target numbers of triangles of decimated levels
+
+        Returns:
+            - dict: Levels of the pyramid written to its manifest
+        """
+        return build_lod_pyramid(self.mesh, self.output_mesh_path, triangle_counts)
+
+    def load_mesh(self, max_triangles: int = None):
+        """
+        Load file with triangle mesh, or its level of detail if the mesh has a pyramid
+
+        Args:
+            - param max_triangles (int): Load the most detailed level with at most this many triangles, None means
+              the full mesh
+
+        """
+        self.mesh = o3d.io.read_triangle_mesh(lod_mesh_path(self.output_mesh_path, max_triangles))
+
+
+def knn_distances(points: np.ndarray, k: int = KNN_NEIGHBOURS, max_queries: int = MAX_KNN_QUERIES) -> tuple:
+    """
+    Find distances to k nearest neighbours with a single batched search of Open3D. Big clouds are represented by a
+    random sample of query points (neighbours are still searched in the whole cloud).
+
+    Args:
+        - param points (np.ndarray): Array (n, 3) of points
+
+        - param k             (int): Number of neighbours
+
+        - param max_queries   (int): Maximal number of query points
+
+    Returns:
+        - tuple: Query points (m, 3) and their sorted distances to neighbours (m, k)
+    """
+    queries = points
+    if len(points) > max_queries:
+        queries = points[np.random.default_rng(0).choice(len(points), max_queries, replace=False)]
+    search = o3d.core.nns.NearestNeighborSearch(o3d.core.Tensor(points, dtype=o3d.core.Dtype.Float64))
+    search.knn_index()
+    _, squared_distances = search.knn_search(o3d.core.Tensor(queries, dtype=o3d.core.Dtype.Float64), k + 1)
+    # The nearest neighbour of every query is the point itself
+    return queries, np.sqrt(squared_distances.numpy()[:, 1:])
+
+
+def voxel_size_for_target(point_cloud: o3d.geometry.PointCloud, target_points: int) -> float:
+    """
+    Find voxel size which leaves about target_points points. Points of building clouds lie on surfaces, so their count
+    falls with the square of the voxel size, which gives the next guess.
+
+    Args:
+        - param point_cloud (o3d.geometry.PointCloud): Cloud to downsample
+
+        - param target_points                   (int): Wanted number of points
+
+    Returns:
+        - float: Voxel size
+    """
+    diagonal = np.linalg.norm(point_cloud.get_max_bound() - point_cloud.get_min_bound())
+    voxel_size = diagonal / np.sqrt(target_points)
+    for _ in range(VOXEL_SEARCH_ITERATIONS):
+        count = len(point_cloud.voxel_down_sample(voxel_size).points)
+        if abs(count / target_points - 1) <= VOXEL_SEARCH_TOLERANCE:
+            break
+        voxel_size *= np.sqrt(max(count, 1) / target_points)
+    return float(voxel_size)
+
+
+def bpa_radius_plan(point_cloud: o3d.geometry.PointCloud, per_region: bool = True) -> dict:
+    """
+    Args:
+        - param point_cloud (o3d.geometry.PointCloud): Cloud to mesh
+
+        - param per_region                     (bool): Add radii of regions of the cloud with different density
+
+    Returns:
+        - dict: Radius schedule from src.bpa_radii.plan_radii
+    """
+    queries, distances = knn_distances(np.asarray(point_cloud.points))
+    return plan_radii(queries, distances, per_region)
+
+
+def trim_low_density(mesh: o3d.geometry.TriangleMesh, densities: np.ndarray, quantile: float) -> int:
+    """
+    Remove vertices of Poisson mesh with the lowest density of supporting points.
+
+    Args:
+        - param mesh (o3d.geometry.TriangleMesh): Mesh from Poisson reconstruction, it is changed in place
+
+        - param densities           (np.ndarray): Density of every vertex returned by the reconstruction
+
+        - param quantile                 (float): Share of vertices removed, 0 means no trimming
+
+    Returns:
+        - int: Number of removed vertices
+    """
+    if quantile <= 0 or not len(densities):
+        return 0
+    mask = densities < np.quantile(densities, quantile)
+    mesh.remove_vertices_by_mask(mask)
+    return int(mask.sum())
+
+
+def build_lod_pyramid(mesh: o3d.geometry.TriangleMesh, mesh_path: str,
+                      triangle_counts: tuple = LOD_TRIANGLES) -> dict:
+    """
+    Decimate the mesh into levels of detail with quadric error decimation. Every level is decimated from the previous
+    one instead of the full mesh, so the whole pyramid costs little more than its first level. Levels are cleaned of
+    degenerate and duplicated triangles, written next to the full mesh and described by a manifest. A file is written
+    for every target, so the pipeline knows all files of the pyramid (see src.lod_pyramid.pyramid_paths) in advance.
+
+    Args:
+        - param mesh (o3d.geometry.TriangleMesh): Full mesh, it is already written to mesh_path
+
+        - param mesh_path                  (str): Path to the full mesh
+
+        - param triangle_counts          (tuple): Target numbers of triangles of decimated levels, a level whose
+          target is not smaller than the previous level repeats it
+
+    Returns:
+        - dict: Levels of the pyramid written to its manifest
+    """
+    levels = [{"level": 0, "path": mesh_path, "triangles": len(mesh.triangles), "vertices": len(mesh.vertices)}]
+    level_mesh = mesh
+    for target in sorted(triangle_counts, reverse=True):
+        if target < len(level_mesh.triangles):
+            level_mesh = level_mesh.simplify_quadric_decimation(target)
+            level_mesh.remove_degenerate_triangles()
+            level_mesh.remove_duplicated_triangles()
+            level_mesh.remove_duplicated_vertices()
+            level_mesh.remove_non_manifold_edges()
+        path = level_path(mesh_path, len(levels))
+        o3d.io.write_triangle_mesh(path, level_mesh)
+        levels.append({"level": len(levels), "path": path, "triangles": len(level_mesh.triangles),
+                       "vertices": len(level_mesh.vertices)})
+        print(f"Level {levels[-1]['level']} of detail: {levels[-1]['triangles']} triangles")
+    write_manifest(mesh_path, levels)
+    return {"levels": levels}
+
+
+def lod_mesh_path(mesh_path: str, max_triangles: int = None) -> str:
+    """
+    Args:
+        - param mesh_path     (str): Path to the full mesh
+
+        - param max_triangles (int): Number of triangles the consumer can handle, None means the full mesh
+
+    Returns:
+        - str: Path to the most detailed level of the pyramid with at most max_triangles triangles, the full mesh if
+          it has no pyramid
+    """
+    path = manifest_path(mesh_path)
+    if not max_triangles or not os.path.isfile(path):
+        return mesh_path
+    level = choose_level(read_manifest(path), max_triangles)
+    print(f"Loading level {level['level']} of detail with {level['triangles']} triangles")
+    return level["path"]
+
+
+def split_tiles(points: np.ndarray, tile_points: int, margin: float) -> list:
+    """
+    Split the cloud into a horizontal grid of tiles with about tile_points points each. Cores of tiles cover the plane
+    without gaps (outer tiles are unbounded), every tile also gets points within margin around its core.
+
+    Args:
+        - param points (np.ndarray): Array (n, 3) of points
+
+        - param tile_points   (int): Wanted number of points of one tile core
+
+        - param margin      (float): Width of the overlap around the core
+
+    Returns:
+        - list: Tuples of core bounds (array (2, 2) of minimum and maximum of x and y) and indices of points of the
+          tile with its margin, tiles without points are left out
+    """
+    grid = max(1, math.ceil(math.sqrt(len(points) / tile_points)))
+    horizontal = points[:, :2]
+    # Quantiles put the same number of points into every column and row even if the density varies
+    edges = [np.quantile(horizontal[:, axis], np.linspace(0, 1, grid + 1)) for axis in range(2)]
+    for axis_edges in edges:
+        axis_edges[0], axis_edges[-1] = -np.inf, np.inf
+    tiles = []
+    for column in range(grid):
+        for row in range(grid):
+            bounds = np.array([[edges[0][column], edges[1][row]], [edges[0][column + 1], edges[1][row + 1]]])
+            inside = np.all((horizontal >= bounds[0] - margin) & (horizontal < bounds[1] + margin), axis=1)
+            indices = np.flatnonzero(inside)
+            if len(indices):
+                tiles.append((bounds, indices))
+    return tiles
+
+
+def mesh_tile(points: np.ndarray, normals: np.ndarray, radii: list, bounds: np.ndarray) -> tuple:
+    """
+    Mesh one tile with ball pivoting and keep only triangles whose centers lie in its core, so neighbouring tiles
+    do not duplicate triangles of their overlap. It runs in a worker process of tiled_ball_pivoting.
+
+    Args:
+        - param points  (np.ndarray): Array (n, 3) of points of the tile with margin
+
+        - param normals (np.ndarray): Array (n, 3) of normals of the points
+
+        - param radii         (list): Radii of ball pivoting
+
+        - param bounds  (np.ndarray): Core of the tile from split_tiles
+
+    Returns:
+        - tuple: Vertices (n, 3) and triangles (m, 3) of the clipped mesh
+    """
+    cloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    cloud.normals = o3d.utility.Vector3dVector(normals)
+    mesh = o3d.geometry.TriangleMesh.create_from_point_cloud_ball_pivoting(cloud, o3d.utility.DoubleVector(radii))
+    vertices = np.asarray(mesh.vertices)
+    triangles = np.asarray(mesh.triangles)
+    centers = vertices[triangles].mean(axis=1)[:, :2] if len(triangles) else np.empty((0, 2))
+    keep = np.all((centers >= bounds[0]) & (centers < bounds[1]), axis=1)
+    return vertices, triangles[keep]
+
+
+def tiled_ball_pivoting(point_cloud: o3d.geometry.PointCloud, radii: list, tile_points: int = TILE_POINTS,
+                        max_workers: int = None) -> o3d.geometry.TriangleMesh:
+    """
+    Mesh the cloud tile by tile in a process pool. Ball pivoting of Open3D runs on a single thread and its memory
+    grows with the cloud, so tiles use all CPUs and every process holds only its tile. Tiles overlap, their meshes are
+    clipped to cores and stitched by welding vertices shared along the seams (tiles are cut from the same points).
+
+    Args:
+        - param point_cloud (o3d.geometry.PointCloud): Cloud with normals
+
+        - param radii                          (list): Radii of ball pivoting
+
+        - param tile_points                     (int): Wanted number of points of one tile
+
+        - param max_workers                     (int): Number of processes, None means number of CPUs
+
+    Returns:
+        - o3d.geometry.TriangleMesh: Stitched mesh
+    """
+    points = np.asarray(point_cloud.points)
+    normals = np.asarray(point_cloud.normals)
+    tiles = split_tiles(points, tile_points, TILE_MARGIN_RADII * max(radii))
+    print(f"Meshing {len(points)} points in {len(tiles)} tiles")
+    # Open3D starts its own threads, forking the process with them could deadlock
+    with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = list(executor.map(mesh_tile, (points[indices] for _, indices in tiles),
+                                    (normals[indices] for _, indices in tiles), (radii for _ in tiles),
+                                    (bounds for bounds, _ in tiles)))
+    offsets = np.cumsum([0] + [len(vertices) for vertices, _ in results])
+    mesh = o3d.geometry.TriangleMesh(
+        o3d.utility.Vector3dVector(np.concatenate([vertices for vertices, _ in results])),
+        o3d.utility.Vector3iVector(np.concatenate([triangles + offset for (_, triangles), offset
+                                                   in zip(results, offsets)]).astype(np.int32)))
+    mesh.remove_duplicated_vertices()
+    mesh.remove_unreferenced_vertices()
+    mesh.remove_duplicated_triangles()
+    mesh.remove_degenerate_triangles()
+    return mesh
+
+
+def nearest_center_mask(points: np.ndarray, centers: np.ndarray, own: int) -> np.ndarray:
+    """
+    Check which points lie in the Voronoi cell of given center. It is used to cut overlapping chunks along the same
+    border, so neighbouring chunks do not duplicate the geometry.
+
+    Args:
+        - param points  (np.ndarray): Array (n, 3) of points
+
+        - param centers (np.ndarray): Array (k, 3) of chunk centers
+
+        - param own            (int): Index of the center of the chunk
+
+    Returns:
+        - np.ndarray: Boolean mask of points closest to the own center
+    """
+    distances = np.stack([np.einsum("ij,ij->i", points - center, points - center) for center in centers], axis=1)
+    return np.argmin(distances, axis=1) == own
+
+
+def align_to_reference(source: o3d.geometry.PointCloud, reference: o3d.geometry.PointCloud) -> np.ndarray:
+    """
+    Find rigid transformation of the source cloud onto the reference with coarse and fine ICP. Chunks are
+    reconstructed with GPS priors, so they are already aligned up to GPS error.
+
+    Args:
+        - param source    (o3d.geometry.PointCloud): Cloud to align
+
+        - param reference (o3d.geometry.PointCloud): Cloud of already merged chunks
+
+    Returns:
+        - np.ndarray: Transformation matrix 4x4
+    """
+    diagonal = np.linalg.norm(reference.get_max_bound() - reference.get_min_bound())
+    transformation = np.eye(4)
+    for voxel_size, distance in ((diagonal / 200, diagonal / 20), (diagonal / 1000, diagonal / 500)):
+        result = o3d.pipelines.registration.registration_icp(
+            source.voxel_down_sample(voxel_size), reference.voxel_down_sample(voxel_size), distance,
+            transformation, o3d.pipelines.registration.TransformationEstimationPointToPoint())
+        transformation = result.transformation
+    return transformation
+
+
+def merge_chunks(cloud_paths: list, mesh_paths: list, cloud_output: str, mesh_output: str):
+    """
+    Merge point clouds and meshes of separately reconstructed chunks. Every chunk is aligned to the chunks merged
+    before it, then all chunks are cut along Voronoi borders of their centers and joined.
+
+    Args:
+        - param cloud_paths  (list): Paths to .ply point clouds of chunks
+
+        - param mesh_paths   (list): Paths to .ply meshes of chunks in the same order
+
+        - param cloud_output  (str): Path of the merged point cloud
+
+        - param mesh_output   (str): Path of the merged mesh
+
+    """
+    clouds = [o3d.io.read_point_cloud(path) for path in cloud_paths]
+    meshes = [o3d.io.read_triangle_mesh(path) for path in mesh_paths]
+    reference = o3d.geometry.PointCloud(clouds[0])
+    for cloud, mesh in zip(clouds[1:], meshes[1:]):
+        transformation = align_to_reference(cloud, reference)
+        cloud.transform(transformation)
+        mesh.transform(transformation)
+        reference += cloud
+
+    centers = np.array([np.asarray(cloud.points).mean(axis=0) for cloud in clouds])
+    merged_cloud = o3d.geometry.PointCloud()
+    merged_mesh = o3d.geometry.TriangleMesh()
+    for own, (cloud, mesh) in enumerate(zip(clouds, meshes)):
+        merged_cloud += cloud.select_by_index(np.flatnonzero(nearest_center_mask(np.asarray(cloud.points), centers,
+                                                                                  own)))
+        triangles_centers = np.asarray(mesh.vertices)[np.asarray(mesh.triangles)].mean(axis=1)
+        mesh.remove_triangles_by_mask(~nearest_center_mask(triangles_centers, centers, own))
+        mesh.remove_unreferenced_vertices()
+        merged_mesh += mesh
+    merged_mesh.remove_duplicated_vertices()
+    merged_mesh.remove_degenerate_triangles()
+    o3d.io.write_point_cloud(cloud_output, merged_cloud)
+    o3d.io.write_triangle_mesh(mesh_output, merged_mesh)
+
+
+def convert_mesh(input_path: str, output_path: str):
+    """
+    Write mesh in format given by extension of the output path.
+
+    Args:
+        - param input_path  (str): Path to the mesh
+
+        - param output_path (str): Path of the converted mesh, e.g. with .obj extension
+
+    """
+    o3d.io.write_triangle_mesh(output_path, o3d.io.read_triangle_mesh(input_path))
 
 
 if __name__ == '__main__':
-    default_flag = bool({'True': True, 'False': False}[sys.argv[1]])
-    default_path = sys.argv[2]
-
-    default_flag = False
-    mesh_path = (
-        "default/scene_dense_mesh.ply"
-        if default_flag
-        else os.path.join(
-            default_path, "scene_dense_mesh.ply"
-        )
-    )
+    # The first argument (whether the processing is still running) is not used, the mesh of the output directory is
+    # always shown
+    mesh_path = os.path.join(sys.argv[2], "scene_dense_mesh.ply")
     visualizer = MeshLib('../out/scene_dense.ply', mesh_path)
-    visualizer.load_mesh()
+    visualizer.load_mesh(VIEWER_MAX_TRIANGLES)
     visualizer.visualize(visualizer.mesh)
@@ -0,0 +1,136 @@
+"""This module chooses which image pairs are matched. Instead of matching every image with every other one, each image
+is matched only with the cameras closest to it (by EXIF GPS position and altitude) and with images taken just before
+and after it, so the matching cost grows almost linearly with the number of images."""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.exif import read_metadata
+from src.sfm_data import read_views
+
+NEAREST_CAMERAS = 20
+TEMPORAL_NEIGHBOURS = 5
+MIN_GPS_FRACTION = 0.5
+EARTH_RADIUS = 6371000.0
+NEIGHBOUR_CHUNK = 1024
+
+
+def local_positions(metadata: list) -> np.ndarray:
+    """
+    Convert GPS coordinates to metres in a local tangent plane, which is accurate enough for a single building.
+
+    Args:
+        - metadata (list): Metadata of images from read_metadata, at least one of them with GPS
+
+    Returns:
+        - np.ndarray: Array (n, 3) of east, north and up coordinates, NaN rows for images without GPS
+    """
+    coordinates = np.array([[np.nan if item.get(key) is None else item[key]
+                             for key in ("latitude", "longitude", "altitude")] for item in metadata], dtype=float)
+    coordinates = coordinates.reshape(-1, 3)
+    has_altitude = ~np.isnan(coordinates[:, 2])
+    coordinates[~has_altitude, 2] = np.nanmean(coordinates[:, 2]) if has_altitude.any() else 0.0
+    latitude_0 = np.radians(np.nanmean(coordinates[:, 0]))
+    positions = np.empty_like(coordinates)
+    positions[:, 0] = np.radians(coordinates[:, 1] - np.nanmean(coordinates[:, 1])) * EARTH_RADIUS * \
+        math.cos(latitude_0)
+    positions[:, 1] = np.radians(coordinates[:, 0] - np.nanmean(coordinates[:, 0])) * EARTH_RADIUS
+    positions[:, 2] = coordinates[:, 2]
+    return positions
+
+
+def nearest_neighbours(points: np.ndarray, k: int) -> np.ndarray:
+    """
+    Find k nearest points of every point. Distances are computed block by block, so memory stays bounded for large
+    datasets.
+
+    Args:
+        - points (np.ndarray): Array (n, d) of coordinates
+
+        - k            (int): Number of neighbours
+
+    Returns:
+        - np.ndarray: Array (n, min(k, n - 1)) of neighbour indices
+    """
+    count = len(points)
+    k = min(k, count - 1)
+    if k <= 0:
+        return np.empty((count, 0), dtype=np.int64)
+    squared_norms = np.einsum("ij,ij->i", points, points)
+    neighbours = np.empty((count, k), dtype=np.int64)
+    for start in range(0, count, NEIGHBOUR_CHUNK):
+        block = points[start:start + NEIGHBOUR_CHUNK]
+        distances = squared_norms[start:start + len(block), None] + squared_norms[None, :] - 2 * block @ points.T
+        distances[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        neighbours[start:start + len(block)] = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return neighbours
+
+
+def select_pairs(metadata: list, nearest: int = NEAREST_CAMERAS, temporal: int = TEMPORAL_NEIGHBOURS) -> set:
+    """
+    Choose pairs of images to match. Images without GPS are matched with all other images, if most images have no
+    GPS, all pairs are returned.
+
+    Args:
+        - metadata (list): Metadata of images from read_metadata in view order
+
+        - nearest   (int): Number of spatially nearest cameras of every image
+
+        - temporal  (int): Number of images taken before and after every image
+
+    Returns:
+        - set: Pairs (i, j) of view indices with i < j
+    """
+    count = len(metadata)
+    located_count = sum(item.get("latitude") is not None for item in metadata)
+    if located_count == 0 or located_count < MIN_GPS_FRACTION * count:
+        return {(i, j) for i in range(count) for j in range(i + 1, count)}
+    positions = local_positions(metadata)
+    located = np.flatnonzero(~np.isnan(positions).any(axis=1))
+
+    pairs = set()
+    for index, neighbours in zip(located, nearest_neighbours(positions[located], nearest)):
+        pairs.update((min(index, other), max(index, other)) for other in located[neighbours].tolist())
+    # Capture order, images without timestamp keep their file order
+    times = [item.get("timestamp") for item in metadata]
+    order = sorted(range(count), key=lambda i: (times[i] is None, times[i] or 0, i))
+    for position, index in enumerate(order):
+        for other in order[position + 1:position + 1 + temporal]:
+            pairs.add((min(index, other), max(index, other)))
+    for index in sorted(set(range(count)) - set(located.tolist())):
+        pairs.update((min(index, other), max(index, other)) for other in range(count) if other != index)
+    return {(int(i), int(j)) for i, j in pairs}
+
+
+def write_pairs(sfm_data_path: str, pairs_path: str, nearest: int = NEAREST_CAMERAS,
+                temporal: int = TEMPORAL_NEIGHBOURS) -> dict:
+    """
+    Read EXIF of all views in a thread pool, choose pairs and write them in OpenMVG text format, where each line
+    contains a view id followed by ids of views it is matched with.
+
+    Args:
+        - sfm_data_path  (str): Path to sfm_data.json with views
+
+        - pairs_path     (str): Path of the pair file for openMVG_main_ComputeMatches
+
+        - nearest        (int): Number of spatially nearest cameras of every image
+
+        - temporal       (int): Number of images taken before and after every image
+
+    Returns:
+        - dict: Number of views, number of chosen pairs and number of all possible pairs
+    """
+    views = read_views(sfm_data_path)
+    with ThreadPoolExecutor() as executor:
+        metadata = list(executor.map(read_metadata, [path for _, path in views]))
+    pairs = select_pairs(metadata, nearest, temporal)
+    view_ids = [view_id for view_id, _ in views]
+    lines = {}
+    for i, j in sorted(pairs):
+        lines.setdefault(view_ids[i], []).append(view_ids[j])
+    with open(pairs_path, "w") as pairs_file:
+        for view_id, others in sorted(lines.items()):
+            pairs_file.write(" ".join(str(value) for value in [view_id, *others]) + "\n")
+    count = len(views)
+    return {"views": count, "pairs": len(pairs), "exhaustive_pairs": count * (count - 1) // 2}
@@ -0,0 +1,466 @@
+"""This module contains the engine which runs the reconstruction as a graph of stages. Every stage declares the files
+it reads and writes, dependencies between stages are derived from them and stages which do not depend on each other
+are executed concurrently."""
+import codecs
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.checkpoint import CheckpointStore
+from src.resources import GroupSampler, command_resources, wait_command
+from src.progress import (PIPELINE_CANCELLED, PIPELINE_FAILED, PIPELINE_FINISHED, PIPELINE_STARTED, STAGE_CANCELLED,
+                          STAGE_FAILED, STAGE_FINISHED, STAGE_OUTPUT, STAGE_PROGRESS, STAGE_SKIPPED, STAGE_STARTED,
+                          ProgressParser, create_event)
+
+CANCEL_TIMEOUT = 10
+OUTPUT_TAIL_LINES = 20
+OUTPUT_READ_SIZE = 4096
+LINE_ENDING = re.compile(r"\r\n|\r|\n")
+
+
+class PipelineError(Exception):
+    """
+    Raised when a stage of the pipeline fails or the graph of stages is not valid.
+
+    Args:
+        - message     (str): Description of the problem
+
+        - stage       (str): Name of the stage which caused the problem, None for errors of the whole graph
+
+        - returncode  (int): Exit code of the failed stage command, None if it is not known
+
+        - output     (list): Last lines of output of the failed stage command
+
+    """
+    def __init__(self, message: str, stage: str = None, returncode: int = None, output: list = None):
+        super().__init__(message)
+        self.stage = stage
+        self.returncode = returncode
+        self.output = list(output or [])
+
+
+class PipelineCancelled(PipelineError):
+    """
+    Raised by the pipeline which was stopped by Pipeline.cancel.
+    """
+
+
+class Stage:
+    """
+    Single node of the pipeline. A stage runs an external command, a python callable or both (callable first).
+
+    Args:
+        - name       (str): Unique name of the stage
+
+        - command   (list): Command passed to subprocess, None if the stage runs only a python callable
+
+        - inputs    (list): Paths which are read by the stage
+
+        - outputs   (list): Paths which are written by the stage
+
+        - action    (func): Python callable without arguments executed by the stage before the command, in a stage
+          with a command it has to return a bool, True skips the command (e.g. outputs were restored from a cache)
+
+        - cwd        (str): Working directory of the command
+
+        - parameters (dict): Values which influence the result but are not visible in the command, e.g. options of
+          a python callable
+
+        - finalize  (func): Python callable without arguments executed after the command succeeded
+
+        - memory     (int): Estimated peak memory of the stage in bytes, used by memory budget of the pipeline
+
+    """
+    def __init__(self, name: str, command: list = None, inputs: list = (), outputs: list = (), action=None,
+                 cwd: str = None, parameters: dict = None, finalize=None, memory: int = 0):
+        self.name = name
+        self.command = [str(part) for part in command] if command else None
+        self.inputs = [os.path.abspath(path) for path in inputs]
+        self.outputs = [os.path.abspath(path) for path in outputs]
+        self.action = action
+        self.cwd = cwd
+        self.parameters = parameters or {}
+        self.finalize = finalize
+        self.memory = memory
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+class Pipeline:
+    """
+    Directed acyclic graph of stages. Stage A depends on stage B when one of A inputs is an output of B.
+
+    Args:
+        - stages      (list): Stages of the pipeline, more can be added with add_stage
+
+        - max_workers  (int): Maximal number of stages running at the same time, None means number of CPUs
+
+        - checkpoints (CheckpointStore): Store of completion markers, None disables checkpoints
+
+        - resume      (bool): Skip stages which have valid completion markers in checkpoints
+
+        - memory_budget (int): Stages are not started together if sum of their memory estimates exceeds this number
+          of bytes, None means no limit
+
+        - listeners   (list): Callables which receive progress events (see src.progress), they are called from
+          worker threads
+
+    """
+    def __init__(self, stages: list = (), max_workers: int = None, checkpoints: CheckpointStore = None,
+                 resume: bool = False, memory_budget: int = None, listeners: list = None):
+        self.stages = {}
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.checkpoints = checkpoints
+        self.resume = resume
+        self.memory_budget = memory_budget
+        self.listeners = list(listeners or [])
+        self.completed = []
+        self.skipped = []
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = {}
+        self._kill_timers = {}
+        self._process_lock = threading.Lock()
+        for stage in stages:
+            self.add_stage(stage)
+
+    def add_stage(self, stage: Stage):
+        """
+        Add stage to the graph.
+
+        Args:
+            - stage (Stage): Stage to add, its name and outputs can not collide with already added stages
+
+        """
+        if stage.name in self.stages:
+            raise PipelineError(f"Stage {stage.name} is defined twice.", stage=stage.name)
+        for other in self.stages.values():
+            if set(other.outputs) & set(stage.outputs):
+                raise PipelineError(f"Stages {other.name} and {stage.name} write the same output.", stage=stage.name)
+        self.stages[stage.name] = stage
+
+    def emit(self, kind: str, stage: str = None, **fields):
+        """
+        Pass a progress event to all listeners. Listeners are called one at a time, so they see events in order.
+
+        Args:
+            - kind    (str): Type of the event
+
+            - stage   (str): Name of the stage, None for events of the whole pipeline
+
+            - fields: Other values of the event
+
+        """
+        event = create_event(kind, stage, **fields)
+        with self._lock:
+            for listener in self.listeners:
+                listener(event)
+
+    def dependencies(self, stage: Stage) -> set:
+        """
+        Find names of stages which have to be finished before given stage can be started.
+
+        Args:
+            - stage (Stage): Stage of this pipeline
+
+        Returns:
+            - set: Names of producer stages of the stage inputs
+        """
+        producers = {output: other.name for other in self.stages.values() for output in other.outputs}
+        return {producers[path] for path in stage.inputs if path in producers and producers[path] != stage.name}
+
+    def order(self) -> list:
+        """
+        Sort stages topologically, stages are kept in insertion order whenever it is possible.
+
+        Returns:
+            - list: Stages in order in which they can be executed one by one
+        """
+        dependencies = {name: self.dependencies(stage) for name, stage in self.stages.items()}
+        ordered, done = [], set()
+        while len(ordered) < len(self.stages):
+            ready = [name for name in self.stages if name not in done and dependencies[name] <= done]
+            if not ready:
+                cycle = sorted(set(self.stages) - done)
+                raise PipelineError(f"Stages {', '.join(cycle)} depend on each other.")
+            ordered.extend(self.stages[name] for name in ready)
+            done.update(ready)
+        return ordered
+
+    def run(self):
+        """
+        Execute all stages. Every stage is started as soon as all stages it depends on are finished, the number of
+        stages running at the same time is limited by max_workers and by memory budget (a stage which alone exceeds
+        the budget is run when nothing else is running). After the first failure no new stage is started,
+        the already running ones are allowed to finish and the error is raised. In resume mode stages with valid
+        completion markers are skipped, a stage becomes invalid as soon as any of its inputs was rewritten. After
+        cancel no new stage is started and PipelineCancelled is raised once the running stages stopped.
+        """
+        self.order()  # validate the graph before anything is started
+        dependencies = {name: self.dependencies(stage) for name, stage in self.stages.items()}
+        pending = dict(self.stages)
+        running = {}
+        done = set()
+        error = None
+        self.completed = []
+        self.skipped = []
+        self.emit(PIPELINE_STARTED, stages=list(self.stages))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while running or (pending and error is None and not self.cancelled.is_set()):
+                if error is None and not self.cancelled.is_set():
+                    deferred = set()
+                    ready = [name for name in pending if dependencies[name] <= done]
+                    while ready:
+                        for name in ready:
+                            stage = pending[name]
+                            if self.resume and self.checkpoints is not None and self.checkpoints.is_valid(stage):
+                                del pending[name]
+                                done.add(name)
+                                self.skipped.append(name)
+                                self.emit(STAGE_SKIPPED, name)
+                            elif self.fits_memory(stage, [self.stages[other] for other in running.values()]):
+                                del pending[name]
+                                running[executor.submit(self.run_stage, stage)] = name
+                            else:
+                                deferred.add(name)
+                        ready = [name for name in pending if dependencies[name] <= done and name not in deferred]
+                    if not running:
+                        break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                        continue
+                    done.add(name)
+                    with self._lock:
+                        self.completed.append(name)
+
+        if error is None and pending and self.cancelled.is_set():
+            error = PipelineCancelled("Pipeline was cancelled.")
+        if isinstance(error, PipelineCancelled):
+            self.emit(PIPELINE_CANCELLED, error.stage)
+            raise error
+        if error is not None:
+            self.emit(PIPELINE_FAILED, getattr(error, "stage", None), error=str(error))
+            if isinstance(error, PipelineError):
+                raise error
+            raise PipelineError(str(error)) from error
+        self.emit(PIPELINE_FINISHED, completed=self.completed, skipped=self.skipped)
+
+    def cancel(self):
+        """
+        Stop the pipeline, it can be called from any thread. Process groups of running commands receive SIGTERM and
+        SIGKILL after CANCEL_TIMEOUT seconds, partial outputs of the interrupted stages are removed. Python callables
+        of stages can not be interrupted, they are allowed to finish.
+        """
+        self.cancelled.set()
+        with self._process_lock:
+            for process in self._processes.values():
+                self.terminate(process)
+
+    def terminate(self, process: subprocess.Popen):
+        """
+        Send SIGTERM to the process group of the command and schedule SIGKILL.
+
+        Args:
+            - process (subprocess.Popen): Process started by run_command
+
+        """
+        send_signal(process, signal.SIGTERM)
+        if process.pid not in self._kill_timers:
+            timer = threading.Timer(CANCEL_TIMEOUT, send_signal, [process, getattr(signal, "SIGKILL", signal.SIGTERM)])
+            self._kill_timers[process.pid] = timer
+            timer.start()
+
+    def fits_memory(self, stage: Stage, running: list) -> bool:
+        """
+        Check if the stage can be started next to already running stages without exceeding memory budget.
+
+        Args:
+            - stage  (Stage): Stage to start
+
+            - running (list): Stages which are running
+
+        Returns:
+            - bool: True if the stage can be started now
+        """
+        if self.memory_budget is None or not stage.memory:
+            return True
+        used = sum(other.memory for other in running)
+        return used == 0 or used + stage.memory <= self.memory_budget
+
+    def run_stage(self, stage: Stage):
+        """
+        Execute single stage in the current thread.
+
+        Args:
+            - stage (Stage): Stage to execute
+
+        """
+        started = time.time()
+        self.emit(STAGE_STARTED, stage.name)
+        fingerprint = None
+        if self.checkpoints is not None:
+            fingerprint = self.checkpoints.fingerprint(stage)
+            self.checkpoints.invalidate(stage)
+        for path in stage.outputs:
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        resources = None
+        try:
+            skip_command = stage.action() if stage.action is not None else False
+            if self.cancelled.is_set():
+                remove_outputs(stage)
+                raise PipelineCancelled(f"Stage {stage.name} was cancelled.", stage=stage.name)
+            if stage.command is not None and not isinstance(skip_command, bool):
+                # A count or a path would decide about skipping the command only by accident
+                raise PipelineError(f"Action of stage {stage.name} returned {skip_command!r} instead of a bool.",
+                                    stage=stage.name)
+            if stage.command is not None and not skip_command:
+                resources = self.run_command(stage)
+                if stage.finalize is not None:
+                    stage.finalize()
+        except PipelineCancelled:
+            self.emit(STAGE_CANCELLED, stage.name)
+            raise
+        except PipelineError as e:
+            self.emit(STAGE_FAILED, stage.name, error=str(e), returncode=e.returncode,
+                      output=e.output)
+            raise
+        except Exception as e:
+            self.emit(STAGE_FAILED, stage.name, error=str(e), returncode=None, output=[])
+            raise PipelineError(f"Stage {stage.name} failed: {e}", stage=stage.name) from e
+        if self.checkpoints is not None:
+            self.checkpoints.complete(stage, fingerprint)
+        self.emit(STAGE_FINISHED, stage.name, duration=time.time() - started, resources=resources)
+
+    def run_command(self, stage: Stage):
+        """
+        Run external command of the stage and wait for it. Standard output and error of the command are read as they
+        are written, every line is passed to listeners and progress parsed from the output is reported. The command
+        runs in its own session, so cancel can stop it together with all its child processes, and resources used by
+        the whole session are measured.
+
+        Args:
+            - stage (Stage): Stage which command is executed
+
+        Returns:
+            - dict: Resources used by the command (see src.resources.command_resources)
+        """
+        try:
+            process = subprocess.Popen(stage.command, cwd=stage.cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       start_new_session=True)
+        except OSError as e:
+            raise PipelineError(f"Stage {stage.name} could not start {stage.command[0]}: {e}",
+                                stage=stage.name) from e
+        with self._process_lock:
+            self._processes[stage.name] = process
+            if self.cancelled.is_set():
+                self.terminate(process)
+        sampler = GroupSampler(process.pid)
+        sampler.start()
+        parser = ProgressParser()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        progress = None
+        buffer = ""
+        with process:
+            while True:
+                data = process.stdout.read1(OUTPUT_READ_SIZE)
+                buffer += decoder.decode(data, final=not data)
+                *lines, buffer = LINE_ENDING.split(buffer)
+                if not data and buffer:
+                    lines.append(buffer)
+                    buffer = ""
+                for line in lines:
+                    tail.append(line)
+                    self.emit(STAGE_OUTPUT, stage.name, line=line)
+                    progress = self.report_progress(stage, parser.feed(line), progress)
+                if buffer:
+                    progress = self.report_progress(stage, parser.feed(buffer, complete=False), progress)
+                if not data:
+                    break
+            rusage = wait_command(process)
+        sampler.stop()
+        with self._process_lock:
+            del self._processes[stage.name]
+            timer = self._kill_timers.pop(process.pid, None)
+        if timer is not None:
+            # All processes holding the output pipe have ended, so the group does not have to be killed
+            timer.cancel()
+        if self.cancelled.is_set() and process.returncode != 0:
+            remove_outputs(stage)
+            raise PipelineCancelled(f"Stage {stage.name} was cancelled.", stage=stage.name,
+                                    returncode=process.returncode, output=tail)
+        if process.returncode != 0:
+            raise PipelineError(f"Stage {stage.name} failed with exit code {process.returncode}.",
+                                stage=stage.name, returncode=process.returncode, output=tail)
+        return command_resources(sampler, rusage)
+
+    def report_progress(self, stage: Stage, percent: float, previous: float) -> float:
+        """
+        Pass progress of the stage to listeners if it changed by at least one percent.
+
+        Args:
+            - stage     (Stage): Running stage
+
+            - percent   (float): Progress parsed from the output, None if the output did not contain it
+
+            - previous  (float): Last reported progress, None if nothing was reported yet
+
+        Returns:
+            - float: Last reported progress
+        """
+        if percent is None or percent == previous or (previous is not None and abs(percent - previous) < 1 and
+                                                      percent != 100):
+            return previous
+        self.emit(STAGE_PROGRESS, stage.name, percent=percent)
+        return percent
+
+
+def send_signal(process: subprocess.Popen, number: int):
+    """
+    Send signal to the process group of the command (on POSIX systems) or to the process itself.
+
+    Args:
+        - process (subprocess.Popen): Process started in its own session
+
+        - number               (int): Signal to send
+
+    """
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, number)
+        else:
+            process.send_signal(number)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def remove_outputs(stage: Stage):
+    """
+    Remove files and directories written by the interrupted stage, so partial results are never taken for finished
+    ones.
+
+    Args:
+        - stage (Stage): Interrupted stage
+
+    """
+    for path in stage.outputs:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
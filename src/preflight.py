@@ -0,0 +1,168 @@
+"""This module checks input images before the reconstruction. Blurred, sky-only and badly exposed images are excluded,
+so the matching is not paid for frames which do not help the reconstruction. Every image gets scores and reasons of
+rejection in a JSON report."""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.image_utils import link_images, list_images
+
+ANALYSIS_SIZE = 512
+BLUR_RATIO = 0.25
+MAX_SKY_FRACTION = 0.8
+MIN_BRIGHTNESS = 30
+MAX_BRIGHTNESS = 225
+MAX_CLIPPED_FRACTION = 0.5
+REPORT_NAME = "preflight_report.json"
+# Version of scoring, it is a parameter of the pre-flight stage, so changed scoring invalidates finished stages
+PREFLIGHT_VERSION = 2
+
+
+def load_for_analysis(path: str) -> np.ndarray:
+    """
+    Read image for scoring. JPEG is decoded at reduced scale, which is several times faster than full decode.
+
+    Args:
+        - path (str): Path to the image
+
+    Returns:
+        - np.ndarray: BGR image with the longer side close to ANALYSIS_SIZE
+    """
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Image {path} can not be read.")
+    scale = ANALYSIS_SIZE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def sky_fraction(candidates: np.ndarray) -> float:
+    """
+    Measure sky in the mask of sky-like pixels. Smooth, bright and grey pixels are also plastered or painted walls, so
+    only regions connected to the top edge of the frame count as sky. A close-up of a facade whose wall reaches the
+    top edge still counts, but such frames are rejected only if the wall covers almost the whole image.
+
+    Args:
+        - candidates (np.ndarray): Boolean mask of smooth pixels with the colour of sky
+
+    Returns:
+        - float: Fraction of pixels of the image in sky-like regions touching its top edge
+    """
+    _, labels = cv2.connectedComponents(candidates.astype(np.uint8), connectivity=4)
+    top_labels = np.unique(labels[0][candidates[0]])
+    return float(np.mean(np.isin(labels, top_labels))) if len(top_labels) else 0.0
+
+
+def score_image(path: str) -> dict:
+    """
+    Compute quality scores of the image. It is executed in worker processes, so it has to stay a module function.
+
+    Args:
+        - path (str): Path to the image
+
+    Returns:
+        - dict: Sharpness (variance of Laplacian), sky fraction (see sky_fraction), mean brightness and fraction of
+          clipped pixels
+    """
+    try:
+        image = load_for_analysis(path)
+    except ValueError as e:
+        return {"path": path, "error": str(e)}
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    # Sky is smooth and either blue or bright and grey (overcast)
+    smooth = np.abs(cv2.GaussianBlur(laplacian, (5, 5), 0)) < 4
+    blue = (hue >= 90) & (hue <= 135) & (saturation > 40) & (value > 100)
+    overcast = (saturation < 30) & (value > 190)
+    return {
+        "path": path,
+        "sharpness": float(laplacian.var()),
+        "sky_fraction": sky_fraction(smooth & (blue | overcast)),
+        "brightness": float(gray.mean()),
+        "clipped_fraction": float(np.mean((gray <= 5) | (gray >= 250))),
+    }
+
+
+def rejection_reasons(score: dict, median_sharpness: float) -> list:
+    """
+    Args:
+        - score            (dict): Scores of the image from score_image
+
+        - median_sharpness (float): Median sharpness of the whole dataset, blur is judged relatively to it
+
+    Returns:
+        - list: Reasons of rejecting the image, empty list if the image is kept
+    """
+    if "error" in score:
+        return [score["error"]]
+    reasons = []
+    if score["sharpness"] < BLUR_RATIO * median_sharpness:
+        reasons.append("blurred")
+    if score["sky_fraction"] > MAX_SKY_FRACTION:
+        reasons.append("sky only")
+    if not MIN_BRIGHTNESS <= score["brightness"] <= MAX_BRIGHTNESS or \
+            score["clipped_fraction"] > MAX_CLIPPED_FRACTION:
+        reasons.append("badly exposed")
+    return reasons
+
+
+def score_images(images: list, max_workers: int = None) -> list:
+    """
+    Score images in a process pool.
+
+    Args:
+        - images       (list): Paths of images
+
+        - max_workers   (int): Number of processes, None means number of CPUs
+
+    Returns:
+        - list: Scores of images in the same order
+    """
+    if not images:
+        return []
+    chunk_size = max(1, len(images) // (4 * (max_workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(score_image, images, chunksize=chunk_size))
+
+
+def run_preflight(input_directory: str, output_directory: str, report_path: str, max_workers: int = None) -> dict:
+    """
+    Score all input images, link the accepted ones to output directory and write the report.
+
+    Args:
+        - input_directory   (str): Directory with images of the building
+
+        - output_directory  (str): Directory which receives links to accepted images
+
+        - report_path       (str): Path of the JSON report
+
+        - max_workers       (int): Number of processes, None means number of CPUs
+
+    Returns:
+        - dict: The report
+    """
+    scores = score_images(list_images(input_directory), max_workers)
+    sharpness = [score["sharpness"] for score in scores if "error" not in score]
+    median_sharpness = float(np.median(sharpness)) if sharpness else 0.0
+    for score in scores:
+        score["rejected"] = rejection_reasons(score, median_sharpness)
+    kept = [score["path"] for score in scores if not score["rejected"]]
+    link_images(kept, output_directory)
+    report = {
+        "images": len(scores),
+        "kept": len(kept),
+        "median_sharpness": median_sharpness,
+        "rejected": {os.path.basename(score["path"]): score["rejected"] for score in scores if score["rejected"]},
+        "scores": scores,
+    }
+    with open(report_path, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    return report
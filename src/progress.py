@@ -0,0 +1,115 @@
+"""This module turns the pipeline run into a stream of progress events. Events are plain dictionaries, so they can be
+passed between threads, shown in the user interface and written to a JSON-lines log. Output of OpenMVG and OpenMVS
+tools is parsed to find out how far the running stage is."""
+import json
+import os
+import re
+import threading
+import time
+
+PIPELINE_STARTED = "pipeline_started"
+PIPELINE_FINISHED = "pipeline_finished"
+PIPELINE_FAILED = "pipeline_failed"
+PIPELINE_CANCELLED = "pipeline_cancelled"
+STAGE_STARTED = "stage_started"
+STAGE_FINISHED = "stage_finished"
+STAGE_SKIPPED = "stage_skipped"
+STAGE_FAILED = "stage_failed"
+STAGE_CANCELLED = "stage_cancelled"
+STAGE_PROGRESS = "progress"
+STAGE_OUTPUT = "output"
+
+EVENT_LOG_NAME = "pipeline_events.jsonl"
+
+# OpenMVS prints e.g. "Estimated depth-maps 12 (25.00%, 1m2s, ETA 3m6s)"
+PERCENT_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+# OpenMVG prints a scale "0%   10   20 ... 100%" and then adds stars to a bar of 51 characters
+PROGRESS_BAR_HEADER = re.compile(r"^0%(\s+\d+)+%$")
+PROGRESS_BAR_LENGTH = 51
+
+
+def create_event(kind: str, stage: str = None, **fields) -> dict:
+    """
+    Args:
+        - kind    (str): Type of the event, one of the constants of this module
+
+        - stage   (str): Name of the stage, None for events of the whole pipeline
+
+        - fields: Other values of the event, e.g. percent or line
+
+    Returns:
+        - dict: The event with current time
+    """
+    return dict({"time": time.time(), "event": kind, "stage": stage}, **fields)
+
+
+class ProgressParser:
+    """
+    Finds progress of a single command in its output. It understands percentages printed by OpenMVS and progress bars
+    of OpenMVG, which are drawn with stars on a single line, so they have to be parsed before the line is complete.
+    """
+    def __init__(self):
+        self.bar_started = False
+
+    def feed(self, text: str, complete: bool = True) -> float:
+        """
+        Args:
+            - text      (str): Line of the output without line ending
+
+            - complete (bool): False if the line is not finished yet (only progress bars are parsed then)
+
+        Returns:
+            - float: Progress in percent, None if the text does not contain it
+        """
+        text = text.strip()
+        if self.bar_started and text and set(text) == {"*"}:
+            if complete:
+                self.bar_started = False
+            return min(100.0, 100.0 * len(text) / PROGRESS_BAR_LENGTH)
+        if not complete:
+            return None
+        if PROGRESS_BAR_HEADER.match(text):
+            self.bar_started = True
+            return 0.0
+        percentages = PERCENT_PATTERN.findall(text)
+        return min(100.0, float(percentages[-1])) if percentages else None
+
+
+class EventLog:
+    """
+    Listener of the pipeline which appends events to a JSON-lines file, one event per line. The file is flushed after
+    every event, so it can be followed while the pipeline is running.
+
+    Args:
+        - path (str): Path of the log file
+
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as log_file:
+                log_file.write(json.dumps(event) + "\n")
+
+
+def print_event(event: dict):
+    """
+    Listener of the pipeline which prints output of tools and stage boundaries to standard output.
+
+    Args:
+        - event (dict): Event of the pipeline
+
+    """
+    if event["event"] == STAGE_OUTPUT:
+        print(f"[{event['stage']}] {event['line']}", flush=True)
+    elif event["event"] == STAGE_STARTED:
+        print(f"Stage {event['stage']} started", flush=True)
+    elif event["event"] == STAGE_FINISHED:
+        print(f"Stage {event['stage']} finished in {event['duration']:.1f} s", flush=True)
+    elif event["event"] == STAGE_FAILED:
+        print(f"Stage {event['stage']} failed: {event['error']}", flush=True)
+    elif event["event"] == STAGE_CANCELLED:
+        print(f"Stage {event['stage']} cancelled, its partial outputs were removed", flush=True)
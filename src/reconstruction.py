@@ -0,0 +1,572 @@
+"""This module describes the OpenMVG/OpenMVS reconstruction as stages of the pipeline engine. The same options and the
+same graph are used by the user interface and by any other caller of the reconstruction."""
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from src.cache import CACHE_DIRECTORY, ContentCache
+from src.checkpoint import CHECKPOINT_DIRECTORY, CheckpointStore
+from src.chunking import CHUNK_OVERLAP, plan_chunks
+from src.cost_model import GIGABYTE, estimate_peak_memory, images_per_chunk, scaled_pixels
+from src.dedup import (HASH_SIZE, MAX_GPS_DISTANCE, MAX_HASH_DISTANCE, MAX_TIME_GAP, REPORT_NAME as DEDUP_REPORT_NAME,
+                       run_dedup)
+from src.depth_maps import compress_depth_maps, restore_depth_maps
+from src.exif import read_metadata
+from src.feature_cache import FEATURE_CACHE_BYTES, matches_key, restore_features, store_features
+from src.image_utils import link_images, list_images
+from src.lod_pyramid import manifest_path, pyramid_paths
+from src.pair_selection import NEAREST_CAMERAS, TEMPORAL_NEIGHBOURS, write_pairs
+from src.pipeline import Pipeline, Stage
+from src.preflight import (BLUR_RATIO, MAX_BRIGHTNESS, MAX_CLIPPED_FRACTION, MAX_SKY_FRACTION, MIN_BRIGHTNESS,
+                           PREFLIGHT_VERSION, REPORT_NAME as PREFLIGHT_REPORT_NAME, run_preflight)
+from src.progress import EVENT_LOG_NAME, EventLog
+from src.resize import IMAGE_CACHE_BYTES, RESIZE_VERSION, resize_images
+from src.resources import REPORT_NAME as RUN_REPORT_NAME, RunReport
+from src.run_history import HISTORY_NAME, HistoryRecorder, RunHistory
+
+SENSOR_DATABASE = os.environ.get("OPENMVG_SENSOR_DB",
+                                 "/usr/local/share/openMVG/sensor_width_camera_database.txt")
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_NAME = "building_model"
+DEFAULT_IMAGE_SIZE = (4000, 3000)
+FEATURE_METHOD = "SIFT"
+FEATURE_PRESET = "NORMAL"
+
+PREFLIGHT_DIRECTORY = "preflight_images"
+DEDUP_DIRECTORY = "unique_images"
+IMAGES_DIRECTORY = "images"
+MATCHES_DIRECTORY = "matches"
+RECONSTRUCTION_DIRECTORY = "reconstruction"
+UNDISTORTED_DIRECTORY = "undistorted_images"
+CHUNKS_DIRECTORY = "chunks"
+MESHERS = ("openmvs", "bpa", "poisson")
+POISSON_DEPTH = 9
+
+
+class ProcessingOptions:
+    """
+    Options of a single reconstruction, they correspond to the flags of the former tools/pipeline.sh script.
+
+    Args:
+        - input_directory      (str): Directory with images of the building (-i)
+
+        - output_directory     (str): Directory where the results are stored (-o)
+
+        - max_resolution       (int): Images are scaled to this resolution during densification (-m)
+
+        - estimate_roi         (int): 0 - do not estimate ROI, 1 - estimate ROI, 2 - adaptive estimation (-e)
+
+        - verbosity            (int): Verbosity of OpenMVS tools from 0 to 4 (-v)
+
+        - decimate           (float): Decimation factor in range 0 to 1 applied to the reconstructed surface (-s)
+
+        - remove_dmaps        (bool): Remove depth-maps after densification (-d)
+
+        - compress_dmaps      (bool): Compress kept depth-maps after densification, it reduces the space they keep, not
+          the peak disk usage of densification
+
+        - integrate_only_roi  (bool): Integrate only points inside the ROI while meshing (-r)
+
+        - smoothing_iterations (int): Number of iterations used to smooth the reconstructed surface (-t)
+
+        - min_point_distance   (int): Minimal distance in pixels between projections of two different 3D points (-p)
+
+        - export_ply          (bool): Export the mesh as .ply if True, as .obj otherwise (-x)
+
+        - cache_directory      (str): Directory of caches shared by all reconstructions, None means default one
+
+        - downscale_images    (bool): Scale images to max_resolution already before feature extraction, so the whole
+          reconstruction is faster, but finds fewer features and registers cameras less accurately, scaled images
+          are kept in the shared cache
+
+        - preflight           (bool): Exclude blurred, sky-only and badly exposed images before the reconstruction
+
+        - deduplicate         (bool): Keep only the sharpest image of every group of near-duplicate frames
+
+        - guided_pairs        (bool): Match only GPS-nearest and consecutive images instead of all pairs
+
+        - memory_budget        (int): Memory available for the reconstruction in GB, bigger image sets are split into
+          chunks, 0 means no budget
+
+        - mesher               (str): "openmvs" meshes with ReconstructMesh, "bpa" with ball pivoting and "poisson"
+          with Poisson reconstruction of Open3D
+
+        - voxel_size         (float): Voxel size of downsampling before meshing of Open3D, 0 means derived from
+          target_points
+
+        - target_points        (int): Number of points left by downsampling before meshing of Open3D, 0 with no voxel
+          size means no downsampling
+
+        - poisson_depth        (int): Depth of the octree of Poisson reconstruction
+
+        - lod                 (bool): Write also the level-of-detail pyramid of the mesh with its manifest
+
+    """
+    def __init__(self, input_directory: str, output_directory: str, max_resolution: int = 800, estimate_roi: int = 1,
+                 verbosity: int = 2, decimate: float = 1.0, remove_dmaps: bool = False,
+                 integrate_only_roi: bool = False, smoothing_iterations: int = 2, min_point_distance: int = 3,
+                 export_ply: bool = False, cache_directory: str = None, preflight: bool = True,
+                 deduplicate: bool = True, guided_pairs: bool = True, memory_budget: int = 0,
+                 compress_dmaps: bool = False, mesher: str = "openmvs", voxel_size: float = 0.0,
+                 target_points: int = 0, poisson_depth: int = POISSON_DEPTH, lod: bool = False,
+                 downscale_images: bool = False):
+        self.input_directory = input_directory
+        self.output_directory = output_directory
+        self.max_resolution = int(max_resolution)
+        self.estimate_roi = int(estimate_roi)
+        self.verbosity = int(verbosity)
+        self.decimate = float(decimate)
+        self.remove_dmaps = bool(remove_dmaps)
+        self.integrate_only_roi = bool(integrate_only_roi)
+        self.smoothing_iterations = int(smoothing_iterations)
+        self.min_point_distance = int(min_point_distance)
+        self.export_ply = bool(export_ply)
+        self.cache_directory = cache_directory or CACHE_DIRECTORY
+        self.preflight = bool(preflight)
+        self.deduplicate = bool(deduplicate)
+        self.guided_pairs = bool(guided_pairs)
+        self.memory_budget = int(memory_budget)
+        self.compress_dmaps = bool(compress_dmaps)
+        if mesher not in MESHERS:
+            raise ValueError(f"Unknown mesher {mesher}, choose from {', '.join(MESHERS)}.")
+        self.mesher = mesher
+        self.voxel_size = float(voxel_size)
+        self.target_points = int(target_points)
+        self.poisson_depth = int(poisson_depth)
+        self.lod = bool(lod)
+        self.downscale_images = bool(downscale_images)
+
+    @property
+    def export_type(self) -> str:
+        """
+        Returns:
+            - str: Extension of the exported mesh without the dot
+        """
+        return "ply" if self.export_ply else "obj"
+
+    @property
+    def memory_budget_bytes(self) -> int:
+        """
+        Returns:
+            - int: Memory budget in bytes, 0 means no budget
+        """
+        return self.memory_budget * GIGABYTE
+
+    def copy(self, **changes) -> "ProcessingOptions":
+        """
+        Args:
+            - changes: Options which differ in the copy
+
+        Returns:
+            - ProcessingOptions: Copy of the options
+        """
+        return ProcessingOptions(**dict(self.to_dict(), **changes))
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            - dict: All options as a plain dictionary, e.g. for saving them to JSON
+        """
+        return dict(vars(self))
+
+    def output_path(self, *parts: str) -> str:
+        """
+        Join given parts with the output directory.
+        """
+        return os.path.join(self.output_directory, *parts)
+
+
+def image_stages(options: ProcessingOptions) -> tuple:
+    """
+    Create stages which prepare images: pre-flight check, removal of near-duplicates and, with downscale_images,
+    scaling to max resolution (using the shared cache). Otherwise SfM reads the original images and only
+    densification scales them.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+    Returns:
+        - tuple: List of stages and directory with prepared images
+    """
+    source_images = options.input_directory
+    stages = []
+    if options.preflight:
+        source_images = options.output_path(PREFLIGHT_DIRECTORY)
+        preflight_report = options.output_path(PREFLIGHT_REPORT_NAME)
+        stages.append(Stage("preflight",
+                            action=partial(run_preflight, options.input_directory, source_images, preflight_report),
+                            inputs=[options.input_directory], outputs=[source_images, preflight_report],
+                            parameters={"blur_ratio": BLUR_RATIO, "max_sky_fraction": MAX_SKY_FRACTION,
+                                        "brightness": [MIN_BRIGHTNESS, MAX_BRIGHTNESS],
+                                        "max_clipped_fraction": MAX_CLIPPED_FRACTION, "version": PREFLIGHT_VERSION}))
+    if options.deduplicate:
+        checked_images = source_images
+        source_images = options.output_path(DEDUP_DIRECTORY)
+        dedup_report = options.output_path(DEDUP_REPORT_NAME)
+        stages.append(Stage("dedup",
+                            action=partial(run_dedup, checked_images, source_images, dedup_report),
+                            inputs=[checked_images], outputs=[source_images, dedup_report],
+                            parameters={"hash_size": HASH_SIZE, "max_distance": MAX_HASH_DISTANCE,
+                                        "max_gps_distance": MAX_GPS_DISTANCE, "max_time_gap": MAX_TIME_GAP}))
+    if not options.downscale_images:
+        return stages, source_images
+    images = options.output_path(IMAGES_DIRECTORY)
+    image_cache = ContentCache(os.path.join(options.cache_directory, "images"), IMAGE_CACHE_BYTES)
+    stages.append(Stage("resize",
+                        action=partial(resize_images, source_images, images, options.max_resolution, image_cache),
+                        inputs=[source_images], outputs=[images],
+                        parameters={"max_resolution": options.max_resolution, "version": RESIZE_VERSION}))
+    return stages, images
+
+
+def reconstruction_stages(options: ProcessingOptions, images: str, directory: str, prefix: str = "",
+                          memory: int = 0, pose_priors: bool = False) -> tuple:
+    """
+    Create stages from image listing up to densification. Feature extraction and pair selection (by GPS and capture time
+    unless guided_pairs is off) do not depend on each other, so they are run concurrently, the rest of the stages
+    forms a chain. Features of known images and matches of known image sets are taken from the shared cache.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+        - images                (str): Directory with prepared images
+
+        - directory             (str): Directory where results of the stages are written
+
+        - prefix                (str): Prefix of stage names, it distinguishes chunks of chunked reconstruction
+
+        - memory                (int): Estimated peak memory of the heaviest stages in bytes
+
+        - pose_priors          (bool): Use GPS positions as priors, so the result is in geographic frame
+
+    Returns:
+        - tuple: List of stages and dictionary with paths of dense scene and dense cloud
+    """
+    feature_cache = ContentCache(os.path.join(options.cache_directory, "features"), FEATURE_CACHE_BYTES)
+    extraction = {"method": FEATURE_METHOD, "preset": FEATURE_PRESET}
+    matches = os.path.join(directory, MATCHES_DIRECTORY)
+    sfm_data = os.path.join(matches, "sfm_data.json")
+    describer = os.path.join(matches, "image_describer.json")
+    pairs = os.path.join(matches, "pairs.txt")
+    putative = os.path.join(matches, "matches.putative.bin")
+    filtered = os.path.join(matches, "matches.f.bin")
+    reconstruction = os.path.join(directory, RECONSTRUCTION_DIRECTORY, "sfm_data.bin")
+    scene = os.path.join(directory, "scene.mvs")
+    paths = {
+        "dense_scene": os.path.join(directory, "scene_dense.mvs"),
+        "dense_cloud": os.path.join(directory, "scene_dense.ply"),
+    }
+    verbosity = ["-v", options.verbosity]
+    priors = ["-P"] if pose_priors else []
+
+    stages = [
+        Stage(prefix + "listing",
+              ["openMVG_main_SfMInit_ImageListing", "-i", images, "-o", matches, "-d", SENSOR_DATABASE, *priors],
+              inputs=[images], outputs=[sfm_data]),
+        Stage(prefix + "features",
+              ["openMVG_main_ComputeFeatures", "-i", sfm_data, "-o", matches,
+               "-m", FEATURE_METHOD, "-p", FEATURE_PRESET],
+              inputs=[sfm_data], outputs=[describer],
+              action=lambda: restore_features(sfm_data, matches, feature_cache, extraction),
+              finalize=lambda: store_features(sfm_data, matches, feature_cache, extraction)),
+        Stage(prefix + "pairs",
+              action=lambda: write_pairs(sfm_data, pairs),
+              inputs=[sfm_data], outputs=[pairs],
+              parameters={"nearest": NEAREST_CAMERAS, "temporal": TEMPORAL_NEIGHBOURS})
+        if options.guided_pairs else
+        Stage(prefix + "pairs",
+              ["openMVG_main_PairGenerator", "-i", sfm_data, "-o", pairs],
+              inputs=[sfm_data], outputs=[pairs]),
+        Stage(prefix + "matching",
+              ["openMVG_main_ComputeMatches", "-i", sfm_data, "-p", pairs, "-o", putative],
+              inputs=[sfm_data, describer, pairs], outputs=[putative],
+              action=lambda: feature_cache.fetch(matches_key(sfm_data, pairs, extraction), putative),
+              finalize=lambda: feature_cache.put(matches_key(sfm_data, pairs, extraction), putative)),
+        Stage(prefix + "geometric_filter",
+              ["openMVG_main_GeometricFilter", "-i", sfm_data, "-m", putative, "-g", "f", "-o", filtered],
+              inputs=[sfm_data, putative], outputs=[filtered]),
+        Stage(prefix + "sfm",
+              ["openMVG_main_SfM", "--sfm_engine", "INCREMENTAL", "--input_file", sfm_data,
+               "--match_dir", matches, "--match_file", filtered,
+               "--output_dir", os.path.dirname(reconstruction), *priors],
+              inputs=[sfm_data, filtered], outputs=[reconstruction], memory=memory),
+        Stage(prefix + "export_mvs",
+              ["openMVG_main_openMVG2openMVS", "-i", reconstruction, "-o", scene,
+               "-d", os.path.join(directory, UNDISTORTED_DIRECTORY)],
+              inputs=[reconstruction], outputs=[scene]),
+        # Images scaled by downscale_images are already small enough, then --max-resolution changes nothing
+        Stage(prefix + "densification",
+              ["DensifyPointCloud", scene, "-w", directory, "-o", paths["dense_scene"],
+               "--max-resolution", options.max_resolution, "--estimate-roi", options.estimate_roi,
+               "--remove-dmaps", int(options.remove_dmaps), *verbosity],
+              inputs=[scene], outputs=[paths["dense_scene"], paths["dense_cloud"]], memory=memory,
+              action=partial(restore_depth_maps, directory),
+              finalize=partial(compress_depth_maps, directory)
+              if options.compress_dmaps and not options.remove_dmaps else None),
+    ]
+    return stages, paths
+
+
+def meshing_stages(options: ProcessingOptions, dense_scene: str, working_directory: str, directory: str,
+                   prefix: str = "", memory: int = 0, refine: bool = True) -> tuple:
+    """
+    Create stages which mesh the dense point cloud and optionally refine and export the mesh.
+
+    Args:
+        - options    (ProcessingOptions): Options of the reconstruction, only meshing options are used
+
+        - dense_scene              (str): Path to the dense scene from densification
+
+        - working_directory        (str): Working directory of OpenMVS tools, the one used by densification
+
+        - directory                (str): Directory where results of the stages are written
+
+        - prefix                   (str): Prefix of stage names, it distinguishes chunks and variants
+
+        - memory                   (int): Estimated peak memory of meshing in bytes
+
+        - refine                  (bool): Add refinement and export of the model
+
+    Returns:
+        - tuple: List of stages and dictionary with paths of mesh scene (OpenMVS mesher only), mesh, manifest of its
+          level-of-detail pyramid (if options.lod) and model (if refined)
+    """
+    paths = {
+        "mesh_scene": os.path.join(directory, "scene_dense_mesh.mvs"),
+        "mesh": os.path.join(directory, "scene_dense_mesh.ply"),
+    }
+    verbosity = ["-v", options.verbosity]
+    if options.mesher in ("bpa", "poisson"):
+        # Open3D meshes the dense cloud written next to the dense scene, RefineMesh takes the mesh as a file
+        dense_cloud = os.path.splitext(dense_scene)[0] + ".ply"
+        mesher_options = ["--depth", options.poisson_depth] if options.mesher == "poisson" else []
+        outputs = [paths["mesh"]]
+        if options.lod:
+            # The pyramid is decimated from the mesh still in memory of the meshing process
+            paths["lod_manifest"] = manifest_path(paths["mesh"])
+            mesher_options.append("--lod")
+            outputs += pyramid_paths(paths["mesh"])
+        stages = [
+            Stage(prefix + "meshing",
+                  [sys.executable, "-m", "src.mesh_cli", options.mesher, dense_cloud, paths["mesh"],
+                   "--voxel-size", options.voxel_size, "--target-points", options.target_points, *mesher_options],
+                  inputs=[dense_cloud], outputs=outputs, cwd=ROOT_DIRECTORY, memory=memory),
+        ]
+        refine_input = [dense_scene, "--mesh-file", paths["mesh"]]
+        refine_dependencies = [dense_scene, paths["mesh"]]
+    else:
+        stages = [
+            Stage(prefix + "meshing",
+                  ["ReconstructMesh", dense_scene, "-w", working_directory, "-o", paths["mesh_scene"],
+                   "--decimate", options.decimate, "--integrate-only-roi", int(options.integrate_only_roi),
+                   "--smooth", options.smoothing_iterations, "--min-point-distance", options.min_point_distance,
+                   *verbosity],
+                  inputs=[dense_scene], outputs=[paths["mesh_scene"], paths["mesh"]], memory=memory),
+        ]
+        refine_input = [paths["mesh_scene"]]
+        refine_dependencies = [paths["mesh_scene"], paths["mesh"]]
+        if options.lod:
+            paths["lod_manifest"] = manifest_path(paths["mesh"])
+            stages.append(lod_stage(paths["mesh"], prefix))
+    if refine:
+        refined_scene = os.path.join(directory, "scene_dense_mesh_refine.mvs")
+        refined_mesh = os.path.join(directory, f"scene_dense_mesh_refine.{options.export_type}")
+        paths["model"] = os.path.join(directory, f"{MODEL_NAME}.{options.export_type}")
+        stages += [
+            Stage(prefix + "refinement",
+                  ["RefineMesh", *refine_input, "-w", working_directory, "-o", refined_scene,
+                   "--export-type", options.export_type, *verbosity],
+                  inputs=refine_dependencies, outputs=[refined_scene, refined_mesh]),
+            Stage(prefix + "export",
+                  action=partial(shutil.copyfile, refined_mesh, paths["model"]),
+                  inputs=[refined_mesh], outputs=[paths["model"]]),
+        ]
+    return stages, paths
+
+
+def read_dataset(options: ProcessingOptions) -> list:
+    """
+    Read sizes and EXIF of input images from their file headers in a thread pool.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+    Returns:
+        - list: Metadata of input images from read_metadata
+    """
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(read_metadata, list_images(options.input_directory)))
+
+
+def dataset_size(metadata: list, max_resolution: int) -> tuple:
+    """
+    Args:
+        - metadata      (list): Metadata of images from read_metadata
+
+        - max_resolution (int): Maximal size of the longer side after scaling
+
+    Returns:
+        - tuple: Number of images and average number of pixels of an image scaled to max resolution
+    """
+    pixels = [scaled_pixels(item["width"] or DEFAULT_IMAGE_SIZE[0], item["height"] or DEFAULT_IMAGE_SIZE[1],
+                            max_resolution) for item in metadata]
+    return len(pixels), sum(pixels) / len(pixels) if pixels else 0
+
+
+def plan_reconstruction_chunks(options: ProcessingOptions, metadata: list) -> tuple:
+    """
+    Check if the reconstruction fits into the memory budget and split images into chunks if it does not.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+        - metadata             (list): Metadata of input images from read_dataset
+
+    Returns:
+        - tuple: List of chunks (lists of image names, a single chunk if no split is needed) and estimated peak memory
+          of one chunk in bytes
+    """
+    names = [os.path.basename(item["path"]) for item in metadata]
+    image_count, pixels_per_image = dataset_size(metadata, options.max_resolution)
+    peak_memory = estimate_peak_memory(image_count, pixels_per_image)
+    if not options.memory_budget or peak_memory <= options.memory_budget_bytes:
+        return [names], peak_memory
+    chunk_size = images_per_chunk(options.memory_budget_bytes, pixels_per_image, CHUNK_OVERLAP)
+    try:
+        chunks = plan_chunks(metadata, chunk_size, CHUNK_OVERLAP)
+    except ValueError as e:
+        print(f"{e} Images are reconstructed at once over the memory budget.")
+        return [names], peak_memory
+    chunk_memory = estimate_peak_memory(max(len(chunk) for chunk in chunks), pixels_per_image)
+    return [[names[index] for index in chunk] for chunk in chunks], chunk_memory
+
+
+def estimate_duration(options: ProcessingOptions, stages: list = None, metadata: list = None) -> dict:
+    """
+    Predict duration of the reconstruction from the history of runs on this machine.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+        - stages               (list): Names of stages of the pipeline, None means all stages known from history
+
+        - metadata             (list): Metadata of input images from read_dataset, None means reading them
+
+    Returns:
+        - dict: Stage name -> seconds, empty if there is no history yet
+    """
+    if metadata is None:
+        metadata = read_dataset(options)
+    image_count, pixels_per_image = dataset_size(metadata, options.max_resolution)
+    history = RunHistory(os.path.join(options.cache_directory, HISTORY_NAME), read_only=True)
+    return history.predict(image_count, image_count * pixels_per_image / 1e6, stages)
+
+
+def build_pipeline(options: ProcessingOptions, resume: bool = False) -> Pipeline:
+    """
+    Create the pipeline which reconstructs the building from images given by options. Useless images are excluded by
+    the pre-flight check and near-duplicate frames are dropped, the rest is scaled to max resolution if
+    downscale_images is set. Then the images are reconstructed, meshed, refined and exported. If the reconstruction
+    does not fit into the memory budget, images are split into overlapping spatial chunks which are reconstructed
+    separately (with GPS priors) and merged. Completion markers of stages, the log of progress events and the report
+    of used resources are kept in the output directory, durations of stages of finished runs are added to the
+    history shared by all runs.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction
+
+        - resume               (bool): Skip stages already finished with the same inputs and options
+
+    Returns:
+        - Pipeline: Pipeline ready to be run
+    """
+    stages, images = image_stages(options)
+    metadata = read_dataset(options)
+    chunks, memory = plan_reconstruction_chunks(options, metadata)
+    if len(chunks) == 1:
+        chain, paths = reconstruction_stages(options, images, options.output_directory, memory=memory)
+        stages += chain
+        stages += meshing_stages(options, paths["dense_scene"], options.output_directory, options.output_directory,
+                                 memory=memory)[0]
+    else:
+        clouds, meshes = [], []
+        for number, chunk in enumerate(chunks):
+            prefix = f"chunk_{number:02d}_"
+            directory = options.output_path(CHUNKS_DIRECTORY, f"chunk_{number:02d}")
+            chunk_images = os.path.join(directory, IMAGES_DIRECTORY)
+            stages.append(Stage(prefix + "split",
+                                action=partial(link_chunk_images, images, chunk_images, chunk),
+                                inputs=[images], outputs=[chunk_images], parameters={"images": chunk}))
+            chain, paths = reconstruction_stages(options, chunk_images, directory, prefix, memory, pose_priors=True)
+            stages += chain
+            # Only the merged mesh gets the level-of-detail pyramid
+            meshing, mesh_paths = meshing_stages(options.copy(lod=False), paths["dense_scene"], directory, directory,
+                                                 prefix, memory, refine=False)
+            stages += meshing
+            clouds.append(paths["dense_cloud"])
+            meshes.append(mesh_paths["mesh"])
+        dense_cloud = options.output_path("scene_dense.ply")
+        mesh = options.output_path("scene_dense_mesh.ply")
+        model = options.output_path(f"{MODEL_NAME}.{options.export_type}")
+        stages += [
+            Stage("merge",
+                  [sys.executable, "-m", "src.mesh_cli", "merge", "--clouds", *clouds, "--meshes", *meshes,
+                   "--cloud-output", dense_cloud, "--mesh-output", mesh],
+                  inputs=clouds + meshes, outputs=[dense_cloud, mesh], cwd=ROOT_DIRECTORY),
+            Stage("export",
+                  [sys.executable, "-m", "src.mesh_cli", "convert", mesh, model],
+                  inputs=[mesh], outputs=[model], cwd=ROOT_DIRECTORY),
+        ]
+        if options.lod:
+            stages.append(lod_stage(mesh))
+    checkpoints = CheckpointStore(options.output_path(CHECKPOINT_DIRECTORY))
+    run_report = RunReport(options.output_path(RUN_REPORT_NAME), options.to_dict(), options.output_directory)
+    image_count, pixels_per_image = dataset_size(metadata, options.max_resolution)
+    history = RunHistory(os.path.join(options.cache_directory, HISTORY_NAME))
+    return Pipeline(stages, checkpoints=checkpoints, resume=resume,
+                    memory_budget=options.memory_budget_bytes if options.memory_budget else None,
+                    listeners=[EventLog(options.output_path(EVENT_LOG_NAME)), run_report,
+                               HistoryRecorder(history, run_report, image_count, image_count * pixels_per_image / 1e6)])
+
+
+def lod_stage(mesh: str, prefix: str = "") -> Stage:
+    """
+    Args:
+        - mesh   (str): Path to the mesh
+
+        - prefix (str): Prefix of the stage name
+
+    Returns:
+        - Stage: Stage which writes the level-of-detail pyramid of the mesh with its manifest, all its files are
+          declared as outputs, so a missing level invalidates the stage and partial levels are removed on failure
+    """
+    return Stage(prefix + "lod", [sys.executable, "-m", "src.mesh_cli", "lod", mesh],
+                 inputs=[mesh], outputs=pyramid_paths(mesh), cwd=ROOT_DIRECTORY)
+
+
+def link_chunk_images(images: str, chunk_images: str, names: list):
+    """
+    Link prepared images which belong to the chunk into its directory. Images removed by earlier stages are skipped.
+
+    Args:
+        - images        (str): Directory with prepared images
+
+        - chunk_images  (str): Directory with images of the chunk
+
+        - names        (list): Names of images of the chunk
+
+    """
+    link_images([os.path.join(images, name) for name in names if os.path.isfile(os.path.join(images, name))],
+                chunk_images)
+
+
+def build_test_pipeline() -> Pipeline:
+    """
+    Create the pipeline which only simulates processing with src/test_win.py. It is used to test user interface.
+
+    Returns:
+        - Pipeline: Pipeline with a single stage
+    """
+    return Pipeline([Stage("test", ["python3", "src/test_win.py"])])
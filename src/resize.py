@@ -0,0 +1,98 @@
+"""This module scales input images down to the chosen "Max resolution" before feature extraction, when the
+reconstruction is asked to (downscale_images). Scaled images are stored in the content cache, so reconstructions of
+the same images with the same resolution do not scale them again."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from src.cache import ContentCache, cache_key
+from src.image_utils import copy_exif, file_digest, link_or_copy, list_images
+
+IMAGE_CACHE_BYTES = 20 * 1024 ** 3
+RESIZE_VERSION = 1
+JPEG_QUALITY = 95
+
+
+def resized_image(path: str, max_resolution: int) -> bytes:
+    """
+    Scale image so its longer side is not bigger than max_resolution. EXIF of JPEG images is kept, because OpenMVG
+    reads focal length from it.
+
+    Args:
+        - path            (str): Path to the image
+
+        - max_resolution  (int): Maximal size of the longer side in pixels
+
+    Returns:
+        - bytes: Encoded scaled image, None if the image is already small enough
+    """
+    # Pixels are kept in stored orientation, the EXIF orientation tag is copied together with the rest of EXIF
+    image = cv2.imread(path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        raise ValueError(f"Image {path} can not be read.")
+    height, width = image.shape[:2]
+    scale = max_resolution / max(height, width)
+    if scale >= 1:
+        return None
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    extension = os.path.splitext(path)[1].lower()
+    parameters = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if extension in (".jpg", ".jpeg") else []
+    success, encoded = cv2.imencode(extension, image, parameters)
+    if not success:
+        raise ValueError(f"Image {path} can not be encoded.")
+    data = encoded.tobytes()
+    if extension in (".jpg", ".jpeg"):
+        with open(path, "rb") as file:
+            data = copy_exif(file.read(), data)
+    return data
+
+
+def resize_images(input_directory: str, output_directory: str, max_resolution: int, cache: ContentCache = None,
+                  max_workers: int = None) -> dict:
+    """
+    Fill output directory with images from input directory scaled to max_resolution. Images found in the cache are
+    only linked, the rest is scaled in a thread pool and stored in the cache.
+
+    Args:
+        - input_directory   (str): Directory with original images
+
+        - output_directory  (str): Directory for scaled images, files of other images are removed from it
+
+        - max_resolution    (int): Maximal size of the longer side in pixels
+
+        - cache    (ContentCache): Cache of scaled images, None disables caching
+
+        - max_workers       (int): Number of threads, None means default of ThreadPoolExecutor
+
+    Returns:
+        - dict: Number of all images and number of images taken from the cache
+    """
+    images = list_images(input_directory)
+    os.makedirs(output_directory, exist_ok=True)
+    names = {os.path.basename(path) for path in images}
+    for name in os.listdir(output_directory):
+        if name not in names:
+            os.remove(os.path.join(output_directory, name))
+
+    def resize(path: str) -> bool:
+        target = os.path.join(output_directory, os.path.basename(path))
+        key = cache_key("resize", RESIZE_VERSION, file_digest(path), max_resolution)
+        if cache is not None and cache.fetch(key, target):
+            return True
+        data = resized_image(path, max_resolution)
+        if cache is None:
+            if data is None:
+                link_or_copy(path, target)
+            else:
+                with open(target, "wb") as file:
+                    file.write(data)
+        else:
+            cached = cache.put(key, path) if data is None else cache.put_bytes(key, data)
+            link_or_copy(cached, target)
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hits = sum(executor.map(resize, images))
+    return {"images": len(images), "cached": hits}
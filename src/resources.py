@@ -0,0 +1,454 @@
+"""This module measures resources used by commands of the pipeline: wall time, CPU time, peak resident memory and bytes
+read from and written to disk. Every command runs in its own process group, the group is sampled from /proc while the
+command runs and the final CPU times come from the rusage of the finished process. Disk usage of the output directory
+is sampled during the whole run. Measurements of a run are collected into run_report.json next to the outputs."""
+import json
+import os
+import subprocess
+import threading
+
+from src.progress import (PIPELINE_CANCELLED, PIPELINE_FAILED, PIPELINE_FINISHED, PIPELINE_STARTED, STAGE_CANCELLED,
+                          STAGE_FAILED, STAGE_FINISHED, STAGE_SKIPPED, STAGE_STARTED)
+
+SAMPLE_INTERVAL = 1.0
+REPORT_NAME = "run_report.json"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_group_members(group: int) -> list:
+    """
+    Args:
+        - group (int): Id of the process group
+
+    Returns:
+        - list: Ids of processes of the group, empty list if /proc is not available
+    """
+    members = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return members
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                # The name of the command may contain spaces, fields after it are separated by single spaces
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) == group:
+            members.append(int(entry))
+    return members
+
+
+def read_rss(pid: int) -> int:
+    """
+    Args:
+        - pid (int): Id of the process
+
+    Returns:
+        - int: Resident memory of the process in bytes, 0 if the process ended
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def read_io(pid: int) -> tuple:
+    """
+    Args:
+        - pid (int): Id of the process
+
+    Returns:
+        - tuple: Bytes read from and written to storage by the process, None if they can not be read
+    """
+    try:
+        with open(f"/proc/{pid}/io") as io_file:
+            values = dict(line.split(":", 1) for line in io_file.read().splitlines() if ":" in line)
+        return int(values["read_bytes"]), int(values["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class GroupSampler:
+    """
+    Thread which periodically samples memory and disk I/O of all processes of a process group. Counters of a process
+    are kept from its last sample, so processes which ended before the command are still counted.
+
+    Args:
+        - group      (int): Id of the process group, it is the pid of the command started in a new session
+
+        - interval (float): Seconds between samples
+
+    """
+    def __init__(self, group: int, interval: float = SAMPLE_INTERVAL):
+        self.group = group
+        self.interval = interval
+        self.peak_rss = 0
+        self.io = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.sample_loop, daemon=True)
+
+    def start(self):
+        """
+        Start sampling in the background.
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the last sample.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def sample_loop(self):
+        """
+        Sample the group every interval until stop is called.
+        """
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def sample(self):
+        """
+        Take a single sample of the group.
+        """
+        rss = 0
+        for pid in process_group_members(self.group):
+            rss += read_rss(pid)
+            counters = read_io(pid)
+            if counters is not None:
+                self.io[pid] = counters
+        self.peak_rss = max(self.peak_rss, rss)
+
+    @property
+    def read_bytes(self) -> int:
+        """
+        Returns:
+            - int: Bytes read from storage by all sampled processes
+        """
+        return sum(read for read, _ in self.io.values())
+
+    @property
+    def write_bytes(self) -> int:
+        """
+        Returns:
+            - int: Bytes written to storage by all sampled processes
+        """
+        return sum(written for _, written in self.io.values())
+
+
+def directory_size(path: str) -> int:
+    """
+    Measure disk space taken by files of the directory. Files with several hard links are counted once, and not at all
+    if some of their links lie outside the directory, e.g. images linked from the shared cache or from the input
+    directory do not take new space.
+
+    Args:
+        - path (str): Directory
+
+    Returns:
+        - int: Total size of files in the directory and its subdirectories in bytes, symbolic links are not followed
+    """
+    total = 0
+    # (device, inode) -> [links found in the directory, all links, size]
+    linked = {}
+    directories = [path]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_nlink > 1:
+                        linked.setdefault((stat.st_dev, stat.st_ino), [0, stat.st_nlink, stat.st_size])[0] += 1
+                    else:
+                        total += stat.st_size
+            except OSError:
+                # Files are created and removed by running commands
+                continue
+    return total + sum(size for found, links, size in linked.values() if found >= links)
+
+
+class DirectorySampler:
+    """
+    Thread which periodically measures disk usage of a directory. Besides the peak of the whole run it keeps peaks of
+    named periods, e.g. of running stages.
+
+    Args:
+        - directory  (str): Measured directory
+
+        - interval (float): Seconds between samples
+
+    """
+    def __init__(self, directory: str, interval: float = SAMPLE_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._periods = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._on_stopped = None
+        self._thread = threading.Thread(target=self.sample_loop, daemon=True)
+
+    def start(self):
+        """
+        Start sampling in the background.
+        """
+        self._thread.start()
+
+    def stop(self, on_stopped=None):
+        """
+        Stop sampling without waiting for it. The background thread takes the last sample and then calls on_stopped,
+        so the caller (a listener of the pipeline) is never blocked by a walk of the directory.
+
+        Args:
+            - on_stopped (func): Callable receiving the final peak in bytes, it is called from the sampling thread
+
+        """
+        self._on_stopped = on_stopped
+        self._stop.set()
+
+    def join(self, timeout: float = None):
+        """
+        Wait until the last sample was taken and on_stopped returned.
+
+        Args:
+            - timeout (float): Maximal time to wait in seconds, None means no limit
+
+        """
+        self._thread.join(timeout)
+
+    def sample_loop(self):
+        """
+        Sample the directory every interval until stop is called, then take the last sample.
+        """
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                break
+        self.sample()
+        if self._on_stopped is not None:
+            self._on_stopped(self.peak)
+
+    def sample(self):
+        """
+        Take a single sample of the directory.
+        """
+        size = directory_size(self.directory)
+        with self._lock:
+            self.last = size
+            self.peak = max(self.peak, size)
+            for name in self._periods:
+                self._periods[name] = max(self._periods[name], size)
+
+    def begin(self, name: str):
+        """
+        Start a period. The directory is not walked here, begin and end are called by listeners of the pipeline and
+        must not block it, the period gets samples of the background thread and the last sample before it.
+
+        Args:
+            - name (str): Name of the period, e.g. of the started stage
+
+        """
+        with self._lock:
+            self._periods[name] = self.last
+
+    def end(self, name: str) -> int:
+        """
+        Args:
+            - name (str): Name of the period given to begin
+
+        Returns:
+            - int: Peak disk usage sampled during the period in bytes, including the last sample before it
+        """
+        with self._lock:
+            return self._periods.pop(name, self.last)
+
+
+def wait_command(process: subprocess.Popen):
+    """
+    Wait for the command and set its returncode. Where os.wait4 exists the command is reaped with it, because unlike
+    Popen.wait it gives rusage (CPU times and peak memory). Popen is told about the exit, so it does not wait for the
+    reaped process again.
+
+    Args:
+        - process (subprocess.Popen): Started command
+
+    Returns:
+        - resource.struct_rusage of the command, None if os.wait4 is not available
+    """
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return None
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def command_resources(sampler: GroupSampler, rusage) -> dict:
+    """
+    Combine samples of the group with rusage of the finished command.
+
+    Args:
+        - sampler (GroupSampler): Stopped sampler of the command
+
+        - rusage: resource.struct_rusage from os.wait4, None if it is not available
+
+    Returns:
+        - dict: CPU times in seconds, peak resident memory and bytes read and written
+    """
+    resources = {"cpu_user": None, "cpu_system": None, "peak_rss": sampler.peak_rss,
+                 "read_bytes": sampler.read_bytes, "write_bytes": sampler.write_bytes}
+    if rusage is not None:
+        resources["cpu_user"] = rusage.ru_utime
+        resources["cpu_system"] = rusage.ru_stime
+        # ru_maxrss is in kilobytes on Linux, it catches short peaks between samples
+        resources["peak_rss"] = max(resources["peak_rss"], rusage.ru_maxrss * 1024)
+        if not sampler.io:
+            resources["read_bytes"] = rusage.ru_inblock * 512
+            resources["write_bytes"] = rusage.ru_oublock * 512
+    return resources
+
+
+class RunReport:
+    """
+    Listener of the pipeline which collects resources of finished stages and writes the report of the run when the
+    pipeline ends (also after failure or cancellation). If a directory is given, its peak disk usage is reported
+    for the run and for every stage. The directory is walked only by the background sampler, its last sample is
+    taken after the pipeline ended and the report is written again if that sample raised the peak.
+
+    Args:
+        - path        (str): Path of the report
+
+        - options    (dict): Options of the reconstruction stored in the report
+
+        - directory   (str): Directory whose disk usage is sampled, None means no sampling
+
+    """
+    def __init__(self, path: str, options: dict = None, directory: str = None):
+        self.path = path
+        self.options = options or {}
+        self.directory = directory
+        self.report = None
+        self.disk_sampler = None
+        self._write_lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        if event["event"] == PIPELINE_STARTED:
+            self.report = {"started": event["time"], "finished": None, "status": None, "options": self.options,
+                           "stages": {}, "skipped": []}
+            if self.directory is not None:
+                self.disk_sampler = DirectorySampler(self.directory)
+                self.disk_sampler.start()
+        elif self.report is None:
+            return
+        elif event["event"] == STAGE_STARTED:
+            if self.disk_sampler is not None:
+                self.disk_sampler.begin(event["stage"])
+        elif event["event"] in (STAGE_FINISHED, STAGE_FAILED, STAGE_CANCELLED):
+            peak_disk = self.disk_sampler.end(event["stage"]) if self.disk_sampler is not None else None
+            if event["event"] == STAGE_FINISHED:
+                stage = dict(event.get("resources") or {}, wall_time=event["duration"])
+                if peak_disk is not None:
+                    stage["peak_disk"] = peak_disk
+                self.report["stages"][event["stage"]] = stage
+        elif event["event"] == STAGE_SKIPPED:
+            self.report["skipped"].append(event["stage"])
+        elif event["event"] in (PIPELINE_FINISHED, PIPELINE_FAILED, PIPELINE_CANCELLED):
+            self.report["finished"] = event["time"]
+            self.report["status"] = {PIPELINE_FINISHED: "finished", PIPELINE_FAILED: "failed",
+                                     PIPELINE_CANCELLED: "cancelled"}[event["event"]]
+            self.report["failed_stage"] = event["stage"]
+            self.report["wall_time"] = event["time"] - self.report["started"]
+            self.report["totals"] = {key: sum(stage.get(key) or 0 for stage in self.report["stages"].values())
+                                     for key in ("cpu_user", "cpu_system", "read_bytes", "write_bytes")}
+            self.report["totals"]["peak_rss"] = max((stage.get("peak_rss") or 0
+                                                     for stage in self.report["stages"].values()), default=0)
+            if self.disk_sampler is not None:
+                self.report["totals"]["peak_disk"] = self.disk_sampler.peak
+            self.write(self.report)
+            if self.disk_sampler is not None:
+                report = self.report
+                self.disk_sampler.stop(lambda peak: self.final_disk_sample(report, peak))
+
+    def write(self, report: dict):
+        """
+        Write the report, the file is replaced atomically.
+
+        Args:
+            - report (dict): Report of the run
+
+        """
+        with self._write_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w") as report_file:
+                json.dump(report, report_file, indent=2)
+            os.replace(temporary_path, self.path)
+
+    def final_disk_sample(self, report: dict, peak: int):
+        """
+        Called by the disk sampler after its last sample, which is taken after the pipeline ended. The report is
+        written again if the sample raised the peak disk usage.
+
+        Args:
+            - report (dict): Report of the finished run
+
+            - peak    (int): Peak disk usage of the run in bytes
+
+        """
+        if peak > report["totals"]["peak_disk"]:
+            report["totals"]["peak_disk"] = peak
+            self.write(report)
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Args:
+        - seconds (float): Duration
+
+    Returns:
+        - str: Duration as hours, minutes and seconds, e.g. "1h 02m 03s"
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def format_report(report: dict, limit: int = 5) -> str:
+    """
+    Args:
+        - report (dict): Content of run_report.json
+
+        - limit   (int): Number of the longest stages listed
+
+    Returns:
+        - str: Short human readable summary of the run
+    """
+    gigabyte = 1024 ** 3
+    totals = report.get("totals", {})
+    lines = [f"Total time: {format_duration(report.get('wall_time') or 0)}",
+             f"CPU time: {format_duration(totals.get('cpu_user', 0) + totals.get('cpu_system', 0))}",
+             f"Peak memory: {totals.get('peak_rss', 0) / gigabyte:.1f} GB",
+             f"Disk read/written: {totals.get('read_bytes', 0) / gigabyte:.1f} / "
+             f"{totals.get('write_bytes', 0) / gigabyte:.1f} GB"]
+    if "peak_disk" in totals:
+        lines.append(f"Peak disk usage: {totals['peak_disk'] / gigabyte:.1f} GB")
+    lines.append("Longest stages:")
+    stages = sorted(report.get("stages", {}).items(), key=lambda item: -item[1]["wall_time"])
+    for name, stage in stages[:limit]:
+        lines.append(f"  {name}: {format_duration(stage['wall_time'])}, "
+                     f"{(stage.get('peak_rss') or 0) / gigabyte:.1f} GB")
+    return "\n".join(lines)
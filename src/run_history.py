@@ -0,0 +1,179 @@
+"""This module keeps history of finished reconstructions in a local SQLite database and predicts duration of new ones
+from it. Duration of every stage is modelled by least squares on the number of images and the number of megapixels
+after scaling to max resolution, so the estimate improves with every run on the machine."""
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.progress import PIPELINE_FINISHED
+
+HISTORY_NAME = "run_history.sqlite"
+MIN_RUNS_FOR_REGRESSION = 4
+HISTORY_LIMIT = 200
+# Stages of chunked reconstruction ("chunk_03_densification") are counted together with the same stages of others
+CHUNK_PREFIX = re.compile(r"^chunk_\d+_")
+
+
+def stage_kind(name: str) -> str:
+    """
+    Args:
+        - name (str): Name of the stage
+
+    Returns:
+        - str: Name of the stage without chunk prefix
+    """
+    return CHUNK_PREFIX.sub("", name)
+
+
+class RunHistory:
+    """
+    Database of finished runs with their dataset size, options and durations of stages.
+
+    Args:
+        - path       (str): Path of the SQLite database, it is created if needed
+
+        - read_only (bool): Only read the history, a missing database is not created and means no history, so
+          predictions before a run leave no files behind
+
+    """
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        if read_only:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, finished REAL NOT NULL, "
+                               "images INTEGER NOT NULL, megapixels REAL NOT NULL, wall_time REAL NOT NULL, "
+                               "options TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS stages (run INTEGER NOT NULL REFERENCES runs(id), "
+                               "stage TEXT NOT NULL, wall_time REAL NOT NULL, peak_rss INTEGER)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, report: dict, images: int, megapixels: float):
+        """
+        Store the finished run. Stages skipped by resume are not stored, their durations are not known, the same
+        holds for stages of chunks if any chunk skipped its stage.
+
+        Args:
+            - report     (dict): Report of the run from src.resources.RunReport
+
+            - images      (int): Number of input images
+
+            - megapixels (float): Total megapixels of images scaled to max resolution
+
+        """
+        durations = {}
+        skipped = {stage_kind(name) for name in report.get("skipped", [])}
+        for name, stage in report["stages"].items():
+            kind = stage_kind(name)
+            if kind in skipped:
+                continue
+            wall_time, peak_rss = durations.get(kind, (0.0, 0))
+            durations[kind] = (wall_time + stage["wall_time"], max(peak_rss, stage.get("peak_rss") or 0))
+        with self._connect() as connection:
+            cursor = connection.execute("INSERT INTO runs (finished, images, megapixels, wall_time, options) "
+                                        "VALUES (?, ?, ?, ?, ?)",
+                                        (report.get("finished") or time.time(), images, megapixels,
+                                         report.get("wall_time") or 0.0, json.dumps(report.get("options", {}))))
+            connection.executemany("INSERT INTO stages (run, stage, wall_time, peak_rss) VALUES (?, ?, ?, ?)",
+                                   [(cursor.lastrowid, kind, wall_time, peak_rss)
+                                    for kind, (wall_time, peak_rss) in durations.items()])
+
+    def stage_samples(self) -> dict:
+        """
+        Returns:
+            - dict: Stage name -> array (n, 3) of number of images, megapixels and duration of the last runs
+        """
+        if self.read_only and not os.path.isfile(self.path):
+            return {}
+        with self._connect() as connection:
+            rows = connection.execute("SELECT stages.stage, runs.images, runs.megapixels, stages.wall_time "
+                                      "FROM stages JOIN runs ON stages.run = runs.id "
+                                      "ORDER BY runs.finished DESC").fetchall()
+        samples = {}
+        for stage, images, megapixels, wall_time in rows:
+            samples.setdefault(stage, [])
+            if len(samples[stage]) < HISTORY_LIMIT:
+                samples[stage].append((images, megapixels, wall_time))
+        return {stage: np.array(values, dtype=float) for stage, values in samples.items()}
+
+    def predict(self, images: int, megapixels: float, stages: list = None, samples: dict = None) -> dict:
+        """
+        Predict duration of stages of a new run. With enough history the duration is a linear function of the
+        number of images and megapixels fitted by least squares, otherwise it is scaled from the average duration
+        per megapixel.
+
+        Args:
+            - images      (int): Number of input images
+
+            - megapixels (float): Total megapixels of images scaled to max resolution
+
+            - stages     (list): Names of stages of the new run, None means all stages known from history
+
+            - samples    (dict): Result of stage_samples when many predictions are made at once, None means reading it
+
+        Returns:
+            - dict: Stage name -> seconds, stages without history are left out
+        """
+        if samples is None:
+            samples = self.stage_samples()
+        kinds = {name: stage_kind(name) for name in (stages if stages is not None else samples)}
+        predictions = {}
+        for name, kind in kinds.items():
+            if kind not in samples:
+                continue
+            values = samples[kind]
+            if len(values) >= MIN_RUNS_FOR_REGRESSION:
+                features = np.column_stack([np.ones(len(values)), values[:, 0], values[:, 1]])
+                coefficients = np.linalg.lstsq(features, values[:, 2], rcond=None)[0]
+                seconds = coefficients @ np.array([1.0, images, megapixels])
+            else:
+                seconds = megapixels * np.sum(values[:, 2]) / max(np.sum(values[:, 1]), 1e-9)
+            predictions[name] = max(0.0, float(seconds))
+        if stages is not None:
+            # Stages of chunks share the history of their kind, their sizes are proportional to the whole run
+            counts = {}
+            for kind in kinds.values():
+                counts[kind] = counts.get(kind, 0) + 1
+            predictions = {name: seconds / counts[kinds[name]] for name, seconds in predictions.items()}
+        return predictions
+
+
+class HistoryRecorder:
+    """
+    Listener of the pipeline which stores the run in the history when the pipeline finished successfully. It has to be
+    placed after the RunReport listener, whose report it stores.
+
+    Args:
+        - history    (RunHistory): History of runs
+
+        - run_report  (RunReport): Listener collecting resources of the run
+
+        - images            (int): Number of input images
+
+        - megapixels      (float): Total megapixels of images scaled to max resolution
+
+    """
+    def __init__(self, history: RunHistory, run_report, images: int, megapixels: float):
+        self.history = history
+        self.run_report = run_report
+        self.images = images
+        self.megapixels = megapixels
+
+    def __call__(self, event: dict):
+        if event["event"] == PIPELINE_FINISHED and self.run_report.report is not None:
+            self.history.record(self.run_report.report, self.images, self.megapixels)
@@ -0,0 +1,24 @@
+"""This module reads the parts of OpenMVG sfm_data.json files which are needed by python stages of the pipeline."""
+import json
+import os
+
+
+def read_views(sfm_data_path: str) -> list:
+    """
+    Read views of the scene written by openMVG_main_SfMInit_ImageListing.
+
+    Args:
+        - sfm_data_path (str): Path to sfm_data.json
+
+    Returns:
+        - list: Tuples (view id, image path) sorted by view id
+    """
+    with open(sfm_data_path, "r") as sfm_file:
+        sfm_data = json.load(sfm_file)
+    root_path = sfm_data.get("root_path", "")
+    views = []
+    for view in sfm_data.get("views", []):
+        data = view["value"]["ptr_wrapper"]["data"]
+        path = os.path.join(root_path, data.get("local_path", ""), data["filename"])
+        views.append((int(data.get("id_view", view["key"])), path))
+    return sorted(views)
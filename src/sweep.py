@@ -0,0 +1,158 @@
+"""This module runs sweeps of meshing options. Images are reconstructed and densified once, then every combination of
+option values is meshed and refined in its own directory. Variants do not depend on each other, so the pipeline runs
+them in parallel processes, and the results are compared by size, number of triangles and time."""
+import itertools
+import json
+import os
+
+from src.checkpoint import CHECKPOINT_DIRECTORY, CheckpointStore
+from src.cost_model import estimate_peak_memory
+from src.pipeline import Pipeline
+from src.progress import EVENT_LOG_NAME, EventLog
+from src.reconstruction import (ProcessingOptions, dataset_size, image_stages, meshing_stages, read_dataset,
+                                reconstruction_stages)
+from src.resources import REPORT_NAME as RUN_REPORT_NAME, RunReport, format_duration
+
+SWEEP_OPTIONS = ("decimate", "smoothing_iterations", "min_point_distance", "integrate_only_roi")
+SWEEP_DIRECTORY = "sweep"
+REPORT_NAME = "sweep_report.json"
+PLY_HEADER_SIZE = 64 * 1024
+
+
+def sweep_variants(grid: dict) -> list:
+    """
+    Args:
+        - grid (dict): Option name (one of SWEEP_OPTIONS) -> list of values
+
+    Returns:
+        - list: Dictionaries of option values, one per combination
+    """
+    unknown = set(grid) - set(SWEEP_OPTIONS)
+    if unknown:
+        raise ValueError(f"Options {', '.join(sorted(unknown))} can not be swept, "
+                         f"choose from {', '.join(SWEEP_OPTIONS)}.")
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def build_sweep_pipeline(options: ProcessingOptions, grid: dict, resume: bool = False) -> tuple:
+    """
+    Create the pipeline of the sweep. Stages up to densification are the same as in build_pipeline and write to the
+    output directory, meshing, refinement and export of every variant write to sweep/variant_XX. The memory budget
+    is used to limit the number of variants meshed at once, chunked reconstruction is not used.
+
+    Args:
+        - options (ProcessingOptions): Options of the reconstruction, values from grid replace them in variants
+
+        - grid                 (dict): Option name -> list of values
+
+        - resume               (bool): Skip stages already finished with the same inputs and options
+
+    Returns:
+        - tuple: Pipeline and list of variants, every variant is a dictionary with name, changed options and paths
+    """
+    stages, images = image_stages(options)
+    image_count, pixels_per_image = dataset_size(read_dataset(options), options.max_resolution)
+    memory = estimate_peak_memory(image_count, pixels_per_image)
+    chain, paths = reconstruction_stages(options, images, options.output_directory, memory=memory)
+    stages += chain
+    variants = []
+    for number, changes in enumerate(sweep_variants(grid)):
+        name = f"variant_{number:02d}"
+        directory = options.output_path(SWEEP_DIRECTORY, name)
+        meshing, mesh_paths = meshing_stages(options.copy(**changes), paths["dense_scene"], options.output_directory,
+                                             directory, name + "_", memory)
+        stages += meshing
+        variants.append({"name": name, "options": changes, "directory": directory, "model": mesh_paths["model"]})
+    checkpoints = CheckpointStore(options.output_path(CHECKPOINT_DIRECTORY))
+    pipeline = Pipeline(stages, checkpoints=checkpoints, resume=resume,
+                        memory_budget=options.memory_budget_bytes if options.memory_budget else None,
+                        listeners=[EventLog(options.output_path(EVENT_LOG_NAME)),
+                                   RunReport(options.output_path(RUN_REPORT_NAME), options.to_dict(),
+                                             options.output_directory)])
+    return pipeline, variants
+
+
+def count_faces(path: str) -> int:
+    """
+    Count triangles of the mesh without loading it. PLY files declare the count in their header, OBJ faces are
+    counted line by line.
+
+    Args:
+        - path (str): Path to .ply or .obj mesh
+
+    Returns:
+        - int: Number of faces, None if the file does not exist or its format is not known
+    """
+    if not os.path.isfile(path):
+        return None
+    if path.lower().endswith(".ply"):
+        with open(path, "rb") as mesh_file:
+            header = mesh_file.read(PLY_HEADER_SIZE).split(b"end_header", 1)[0]
+        for line in header.splitlines():
+            parts = line.split()
+            if parts[:2] == [b"element", b"face"] and len(parts) == 3:
+                return int(parts[2])
+        return 0
+    if path.lower().endswith(".obj"):
+        with open(path, "rb") as mesh_file:
+            return sum(1 for line in mesh_file if line.startswith(b"f "))
+    return None
+
+
+def compare_variants(variants: list, run_report: dict) -> list:
+    """
+    Args:
+        - variants    (list): Variants from build_sweep_pipeline
+
+        - run_report  (dict): Report of the sweep run from src.resources.RunReport
+
+    Returns:
+        - list: Rows of the comparison, one dictionary per variant
+    """
+    rows = []
+    for variant in variants:
+        stages = {name: stage for name, stage in run_report.get("stages", {}).items()
+                  if name.startswith(variant["name"] + "_")}
+        exists = os.path.isfile(variant["model"])
+        rows.append({
+            "variant": variant["name"],
+            "options": variant["options"],
+            "model": variant["model"],
+            "size_bytes": os.path.getsize(variant["model"]) if exists else None,
+            "faces": count_faces(variant["model"]),
+            "wall_time": sum(stage["wall_time"] for stage in stages.values()) if stages else None,
+            "peak_rss": max((stage.get("peak_rss") or 0 for stage in stages.values()), default=None),
+        })
+    return rows
+
+
+def write_sweep_report(path: str, rows: list):
+    """
+    Args:
+        - path  (str): Path of the JSON report
+
+        - rows (list): Rows from compare_variants
+
+    """
+    with open(path, "w") as report_file:
+        json.dump({"variants": rows}, report_file, indent=2)
+
+
+def format_table(rows: list) -> str:
+    """
+    Args:
+        - rows (list): Rows from compare_variants
+
+    Returns:
+        - str: Comparison of variants as a text table
+    """
+    lines = [f"{'variant':<12}{'faces':>12}{'size [MB]':>12}{'time':>12}  options"]
+    for row in rows:
+        faces = "-" if row["faces"] is None else str(row["faces"])
+        size = "-" if row["size_bytes"] is None else f"{row['size_bytes'] / 1024 ** 2:.1f}"
+        # Time is missing for variants resumed from a previous run
+        duration = "-" if row["wall_time"] is None else format_duration(row["wall_time"])
+        options = ", ".join(f"{name}={value}" for name, value in row["options"].items())
+        lines.append(f"{row['variant']:<12}{faces:>12}{size:>12}{duration:>12}  {options}")
+    return "\n".join(lines)
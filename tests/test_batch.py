@@ -0,0 +1,126 @@
+"""Tests of the persistent queue of reconstruction jobs."""
+import json
+
+import pytest
+
+from src import batch
+from src.batch import CANCELLED, FAILED, FINISHED, PENDING, RUNNING, BatchQueue, BatchRunner, read_manifest
+from src.cost_model import GIGABYTE
+from src.pipeline import Pipeline, Stage
+from src.reconstruction import ProcessingOptions
+
+
+def options(tmp_path, name: str, **kwargs) -> ProcessingOptions:
+    return ProcessingOptions(str(tmp_path / name / "images"), str(tmp_path / name / "model"), **kwargs)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return BatchQueue(str(tmp_path / "queue.json"))
+
+
+def test_read_manifest(tmp_path):
+    manifest = {"options": {"max_resolution": 1200, "lod": True},
+                "jobs": [{"input": "a/images", "output": "a/model"},
+                         {"input": "b/images", "output": "b/model", "options": {"max_resolution": 600}}]}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    jobs = read_manifest(str(tmp_path / "manifest.json"))
+    assert [job.max_resolution for job in jobs] == [1200, 600]
+    assert all(job.lod for job in jobs)
+    assert jobs[0].input_directory == str(tmp_path / "a/images")
+    assert jobs[1].output_directory == str(tmp_path / "b/model")
+
+
+def test_jobs_are_taken_in_order(tmp_path, queue):
+    first = queue.add(options(tmp_path, "a"))
+    second = queue.add(options(tmp_path, "b"))
+    assert (first["id"], second["id"]) == (1, 2)
+    assert queue.take() is first
+    assert first["status"] == RUNNING
+    assert queue.take() is second
+    assert queue.take() is None
+    assert queue.summary() == {PENDING: 0, RUNNING: 2, FINISHED: 0, FAILED: 0, CANCELLED: 0}
+
+
+def test_queue_survives_restart(tmp_path, queue):
+    queue.add(options(tmp_path, "a"))
+    queue.add(options(tmp_path, "b"))
+    queue.update(queue.take(), status=FINISHED)
+    queue.take()
+
+    restarted = BatchQueue(queue.path)
+    assert [job["status"] for job in restarted.jobs] == [FINISHED, PENDING]
+    assert restarted.find(2)["options"]["output_directory"] == str(tmp_path / "b" / "model")
+    assert restarted.find(3) is None
+
+
+def test_job_with_the_same_output_is_replaced(tmp_path, queue):
+    queue.add(options(tmp_path, "a", max_resolution=800))
+    queue.update(queue.jobs[0], status=FAILED, error="broken")
+    job = queue.add(options(tmp_path, "a", max_resolution=1200))
+    assert len(queue.jobs) == 1
+    assert job["status"] == PENDING and job["error"] is None
+    assert job["options"]["max_resolution"] == 1200
+
+    queue.take()
+    queue.add(options(tmp_path, "a"))
+    assert len(queue.jobs) == 2
+
+
+def test_only_pending_jobs_are_cancelled(tmp_path, queue):
+    first = queue.add(options(tmp_path, "a"))
+    second = queue.add(options(tmp_path, "b"))
+    queue.take()
+    assert not queue.cancel(first)
+    assert queue.cancel(second)
+    assert second["status"] == CANCELLED
+    assert queue.take() is None
+
+
+def test_memory_budget(queue):
+    runner = BatchRunner(queue, max_workers=2, memory_budget=8)
+    assert runner.fits(100 * GIGABYTE)
+    runner._reserved["running"] = 5 * GIGABYTE
+    assert runner.fits(3 * GIGABYTE)
+    assert not runner.fits(4 * GIGABYTE)
+    assert BatchRunner(queue, max_workers=1).fits(100 * GIGABYTE)
+
+
+def test_runner_records_results(tmp_path, queue, monkeypatch):
+    def build_pipeline(job_options, resume):
+        def action():
+            if job_options.max_resolution == 0:
+                raise RuntimeError("broken dataset")
+        return Pipeline([Stage("only", action=action)])
+    monkeypatch.setattr(batch, "build_pipeline", build_pipeline)
+    queue.add(options(tmp_path, "a"))
+    queue.add(options(tmp_path, "b", max_resolution=0))
+    summary = BatchRunner(queue, max_workers=2).run()
+    assert summary == {PENDING: 0, RUNNING: 0, FINISHED: 1, FAILED: 1, CANCELLED: 0}
+    assert queue.find(1)["completed_stages"] == ["only"]
+    assert queue.find(2)["stage"] == "only"
+    assert "broken dataset" in queue.find(2)["error"]
+
+
+def test_broken_jobs_do_not_stop_the_worker(tmp_path, queue, monkeypatch):
+    class BrokenPipeline(Pipeline):
+        def run(self):
+            raise RuntimeError("unexpected")
+
+    def build_pipeline(job_options, resume):
+        if job_options.max_resolution == 1:
+            raise ValueError("image can not be decoded")
+        if job_options.max_resolution == 2:
+            return BrokenPipeline([Stage("only", action=lambda: None)])
+        return Pipeline([Stage("only", action=lambda: None)])
+    monkeypatch.setattr(batch, "build_pipeline", build_pipeline)
+    queue.add(options(tmp_path, "a", max_resolution=1))
+    queue.add(options(tmp_path, "b"))
+    queue.jobs[1]["options"]["mesher"] = "unknown"
+    queue.add(options(tmp_path, "c", max_resolution=2))
+    queue.add(options(tmp_path, "d"))
+    summary = BatchRunner(queue, max_workers=1).run()
+    assert summary == {PENDING: 0, RUNNING: 0, FINISHED: 1, FAILED: 3, CANCELLED: 0}
+    assert [job["status"] for job in BatchQueue(queue.path).jobs] == [FAILED, FAILED, FAILED, FINISHED]
+    assert [queue.find(job_id)["error"] for job_id in (1, 3)] == ["image can not be decoded", "unexpected"]
+    assert "unknown" in queue.find(2)["error"]
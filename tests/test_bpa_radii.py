@@ -0,0 +1,57 @@
+"""Tests of the choice of ball pivoting radii."""
+import numpy as np
+import pytest
+
+from src.bpa_radii import (MAX_PASSES, RADIUS_SCALE, format_plan, local_spacing, merge_radii, pivoting_cost,
+                           plan_radii, region_labels)
+
+
+def grid_points(spacing: float, count: int, offset: float = 0.0) -> np.ndarray:
+    """Flat square grid of count x count points."""
+    x, y = np.meshgrid(np.arange(count) * spacing + offset, np.arange(count) * spacing)
+    return np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size)])
+
+
+def knn_distances(points: np.ndarray, k: int = 4) -> np.ndarray:
+    distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+    return np.sort(distances, axis=1)[:, 1:k + 1]
+
+
+def test_local_spacing():
+    assert local_spacing(np.array([[1.0, 2.0, 3.0], [2.0, 2.0, 2.0]])).tolist() == [2.0, 2.0]
+
+
+def test_merge_radii():
+    assert merge_radii(np.array([1.0, 1.1, 1.5, 0.0, 3.0, 3.2])) == [1.0, 1.5, 3.0]
+    radii = merge_radii(2.0 ** np.arange(8))
+    assert len(radii) == MAX_PASSES
+    assert radii[0] == 1.0 and radii[-1] == 128.0
+    assert radii == sorted(radii)
+
+
+def test_region_labels():
+    points = np.array([[0.0, 0.0, 0.0], [10.0, 10.0, 5.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0], [4.9, 5.1, 0.0]])
+    assert region_labels(points, grid=2).tolist() == [0, 3, 2, 1, 1]
+    assert region_labels(np.zeros((3, 3)), grid=4).tolist() == [0, 0, 0]
+
+
+def test_pivoting_cost():
+    passes = pivoting_cost(np.array([1.0, 1.0, 2.0, 4.0]), [2.5, 5.0, 10.0])
+    assert [bpa_pass["relative_cost"] for bpa_pass in passes] == pytest.approx([1.0, 4.0, 16.0])
+    assert [bpa_pass["coverage"] for bpa_pass in passes] == [0.5, 0.75, 1.0]
+
+
+def test_sparse_and_dense_parts_get_their_own_radius():
+    dense = grid_points(0.1, 20)
+    sparse = grid_points(1.0, 12, offset=10.0)
+    points = np.concatenate([dense, sparse])
+    plan = plan_radii(points, knn_distances(points))
+    radii = plan["radii"]
+    assert radii[0] == pytest.approx(RADIUS_SCALE * 0.1, rel=0.2)
+    assert radii[-1] >= RADIUS_SCALE * 1.0
+    assert plan["region_spacing"]
+    assert len(plan["passes"]) == len(radii)
+    assert format_plan(plan).count("Pass ") == len(radii)
+
+    uniform = grid_points(0.5, 15)
+    assert len(plan_radii(uniform, knn_distances(uniform), per_region=False)["radii"]) == 1
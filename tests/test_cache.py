@@ -0,0 +1,65 @@
+"""Tests of the persistent cache of files."""
+import itertools
+import os
+
+import pytest
+
+from src import cache
+from src.cache import ContentCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make every call of time.time in the cache return a later time, so the order of usage is never ambiguous."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_cache_key():
+    assert cache_key("digest", {"a": 1, "b": 2}) == cache_key("digest", {"b": 2, "a": 1})
+    assert cache_key("digest", 1200) != cache_key("digest", 1600)
+    assert cache_key("digest", 1200) != cache_key("other", 1200)
+
+
+def test_put_and_fetch(tmp_path):
+    store = ContentCache(str(tmp_path / "cache"), 1000)
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"content")
+    key = cache_key("source")
+    path = store.put(key, str(source))
+    assert path == store.entry_path(key)
+    assert store.get(key) == path
+    assert store.fetch(key, str(tmp_path / "out" / "copy.bin"))
+    assert (tmp_path / "out" / "copy.bin").read_bytes() == b"content"
+    assert store.size() == len(b"content")
+    assert not store.fetch(cache_key("missing"), str(tmp_path / "missing.bin"))
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+
+
+def test_removed_file_is_a_miss(tmp_path):
+    store = ContentCache(str(tmp_path / "cache"), 1000)
+    key = cache_key("entry")
+    os.remove(store.put_bytes(key, b"data"))
+    assert store.get(key) is None
+    assert store.size() == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    store = ContentCache(str(tmp_path / "cache"), 25)
+    first, second, third = cache_key(1), cache_key(2), cache_key(3)
+    store.put_bytes(first, b"1" * 10)
+    store.put_bytes(second, b"2" * 10)
+    assert store.get(first) is not None
+    store.put_bytes(third, b"3" * 10)
+    assert store.get(second) is None
+    assert store.get(first) is not None
+    assert store.get(third) is not None
+    assert store.size() == 20
+
+
+def test_index_is_shared(tmp_path):
+    ContentCache(str(tmp_path / "cache"), 1000).put_bytes(cache_key("entry"), b"data")
+    other = ContentCache(str(tmp_path / "cache"), 1000)
+    assert other.size() == 4
+    with open(other.get(cache_key("entry")), "rb") as entry_file:
+        assert entry_file.read() == b"data"
@@ -0,0 +1,151 @@
+"""Tests of completion markers and of resuming the pipeline from them."""
+import os
+
+import pytest
+
+from src.checkpoint import CheckpointStore, path_signature
+from src.pipeline import Pipeline, PipelineError, Stage
+
+
+def write(path, text: str):
+    """Write the file and move its modification time forward, so even a fast rewrite changes its signature."""
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    with open(path, "w") as file:
+        file.write(text)
+    modified = max(os.stat(path).st_mtime_ns, previous + 1_000_000_000)
+    os.utime(path, ns=(modified, modified))
+
+
+def copy_stage(name: str, source, target, calls: list, **kwargs) -> Stage:
+    """Stage which copies one file with a python action and records that it ran."""
+    def action():
+        calls.append(name)
+        with open(source) as source_file:
+            write(target, source_file.read().upper())
+    return Stage(name, inputs=[source], outputs=[target], action=action, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / ".checkpoints"))
+
+
+def test_path_signature(tmp_path):
+    assert path_signature(str(tmp_path / "missing")) is None
+    write(tmp_path / "file.txt", "abc")
+    assert path_signature(str(tmp_path / "file.txt"))[0] == 3
+    os.makedirs(tmp_path / "directory" / "nested")
+    write(tmp_path / "directory" / "b.txt", "b")
+    write(tmp_path / "directory" / "nested" / "a.txt", "aa")
+    signature = path_signature(str(tmp_path / "directory"))
+    assert [(path, size) for path, size, _ in signature] == [("b.txt", 1), (os.path.join("nested", "a.txt"), 2)]
+
+
+def test_fingerprint_is_stable(tmp_path, store):
+    write(tmp_path / "input.txt", "input")
+    stage = Stage("stage", ["tool", "--option", 1], inputs=[tmp_path / "input.txt"], outputs=[tmp_path / "out"])
+    same = Stage("stage", ["tool", "--option", "1"], inputs=[tmp_path / "input.txt"], outputs=[tmp_path / "out"])
+    assert store.fingerprint(stage) == store.fingerprint(same)
+
+
+def test_fingerprint_changes(tmp_path, store):
+    write(tmp_path / "input.txt", "input")
+    stage = Stage("stage", ["tool", "-a"], inputs=[tmp_path / "input.txt"], outputs=[tmp_path / "out"],
+                  parameters={"level": 1})
+    fingerprint = store.fingerprint(stage)
+    assert store.fingerprint(Stage("stage", ["tool", "-b"], inputs=stage.inputs, outputs=stage.outputs,
+                                   parameters={"level": 1})) != fingerprint
+    assert store.fingerprint(Stage("stage", ["tool", "-a"], inputs=stage.inputs, outputs=stage.outputs,
+                                   parameters={"level": 2})) != fingerprint
+    assert store.fingerprint(Stage("stage", ["tool", "-a"], inputs=stage.inputs, outputs=[tmp_path / "other"],
+                                   parameters={"level": 1})) != fingerprint
+    write(tmp_path / "input.txt", "changed")
+    assert store.fingerprint(stage) != fingerprint
+
+
+def test_marker_is_valid_until_something_changes(tmp_path, store):
+    write(tmp_path / "input.txt", "input")
+    write(tmp_path / "output.txt", "output")
+    stage = Stage("stage", ["tool"], inputs=[tmp_path / "input.txt"], outputs=[tmp_path / "output.txt"])
+    assert not store.is_valid(stage)
+    store.complete(stage, store.fingerprint(stage))
+    assert store.is_valid(stage)
+
+    write(tmp_path / "output.txt", "edited by hand")
+    assert not store.is_valid(stage)
+    store.complete(stage, store.fingerprint(stage))
+    os.remove(tmp_path / "output.txt")
+    assert not store.is_valid(stage)
+    write(tmp_path / "output.txt", "output")
+    store.complete(stage, store.fingerprint(stage))
+    write(tmp_path / "input.txt", "new input")
+    assert not store.is_valid(stage)
+
+
+def test_invalidate(tmp_path, store):
+    write(tmp_path / "output.txt", "output")
+    stage = Stage("stage", ["tool"], outputs=[tmp_path / "output.txt"])
+    store.invalidate(stage)
+    store.complete(stage, store.fingerprint(stage))
+    store.invalidate(stage)
+    assert not os.path.exists(store.marker_path(stage))
+    assert not store.is_valid(stage)
+
+
+def test_corrupted_marker_is_invalid(tmp_path, store):
+    stage = Stage("stage", ["tool"])
+    os.makedirs(store.directory)
+    with open(store.marker_path(stage), "w") as marker_file:
+        marker_file.write("{not json")
+    assert not store.is_valid(stage)
+
+
+def chain(tmp_path, calls: list) -> list:
+    return [copy_stage("first", tmp_path / "a.txt", tmp_path / "b.txt", calls),
+            copy_stage("second", tmp_path / "b.txt", tmp_path / "c.txt", calls),
+            copy_stage("other", tmp_path / "x.txt", tmp_path / "y.txt", calls)]
+
+
+def test_resume_skips_finished_stages(tmp_path, store):
+    write(tmp_path / "a.txt", "a")
+    write(tmp_path / "x.txt", "x")
+    calls = []
+    Pipeline(chain(tmp_path, calls), checkpoints=store, resume=True).run()
+    assert sorted(calls) == ["first", "other", "second"]
+
+    calls.clear()
+    pipeline = Pipeline(chain(tmp_path, calls), checkpoints=store, resume=True)
+    pipeline.run()
+    assert calls == []
+    assert sorted(pipeline.skipped) == ["first", "other", "second"]
+
+    calls.clear()
+    Pipeline(chain(tmp_path, calls), checkpoints=store, resume=False).run()
+    assert sorted(calls) == ["first", "other", "second"]
+
+
+def test_resume_reruns_stages_after_changed_input(tmp_path, store):
+    write(tmp_path / "a.txt", "a")
+    write(tmp_path / "x.txt", "x")
+    Pipeline(chain(tmp_path, []), checkpoints=store, resume=True).run()
+
+    write(tmp_path / "a.txt", "changed")
+    calls = []
+    pipeline = Pipeline(chain(tmp_path, calls), checkpoints=store, resume=True)
+    pipeline.run()
+    assert calls == ["first", "second"]
+    assert pipeline.skipped == ["other"]
+    with open(tmp_path / "c.txt") as result_file:
+        assert result_file.read() == "CHANGED"
+
+
+def test_failed_stage_leaves_no_marker(tmp_path, store):
+    write(tmp_path / "a.txt", "a")
+
+    def fail():
+        raise RuntimeError("broken")
+    stage = Stage("broken", inputs=[tmp_path / "a.txt"], outputs=[tmp_path / "b.txt"], action=fail)
+    with pytest.raises(PipelineError):
+        Pipeline([stage], checkpoints=store, resume=True).run()
+    assert not os.path.exists(store.marker_path(stage))
+    assert not store.is_valid(stage)
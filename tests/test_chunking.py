@@ -0,0 +1,64 @@
+"""Tests of splitting large image sets into overlapping chunks."""
+import math
+
+import numpy as np
+import pytest
+
+from src.chunking import nearest_outside, plan_chunks, split_positions
+
+
+def line_metadata(count: int, spacing: float = 0.0001) -> list:
+    """Images along a line from west to east."""
+    return [{"latitude": 50.0, "longitude": 14.0 + index * spacing, "altitude": 100.0} for index in range(count)]
+
+
+def test_split_positions():
+    positions = np.random.default_rng(3).uniform(0, 100, size=(30, 3))
+    chunks = split_positions(positions, np.arange(30), 10)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10]
+    assert sorted(np.concatenate(chunks).tolist()) == list(range(30))
+
+
+def test_split_along_the_longest_axis():
+    positions = np.column_stack([np.zeros(8), np.arange(8.0), np.arange(8.0)[::-1] * 100])
+    chunks = split_positions(positions, np.arange(8), 4)
+    assert [sorted(chunk.tolist()) for chunk in chunks] == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+def test_nearest_outside():
+    positions = np.column_stack([np.arange(10.0), np.zeros(10), np.zeros(10)])
+    assert nearest_outside(positions, np.arange(5), 2).tolist() == [5, 6]
+    assert nearest_outside(positions, np.arange(10), 2).size == 0
+    assert nearest_outside(positions, np.arange(5), 0).size == 0
+
+
+def test_small_set_is_one_chunk():
+    assert plan_chunks(line_metadata(5), 10) == [[0, 1, 2, 3, 4]]
+
+
+def test_chunks_cover_all_images_with_overlap():
+    chunks = plan_chunks(line_metadata(40), 10, overlap=0.2)
+    assert len(chunks) == 4
+    assert set().union(*chunks) == set(range(40))
+    for chunk in chunks:
+        assert len(chunk) == 10 + math.ceil(0.2 * 10)
+        assert chunk == sorted(chunk)
+    # Overlap is taken from the neighbours along the line
+    assert chunks[0] == list(range(12))
+    assert chunks[1] == list(range(9, 21))
+
+
+def test_images_without_gps_follow_the_previous_image():
+    metadata = line_metadata(20)
+    metadata[12] = {"latitude": None, "longitude": None, "altitude": None}
+    metadata[0] = {"latitude": None, "longitude": None, "altitude": None}
+    chunks = plan_chunks(metadata, 10, overlap=0.0)
+    owner = {index: number for number, chunk in enumerate(chunks) for index in chunk}
+    assert owner[12] == owner[11]
+    assert owner[0] == 0
+    assert sum(len(chunk) for chunk in chunks) == 20
+
+
+def test_chunking_needs_gps():
+    with pytest.raises(ValueError):
+        plan_chunks([{"latitude": None} for _ in range(20)], 10)
@@ -0,0 +1,114 @@
+"""Tests of the scan of the input directory and of recommended settings. Metadata of images is given directly."""
+import os
+
+import pytest
+
+from src import dataset_scan
+from src.cost_model import GIGABYTE, estimate_disk_usage, estimate_peak_memory
+from src.dataset_scan import MIN_RESOLUTION, RESOLUTION_STEP, format_scan, recommend_settings, scan_dataset
+from src.reconstruction import ProcessingOptions, dataset_size
+from src.run_history import HISTORY_NAME, RunHistory
+
+
+def image(name: str, width: int = 4000, height: int = 3000, model: str = "FC6310") -> dict:
+    return {"path": f"images/{name}", "width": width, "height": height, "make": "DJI", "model": model}
+
+
+@pytest.fixture
+def options(tmp_path):
+    return ProcessingOptions(str(tmp_path / "images"), str(tmp_path / "model"), cache_directory=str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    """Machine with 16 GB of RAM, 2 GB of swap and 100 GB of free disk space."""
+    monkeypatch.setattr(dataset_scan, "system_memory", lambda: (16 * GIGABYTE, 2 * GIGABYTE))
+    monkeypatch.setattr(dataset_scan, "free_disk_space", lambda path: 100 * GIGABYTE)
+
+
+def test_scan(options, machine):
+    metadata = [image("a.jpg"), image("b.jpg"), image("c.jpg", 2000, 1000, None),
+                {"path": "images/d.jpg", "width": None, "height": None}]
+    scan = scan_dataset(options, metadata)
+    image_count, pixels_per_image = dataset_size(metadata, options.max_resolution)
+    assert scan["image_count"] == 4 and scan["unknown_size"] == 1
+    assert scan["resolutions"] == {"4000x3000": 2, "2000x1000": 1}
+    assert scan["camera_models"] == {"DJI FC6310": 2, "DJI": 1, "unknown": 1}
+    assert scan["megapixels"] == pytest.approx(26.0)
+    assert scan["scaled_megapixels"] == pytest.approx(image_count * pixels_per_image / 1e6)
+    assert scan["peak_memory"] == estimate_peak_memory(image_count, pixels_per_image)
+    assert scan["chunks"] == 1 and scan["fits_memory"]
+    assert scan["duration"] is None and scan["warnings"] == []
+    # The scan does not create the history
+    assert not os.path.exists(options.cache_directory)
+
+
+def test_scan_warnings(options, machine, monkeypatch):
+    assert scan_dataset(options, [])["warnings"] == ["The input directory does not contain any images."]
+    monkeypatch.setattr(dataset_scan, "system_memory", lambda: (GIGABYTE // 100, 0))
+    monkeypatch.setattr(dataset_scan, "free_disk_space", lambda path: 0)
+    warnings = scan_dataset(options, [image(f"{index}.jpg") for index in range(100)])["warnings"]
+    assert len(warnings) == 2
+    assert "exceeds RAM and swap" in warnings[0]
+    assert "only 0.0 GB are free" in warnings[1]
+
+
+def test_format_scan(options, machine, tmp_path):
+    metadata = [image("a.jpg"), {"path": "images/b.jpg", "width": None, "height": None}]
+    history = RunHistory(os.path.join(options.cache_directory, HISTORY_NAME))
+    history.record({"stages": {"matching": {"wall_time": 3725.0}}, "wall_time": 3725.0}, 2, 1.0)
+    text = format_scan(scan_dataset(options, metadata)).splitlines()
+    assert text[0] == "Images: 2, 1 of unknown size"
+    assert text[1] == "Resolutions: 4000x3000 (1)"
+    assert text[2] == "Cameras: DJI FC6310 (1), unknown (1)"
+    assert text[-1].startswith("Estimated time: ") and text[-1] != "Estimated time: unknown (no history)"
+    assert "Warning" not in "\n".join(text)
+
+    text = format_scan(scan_dataset(options.copy(cache_directory=str(tmp_path / "empty")), []))
+    assert "Resolutions: -" in text and "Estimated time: unknown (no history)" in text
+    assert text.endswith("Warning: The input directory does not contain any images.")
+
+
+def test_largest_resolution_within_the_memory_budget(options, machine):
+    metadata = [image(f"{index}.jpg") for index in range(50)]
+    resolution = 4000 - 30 * RESOLUTION_STEP
+    budget = estimate_peak_memory(*dataset_size(metadata, resolution))
+    recommendation = recommend_settings(options, metadata, budget)
+    assert recommendation["max_resolution"] == resolution
+    assert recommendation["peak_memory"] == budget
+    assert recommendation["fits"] and not recommendation["remove_dmaps"]
+    assert recommendation["duration"] is None
+    assert not os.path.exists(options.cache_directory)
+
+    recommendation = recommend_settings(options, metadata, 1)
+    assert MIN_RESOLUTION <= recommendation["max_resolution"] < MIN_RESOLUTION + RESOLUTION_STEP
+    assert not recommendation["fits"]
+
+
+def test_time_budget(options, machine):
+    metadata = [image(f"{index}.jpg") for index in range(10)]
+    history = RunHistory(os.path.join(options.cache_directory, HISTORY_NAME))
+    history.record({"stages": {"densification": {"wall_time": 100.0}}, "wall_time": 100.0}, 10, 10.0)
+    recommendation = recommend_settings(options, metadata, 100 * GIGABYTE, time_budget=50.0)
+    # Duration grows with megapixels, 5 megapixels of 10 images fit into the time budget
+    image_count, pixels_per_image = dataset_size(metadata, recommendation["max_resolution"])
+    assert image_count * pixels_per_image <= 5e6
+    assert recommendation["duration"] <= 50.0 and recommendation["fits"]
+    image_count, pixels_per_image = dataset_size(metadata, recommendation["max_resolution"] + RESOLUTION_STEP)
+    assert image_count * pixels_per_image > 5e6
+
+
+def test_depth_maps_are_removed_when_they_do_not_fit(options, monkeypatch):
+    metadata = [image(f"{index}.jpg") for index in range(20)]
+    image_count, pixels_per_image = dataset_size(metadata, 4000)
+    free_disk = estimate_disk_usage(image_count, pixels_per_image, False) + 1
+    assert estimate_disk_usage(image_count, pixels_per_image) > free_disk
+    monkeypatch.setattr(dataset_scan, "free_disk_space", lambda path: free_disk)
+    recommendation = recommend_settings(options, metadata, 100 * GIGABYTE)
+    assert recommendation["max_resolution"] == 4000
+    assert recommendation["remove_dmaps"] and recommendation["fits"]
+    assert recommendation["disk_usage"] == free_disk - 1
+
+    monkeypatch.setattr(dataset_scan, "free_disk_space", lambda path: 100 * GIGABYTE)
+    assert not recommend_settings(options, metadata, 100 * GIGABYTE)["remove_dmaps"]
+    assert recommend_settings(options.copy(remove_dmaps=True), metadata, 100 * GIGABYTE)["remove_dmaps"]
@@ -0,0 +1,88 @@
+"""Tests of the removal of near-duplicate frames."""
+import cv2
+import numpy as np
+
+from src.dedup import HammingIndex, group_duplicates, hash_image, nearby_pairs, popcount
+
+
+def flip(value: int, *bits) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def brute_force_pairs(hashes: list, max_distance: int) -> set:
+    return {(i, j, bin(hashes[i] ^ hashes[j]).count("1")) for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+            if bin(hashes[i] ^ hashes[j]).count("1") <= max_distance}
+
+
+def test_popcount():
+    values = np.array([0, 1, 0xFF, 2 ** 64 - 1, 0x8000000000000001], dtype=np.uint64)
+    assert popcount(values).tolist() == [0, 1, 8, 64, 2]
+
+
+def test_index_finds_the_same_pairs_as_brute_force():
+    generator = np.random.default_rng(1)
+    hashes = [int(value) for value in generator.integers(0, 2 ** 63, size=200, dtype=np.uint64)]
+    # Near-duplicates with changes spread over all chunks of the index
+    for index in range(0, 200, 10):
+        bits = generator.choice(64, size=int(generator.integers(0, 7)), replace=False)
+        hashes.append(flip(hashes[index], *bits.tolist()))
+    for max_distance in (0, 2, 4):
+        pairs = HammingIndex(np.array(hashes, dtype=np.uint64), max_distance).pairs()
+        assert {tuple(pair) for pair in pairs.tolist()} == brute_force_pairs(hashes, max_distance)
+
+
+def test_index_without_pairs():
+    pairs = HammingIndex(np.array([0, 2 ** 64 - 1], dtype=np.uint64)).pairs()
+    assert pairs.shape == (0, 3)
+
+
+def test_sharpest_image_is_kept():
+    base = 0x0123456789ABCDEF
+    hashes = np.array([base, flip(base, 3), flip(base, 3, 40), base ^ (2 ** 64 - 1)], dtype=np.uint64)
+    groups = group_duplicates(hashes, np.array([1.0, 5.0, 2.0, 3.0]))
+    assert groups == [[1, 0, 2], [3]]
+
+
+def test_groups_do_not_chain():
+    base = 0
+    hashes = np.array([base, flip(base, 0, 1, 2, 3), flip(base, 0, 1, 2, 3, 4, 5, 6, 7)], dtype=np.uint64)
+    groups = group_duplicates(hashes, np.array([1.0, 2.0, 3.0]))
+    assert groups == [[2, 1], [0]]
+
+
+def test_nearby_pairs():
+    metadata = [
+        {"latitude": 50.0, "longitude": 14.0, "altitude": 100.0, "timestamp": 0.0},
+        {"latitude": 50.000005, "longitude": 14.0, "altitude": 100.0, "timestamp": 100.0},
+        {"latitude": 50.0001, "longitude": 14.0, "altitude": 100.0, "timestamp": 1.0},
+        {"latitude": None, "longitude": None, "timestamp": 1.0},
+        {"latitude": None, "longitude": None, "timestamp": None},
+    ]
+    pairs = np.array([[0, 1], [0, 2], [0, 3], [2, 3], [3, 4], [1, 4]])
+    assert nearby_pairs(pairs, metadata).tolist() == [True, False, True, True, False, False]
+
+
+def test_repeated_facade_is_not_a_duplicate():
+    hashes = np.array([7, 7, 7], dtype=np.uint64)
+    metadata = [{"latitude": 50.0, "longitude": 14.0, "altitude": 100.0, "timestamp": 0.0},
+                {"latitude": 50.0, "longitude": 14.0001, "altitude": 100.0, "timestamp": 1.0},
+                {"latitude": 50.0, "longitude": 14.000001, "altitude": 100.0, "timestamp": 60.0}]
+    assert group_duplicates(hashes, np.array([1.0, 2.0, 3.0])) == [[2, 0, 1]]
+    assert group_duplicates(hashes, np.array([1.0, 2.0, 3.0]), metadata=metadata) == [[2, 0], [1]]
+
+
+def test_hash_image(tmp_path):
+    gradient = np.tile(np.arange(256, dtype=np.uint8), (128, 1))
+    cv2.imwrite(str(tmp_path / "large.png"), gradient)
+    cv2.imwrite(str(tmp_path / "small.png"), cv2.resize(gradient, (128, 64), interpolation=cv2.INTER_AREA))
+    cv2.imwrite(str(tmp_path / "flat.png"), np.full((64, 64), 128, dtype=np.uint8))
+    large, large_sharpness = hash_image(str(tmp_path / "large.png"))
+    small, _ = hash_image(str(tmp_path / "small.png"))
+    flat, flat_sharpness = hash_image(str(tmp_path / "flat.png"))
+    assert bin(large ^ small).count("1") <= 4
+    assert bin(large ^ flat).count("1") > 4
+    assert flat_sharpness == 0.0 and large_sharpness >= 0.0
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+    assert hash_image(str(tmp_path / "broken.jpg")) == (None, 0.0)
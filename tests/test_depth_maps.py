@@ -0,0 +1,50 @@
+"""Tests of compression of depth-maps kept after densification."""
+import os
+
+import pytest
+
+from src import depth_maps
+from src.depth_maps import (COMPRESSED_EXTENSION, compress_depth_maps, compress_file, decompress_file,
+                            restore_depth_maps)
+
+
+def write_depth_maps(directory, count: int) -> dict:
+    contents = {f"depth{index:04d}.dmap": bytes(range(256)) * (index + 1) + b"\0" * 4096 for index in range(count)}
+    for name, content in contents.items():
+        (directory / name).write_bytes(content)
+    return contents
+
+
+def test_round_trip(tmp_path):
+    contents = write_depth_maps(tmp_path, 3)
+    (tmp_path / "scene.mvs").write_bytes(b"scene")
+    count, before, after = compress_depth_maps(str(tmp_path), workers=2)
+    assert count == 3
+    assert before == sum(len(content) for content in contents.values()) and after < before
+    assert sorted(os.listdir(tmp_path)) == sorted([name + COMPRESSED_EXTENSION for name in contents] + ["scene.mvs"])
+
+    assert restore_depth_maps(str(tmp_path)) is False
+    assert sorted(os.listdir(tmp_path)) == sorted(list(contents) + ["scene.mvs"])
+    assert all((tmp_path / name).read_bytes() == content for name, content in contents.items())
+
+
+def test_interrupted_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    content = write_depth_maps(tmp_path, 1)["depth0000.dmap"]
+    path = str(tmp_path / "depth0000.dmap")
+    copyfileobj = depth_maps.shutil.copyfileobj
+
+    def full_disk(source, target, length):
+        target.write(source.read(100))
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(depth_maps.shutil, "copyfileobj", full_disk)
+    with pytest.raises(OSError):
+        compress_file(path)
+    assert os.listdir(tmp_path) == ["depth0000.dmap"]
+    assert (tmp_path / "depth0000.dmap").read_bytes() == content
+
+    monkeypatch.setattr(depth_maps.shutil, "copyfileobj", copyfileobj)
+    compress_file(path)
+    monkeypatch.setattr(depth_maps.shutil, "copyfileobj", full_disk)
+    with pytest.raises(OSError):
+        decompress_file(path + COMPRESSED_EXTENSION)
+    assert os.listdir(tmp_path) == ["depth0000.dmap" + COMPRESSED_EXTENSION]
@@ -0,0 +1,73 @@
+"""Tests of features and matches of OpenMVG kept in the content cache."""
+import json
+import os
+
+import pytest
+
+from src.cache import ContentCache
+from src.feature_cache import FEATURE_EXTENSIONS, feature_paths, matches_key, restore_features, store_features
+
+PARAMETERS = {"describer": "SIFT", "preset": "NORMAL"}
+
+
+def write_sfm_data(path, images_directory, names: list):
+    views = [{"key": index, "value": {"ptr_wrapper": {"data": {"id_view": index, "local_path": "", "filename": name}}}}
+             for index, name in enumerate(names)]
+    path.write_text(json.dumps({"root_path": str(images_directory), "views": views}))
+
+
+@pytest.fixture
+def scene(tmp_path):
+    """sfm_data.json with two images and features of both written by the extraction command."""
+    (tmp_path / "images").mkdir()
+    (tmp_path / "matches").mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (tmp_path / "images" / name).write_bytes(name.encode() * 10)
+        for extension in FEATURE_EXTENSIONS:
+            (tmp_path / "matches" / f"{name[0]}{extension}").write_text(f"{name} {extension}")
+    write_sfm_data(tmp_path / "sfm_data.json", tmp_path / "images", ["a.jpg", "b.jpg"])
+    return str(tmp_path / "sfm_data.json"), str(tmp_path / "matches"), ContentCache(str(tmp_path / "cache"), 10 ** 6)
+
+
+def test_features_round_trip(tmp_path, scene):
+    sfm_data, matches, cache = scene
+    store_features(sfm_data, matches, cache, PARAMETERS)
+    os.rename(matches, tmp_path / "old_matches")
+    os.mkdir(matches)
+    assert restore_features(sfm_data, matches, cache, PARAMETERS) is False
+    for name in ("a", "b"):
+        for extension in FEATURE_EXTENSIONS:
+            assert (tmp_path / "matches" / f"{name}{extension}").read_text() == f"{name}.jpg {extension}"
+
+
+def test_stale_features_are_removed(tmp_path, scene):
+    sfm_data, matches, cache = scene
+    store_features(sfm_data, matches, cache, PARAMETERS)
+    # Same name, different content
+    (tmp_path / "images" / "b.jpg").write_bytes(b"changed")
+    assert restore_features(sfm_data, matches, cache, PARAMETERS) is False
+    assert all(os.path.isfile(path) for path in feature_paths(str(tmp_path / "images" / "a.jpg"), matches).values())
+    assert not any(os.path.exists(path) for path in feature_paths(str(tmp_path / "images" / "b.jpg"), matches).values())
+
+    os.mkdir(tmp_path / "other")
+    assert restore_features(sfm_data, str(tmp_path / "other"), cache, dict(PARAMETERS, preset="HIGH")) is False
+    assert os.listdir(tmp_path / "other") == []
+
+
+def test_matches_key(tmp_path, scene):
+    sfm_data, _, _ = scene
+    (tmp_path / "pairs.txt").write_text("0 1\n")
+    key = matches_key(sfm_data, str(tmp_path / "pairs.txt"), PARAMETERS)
+    assert matches_key(sfm_data, str(tmp_path / "pairs.txt"), dict(PARAMETERS)) == key
+    assert matches_key(sfm_data, str(tmp_path / "pairs.txt"), dict(PARAMETERS, ratio=0.6)) != key
+
+    (tmp_path / "pairs.txt").write_text("1 0\n")
+    assert matches_key(sfm_data, str(tmp_path / "pairs.txt"), PARAMETERS) != key
+    (tmp_path / "pairs.txt").write_text("0 1\n")
+    (tmp_path / "images" / "a.jpg").write_bytes(b"changed")
+    assert matches_key(sfm_data, str(tmp_path / "pairs.txt"), PARAMETERS) != key
+
+    # Matches refer to view ids, so the order of views matters
+    (tmp_path / "images" / "a.jpg").write_bytes(b"a.jpg" * 10)
+    write_sfm_data(tmp_path / "sfm_data.json", tmp_path / "images", ["b.jpg", "a.jpg"])
+    assert matches_key(sfm_data, str(tmp_path / "pairs.txt"), PARAMETERS) != key
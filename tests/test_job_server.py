@@ -0,0 +1,129 @@
+"""Tests of requests of the local job server. Requests are dispatched directly, no socket is opened."""
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from src.batch import CANCELLED, PENDING, BatchQueue
+from src.job_server import MAX_EVENTS, JobServer
+from src.progress import (EVENT_LOG_NAME, PIPELINE_FINISHED, STAGE_FINISHED, STAGE_PROGRESS, STAGE_STARTED,
+                          create_event)
+
+
+@pytest.fixture
+def server(tmp_path):
+    return JobServer(BatchQueue(str(tmp_path / "queue.json")), max_workers=1)
+
+
+def post_job(server, tmp_path, name: str, **options) -> tuple:
+    body = dict(input_directory=str(tmp_path / name / "images"), output_directory=str(tmp_path / name / "model"),
+                **options)
+    return server.dispatch("POST", "/jobs", json.dumps(body).encode())
+
+
+def test_add_and_list_jobs(server, tmp_path):
+    status, job = post_job(server, tmp_path, "a", max_resolution=1200)
+    assert status == HTTPStatus.CREATED
+    assert job["id"] == 1 and job["status"] == PENDING and job["progress"] == {}
+    assert job["options"]["max_resolution"] == 1200
+    post_job(server, tmp_path, "b")
+    status, jobs = server.dispatch("GET", "/jobs", b"")
+    assert status == HTTPStatus.OK and [job["id"] for job in jobs] == [1, 2]
+    assert server.dispatch("GET", "/jobs/2", b"")[1]["options"]["output_directory"] == str(tmp_path / "b" / "model")
+    assert server.dispatch("GET", "/status", b"") == (HTTPStatus.OK, server.queue.summary())
+
+
+def test_invalid_requests(server, tmp_path):
+    assert server.dispatch("POST", "/jobs", b"not json")[0] == HTTPStatus.BAD_REQUEST
+    assert server.dispatch("POST", "/jobs", b'{"input_directory": "images"}')[0] == HTTPStatus.BAD_REQUEST
+    assert post_job(server, tmp_path, "a", unknown=1)[0] == HTTPStatus.BAD_REQUEST
+    assert post_job(server, tmp_path, "a", mesher="unknown")[0] == HTTPStatus.BAD_REQUEST
+    assert server.dispatch("GET", "/jobs/7", b"")[0] == HTTPStatus.NOT_FOUND
+    assert server.dispatch("DELETE", "/jobs", b"")[0] == HTTPStatus.NOT_FOUND
+    assert server.queue.jobs == []
+    post_job(server, tmp_path, "a")
+    assert server.dispatch("GET", "/jobs/1/events?since=x", b"")[0] == HTTPStatus.BAD_REQUEST
+
+
+def test_cancel_pending_job(server, tmp_path):
+    post_job(server, tmp_path, "a")
+    status, job = server.dispatch("POST", "/jobs/1/cancel", b"")
+    assert status == HTTPStatus.OK and job["status"] == CANCELLED
+    assert server.dispatch("POST", "/jobs/1/cancel", b"")[0] == HTTPStatus.CONFLICT
+
+
+def test_progress_of_running_stages(server, tmp_path):
+    _, job = post_job(server, tmp_path, "a")
+    job = server.queue.find(job["id"])
+    server.track_progress(job, create_event(STAGE_STARTED, "matching"))
+    server.track_progress(job, create_event(STAGE_STARTED, "densify"))
+    server.track_progress(job, create_event(STAGE_PROGRESS, "densify", percent=40.0))
+    server.track_progress(job, create_event(STAGE_FINISHED, "matching"))
+    assert server.dispatch("GET", "/jobs/1", b"")[1]["progress"] == {"densify": 40.0}
+    server.track_progress(job, create_event(PIPELINE_FINISHED))
+    assert server.dispatch("GET", "/jobs/1", b"")[1]["progress"] == {}
+
+
+def test_events_are_paged(server, tmp_path):
+    post_job(server, tmp_path, "a")
+    assert server.dispatch("GET", "/jobs/1/events", b"")[1] == {"events": [], "next": 0}
+    (tmp_path / "a" / "model").mkdir(parents=True)
+    lines = [json.dumps({"event": STAGE_PROGRESS, "percent": index}) + "\n" for index in range(MAX_EVENTS + 3)]
+    with open(tmp_path / "a" / "model" / EVENT_LOG_NAME, "w") as log_file:
+        log_file.writelines(lines)
+        # Line which is still being written
+        log_file.write('{"event": ')
+    _, page = server.dispatch("GET", "/jobs/1/events", b"")
+    assert len(page["events"]) == MAX_EVENTS
+    assert page["next"] == sum(len(line) for line in lines[:MAX_EVENTS])
+    _, page = server.dispatch("GET", f"/jobs/1/events?since={page['next']}", b"")
+    assert [event["percent"] for event in page["events"]] == [MAX_EVENTS, MAX_EVENTS + 1, MAX_EVENTS + 2]
+    assert page["next"] == sum(len(line) for line in lines)
+    assert server.dispatch("GET", f"/jobs/1/events?since={page['next']}", b"")[1] == {"events": [],
+                                                                                     "next": page["next"]}
+
+
+class Writer:
+    """Outgoing side of a connection which keeps the written data."""
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data: bytes):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def request(server, data: bytes) -> tuple:
+    """Pass raw request to handle_connection and return the status code and decoded body of the response."""
+    async def handle():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = Writer()
+        await server.handle_connection(reader, writer)
+        return writer.data
+    head, _, body = asyncio.run(handle()).partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_connection(server, tmp_path):
+    body = json.dumps({"input_directory": str(tmp_path / "images"), "output_directory": str(tmp_path / "model")})
+    status, job = request(server, f"POST /jobs HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n{body}".encode())
+    assert status == HTTPStatus.CREATED and job["id"] == 1
+    assert request(server, b"GET /jobs/1 HTTP/1.1\r\n\r\n") == (HTTPStatus.OK, server.job_state(job))
+    assert request(server, b"garbage\r\n\r\n")[0] == HTTPStatus.BAD_REQUEST
+
+
+def test_failed_request_gets_an_answer(server, tmp_path):
+    post_job(server, tmp_path, "a")
+    (tmp_path / "a" / "model").mkdir(parents=True)
+    (tmp_path / "a" / "model" / EVENT_LOG_NAME).write_text("not json\n")
+    status, response = request(server, b"GET /jobs/1/events HTTP/1.1\r\n\r\n")
+    assert status == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert "JSONDecodeError" in response["error"]
@@ -0,0 +1,64 @@
+"""Tests of names and manifests of level-of-detail pyramids."""
+import json
+import os
+
+import pytest
+
+from src.lod_pyramid import (LOD_TRIANGLES, MANIFEST_VERSION, choose_level, level_path, manifest_path, pyramid_paths,
+                             read_manifest, write_manifest)
+
+
+def write_levels(directory, triangles: list) -> tuple:
+    mesh_path = str(directory / "scene_dense_mesh.ply")
+    levels = []
+    for level, count in enumerate(triangles):
+        path = level_path(mesh_path, level)
+        with open(path, "wb") as mesh_file:
+            mesh_file.write(b"x" * count)
+        levels.append({"level": level, "path": path, "triangles": count, "vertices": count // 2})
+    return mesh_path, levels
+
+
+def test_paths():
+    assert level_path("out/scene_dense_mesh.ply", 0) == "out/scene_dense_mesh.ply"
+    assert level_path("out/scene_dense_mesh.ply", 2) == "out/scene_dense_mesh_lod2.ply"
+    assert level_path("out/mesh.obj", 1) == "out/mesh_lod1.obj"
+    assert manifest_path("out/scene_dense_mesh.ply") == "out/scene_dense_mesh_lod.json"
+    assert pyramid_paths("out/mesh.ply", 2) == ["out/mesh_lod1.ply", "out/mesh_lod2.ply", "out/mesh_lod.json"]
+    assert len(pyramid_paths("out/mesh.ply")) == len(LOD_TRIANGLES) + 1
+
+
+def test_manifest_round_trip(tmp_path):
+    (tmp_path / "output").mkdir()
+    mesh_path, levels = write_levels(tmp_path / "output", [4000, 1000, 200])
+    path = write_manifest(mesh_path, levels)
+    with open(path) as manifest_file:
+        stored = json.load(manifest_file)
+    assert stored["version"] == MANIFEST_VERSION
+    assert [level["path"] for level in stored["levels"]] == ["scene_dense_mesh.ply", "scene_dense_mesh_lod1.ply",
+                                                              "scene_dense_mesh_lod2.ply"]
+    assert [level["size_bytes"] for level in stored["levels"]] == [4000, 1000, 200]
+
+    # Relative paths keep working after the results are moved
+    os.rename(tmp_path / "output", tmp_path / "moved")
+    manifest = read_manifest(str(tmp_path / "moved" / "scene_dense_mesh_lod.json"))
+    assert all(os.path.isfile(level["path"]) for level in manifest["levels"])
+
+
+def test_invalid_manifest(tmp_path):
+    (tmp_path / "old_lod.json").write_text(json.dumps({"version": MANIFEST_VERSION + 1, "levels": [{}]}))
+    (tmp_path / "empty_lod.json").write_text(json.dumps({"version": MANIFEST_VERSION, "levels": []}))
+    for name in ("old_lod.json", "empty_lod.json"):
+        with pytest.raises(ValueError):
+            read_manifest(str(tmp_path / name))
+
+
+def test_choose_level():
+    manifest = {"levels": [{"level": 2, "triangles": 200}, {"level": 0, "triangles": 4000},
+                           {"level": 1, "triangles": 1000}]}
+    assert choose_level(manifest, None)["level"] == 0
+    assert choose_level(manifest, 0)["level"] == 0
+    assert choose_level(manifest, 5000)["level"] == 0
+    assert choose_level(manifest, 1000)["level"] == 1
+    assert choose_level(manifest, 999)["level"] == 2
+    assert choose_level(manifest, 10)["level"] == 2
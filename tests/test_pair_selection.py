@@ -0,0 +1,71 @@
+"""Tests of the choice of image pairs for matching."""
+import json
+
+import numpy as np
+import pytest
+
+from src import pair_selection
+from src.pair_selection import local_positions, nearest_neighbours, select_pairs, write_pairs
+
+
+def grid_metadata(columns: int, rows: int, spacing: float = 0.0001) -> list:
+    """Images on a regular grid of GPS positions, taken row by row one second apart."""
+    return [{"latitude": 50.0 + row * spacing, "longitude": 14.0 + column * spacing, "altitude": 100.0,
+             "timestamp": float(row * columns + column)} for row in range(rows) for column in range(columns)]
+
+
+def test_local_positions():
+    positions = local_positions([{"latitude": 50.0, "longitude": 14.0, "altitude": 100.0},
+                                 {"latitude": 50.00001, "longitude": 14.0, "altitude": None},
+                                 {"latitude": None, "longitude": None, "altitude": None}])
+    assert positions[1, 1] - positions[0, 1] == pytest.approx(1.112, abs=0.001)
+    assert positions[1, 0] == pytest.approx(positions[0, 0])
+    assert positions[1, 2] == 100.0
+    assert np.isnan(positions[2, :2]).all()
+
+
+def test_nearest_neighbours(monkeypatch):
+    monkeypatch.setattr(pair_selection, "NEIGHBOUR_CHUNK", 7)
+    points = np.random.default_rng(2).uniform(0, 100, size=(50, 3))
+    neighbours = nearest_neighbours(points, 4)
+    distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    expected = np.sort(distances, axis=1)[:, :4]
+    assert np.allclose(np.sort(np.take_along_axis(distances, neighbours, axis=1), axis=1), expected)
+    assert nearest_neighbours(points[:1], 4).shape == (1, 0)
+
+
+def test_without_gps_all_pairs_are_matched():
+    metadata = [{"latitude": None, "timestamp": None} for _ in range(5)]
+    assert select_pairs(metadata) == {(i, j) for i in range(5) for j in range(i + 1, 5)}
+
+
+def test_pairs_of_a_grid():
+    metadata = grid_metadata(6, 5)
+    pairs = select_pairs(metadata, nearest=4, temporal=1)
+    assert all(i < j for i, j in pairs)
+    assert len(pairs) < 30 * 29 // 2
+    # Neighbours in the row and in the column, and consecutive images across the end of a row
+    assert {(0, 1), (0, 6), (5, 6), (13, 19)} <= pairs
+    assert (0, 29) not in pairs
+
+
+def test_image_without_gps_is_matched_with_all():
+    metadata = grid_metadata(4, 4)
+    metadata[5] = {"latitude": None, "longitude": None, "timestamp": None}
+    pairs = select_pairs(metadata, nearest=2, temporal=1)
+    assert all((min(5, other), max(5, other)) in pairs for other in range(16) if other != 5)
+
+
+def test_write_pairs(tmp_path):
+    views = []
+    for index in range(4):
+        (tmp_path / f"{index}.jpg").write_bytes(b"")
+        views.append({"key": index, "value": {"ptr_wrapper": {"data": {"id_view": index + 10,
+                                                                          "local_path": "",
+                                                                          "filename": f"{index}.jpg"}}}})
+    with open(tmp_path / "sfm_data.json", "w") as sfm_file:
+        json.dump({"root_path": str(tmp_path), "views": views}, sfm_file)
+    summary = write_pairs(str(tmp_path / "sfm_data.json"), str(tmp_path / "pairs.txt"))
+    assert summary == {"views": 4, "pairs": 6, "exhaustive_pairs": 6}
+    assert (tmp_path / "pairs.txt").read_text().splitlines() == ["10 11 12 13", "11 12 13", "12 13"]
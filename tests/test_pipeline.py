@@ -0,0 +1,70 @@
+"""Tests of running stages of the pipeline."""
+import os
+import shlex
+import sys
+import time
+
+import pytest
+
+from src.pipeline import Pipeline, PipelineCancelled, PipelineError, Stage
+from src.progress import STAGE_CANCELLED, STAGE_OUTPUT
+
+
+def marker_stage(tmp_path, name: str, result) -> Stage:
+    """Stage which action returns given result and which command writes a file named after the stage."""
+    command = [sys.executable, "-c", f"open({str(tmp_path / name)!r}, 'w').close()"]
+    return Stage(name, command=command, action=lambda: result)
+
+
+def test_action_decides_about_the_command(tmp_path):
+    Pipeline([marker_stage(tmp_path, "restored", True), marker_stage(tmp_path, "missing", False)]).run()
+    assert not (tmp_path / "restored").exists()
+    assert (tmp_path / "missing").exists()
+
+
+@pytest.mark.parametrize("result", [1, 0, None, "path"])
+def test_action_of_stage_with_command_returns_bool(tmp_path, result):
+    with pytest.raises(PipelineError, match="instead of a bool"):
+        Pipeline([marker_stage(tmp_path, "stage", result)]).run()
+    assert not (tmp_path / "stage").exists()
+
+
+def test_action_only_stage_returns_anything(tmp_path):
+    pipeline = Pipeline([Stage("copy", action=lambda: str(tmp_path / "copy"))])
+    pipeline.run()
+    assert pipeline.completed == ["copy"]
+
+
+def is_running(pid: int) -> bool:
+    """Check if the process exists and is not a zombie waiting to be reaped."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            return stat_file.read().rpartition(")")[2].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="processes are inspected through /proc")
+def test_cancel_stops_all_processes_of_the_command(tmp_path):
+    outputs = [str(tmp_path / "directory"), str(tmp_path / "result.txt")]
+    script = f"mkdir {shlex.quote(outputs[0])}; touch {shlex.quote(outputs[1])}; sleep 60 & echo $! $$; sleep 60"
+    pids = []
+    events = []
+
+    def listener(event):
+        events.append(event)
+        if event["event"] == STAGE_OUTPUT and not pids:
+            pids.extend(int(pid) for pid in event["line"].split())
+            pipeline.cancel()
+    pipeline = Pipeline([Stage("sleep", ["sh", "-c", script], outputs=outputs)], listeners=[listener])
+    started = time.time()
+    with pytest.raises(PipelineCancelled):
+        pipeline.run()
+    assert time.time() - started < 30
+    assert len(pids) == 2
+    deadline = time.time() + 5
+    while any(is_running(pid) for pid in pids) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not any(is_running(pid) for pid in pids)
+    assert not any(os.path.exists(path) for path in outputs)
+    assert STAGE_CANCELLED in [event["event"] for event in events]
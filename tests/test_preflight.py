@@ -0,0 +1,93 @@
+"""Tests of scores of the pre-flight check on synthetic images."""
+import json
+import os
+
+import cv2
+import numpy as np
+
+from src.preflight import MAX_SKY_FRACTION, rejection_reasons, run_preflight, score_image, sky_fraction
+
+SIZE = (384, 512)
+# Clear sky in BGR, hue 105 of 180 in OpenCV
+SKY_BLUE = (235, 160, 80)
+
+
+def textured(seed: int = 0) -> np.ndarray:
+    """Sharp, well exposed image: grey noise in blocks of 4 pixels, so it survives the reduced decoding."""
+    blocks = np.random.default_rng(seed).integers(60, 200, size=(SIZE[0] // 4, SIZE[1] // 4), dtype=np.uint8)
+    gray = np.kron(blocks, np.ones((4, 4), dtype=np.uint8))
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def flat(value) -> np.ndarray:
+    return np.full(SIZE + (3,), value, dtype=np.uint8)
+
+
+def save(directory, name: str, image: np.ndarray) -> str:
+    path = str(directory / name)
+    cv2.imwrite(path, image)
+    return path
+
+
+def test_sky_fraction_counts_regions_touching_the_top():
+    mask = np.zeros((10, 10), dtype=bool)
+    mask[3:7, 2:8] = True
+    assert sky_fraction(mask) == 0.0
+    mask[0:2, :] = True
+    assert sky_fraction(mask) == 0.2
+    # Region connected to the top through a column counts as a whole
+    mask[2, 4] = True
+    assert sky_fraction(mask) == 0.45
+
+
+def test_flat_image_is_blurred(tmp_path):
+    sharp = score_image(save(tmp_path, "sharp.png", textured()))
+    blurred = score_image(save(tmp_path, "flat.png", flat(128)))
+    assert blurred["sharpness"] == 0.0 < sharp["sharpness"]
+    assert rejection_reasons(blurred, sharp["sharpness"]) == ["blurred"]
+    assert rejection_reasons(sharp, sharp["sharpness"]) == []
+    smoothed = score_image(save(tmp_path, "smoothed.png", cv2.GaussianBlur(textured(), (0, 0), 8)))
+    assert "blurred" in rejection_reasons(smoothed, sharp["sharpness"])
+
+
+def test_sky_is_connected_to_the_top_edge(tmp_path):
+    image = textured()
+    image[:int(SIZE[0] * 0.9)] = SKY_BLUE
+    score = score_image(save(tmp_path, "sky.png", image))
+    assert score["sky_fraction"] > MAX_SKY_FRACTION
+    assert "sky only" in rejection_reasons(score, score["sharpness"])
+
+    # The same blue area which does not touch the top edge is a painted wall
+    wall = textured()
+    wall[int(SIZE[0] * 0.1):] = SKY_BLUE
+    score = score_image(save(tmp_path, "wall.png", wall))
+    assert score["sky_fraction"] < 0.05
+    assert "sky only" not in rejection_reasons(score, score["sharpness"])
+
+
+def test_exposure(tmp_path):
+    dark = score_image(save(tmp_path, "dark.png", textured() // 8))
+    assert rejection_reasons(dark, dark["sharpness"]) == ["badly exposed"]
+    # Bright and almost flat grey is also overcast sky
+    bright = score_image(save(tmp_path, "bright.png", 255 - textured() // 8))
+    assert "badly exposed" in rejection_reasons(bright, bright["sharpness"])
+    clipped = textured()
+    clipped[:, :SIZE[1] * 3 // 5] = 0
+    score = score_image(save(tmp_path, "clipped.png", clipped))
+    assert score["clipped_fraction"] > 0.5
+    assert "badly exposed" in rejection_reasons(score, score["sharpness"])
+    assert score_image(str(tmp_path / "missing.png"))["error"]
+
+
+def test_run_preflight(tmp_path):
+    (tmp_path / "images").mkdir()
+    for index in range(3):
+        save(tmp_path / "images", f"sharp_{index}.png", textured(index))
+    save(tmp_path / "images", "flat.png", flat(128))
+    report = run_preflight(str(tmp_path / "images"), str(tmp_path / "accepted"), str(tmp_path / "report.json"),
+                           max_workers=1)
+    assert report["images"] == 4 and report["kept"] == 3
+    assert report["rejected"] == {"flat.png": ["blurred"]}
+    assert sorted(os.listdir(tmp_path / "accepted")) == ["sharp_0.png", "sharp_1.png", "sharp_2.png"]
+    with open(tmp_path / "report.json") as report_file:
+        assert json.load(report_file) == report
@@ -0,0 +1,65 @@
+"""Tests of progress parsing and of events of the pipeline."""
+import json
+import sys
+
+import pytest
+
+from src.pipeline import Pipeline, PipelineError, Stage
+from src.progress import (PIPELINE_FINISHED, PIPELINE_STARTED, PROGRESS_BAR_LENGTH, STAGE_FAILED, STAGE_FINISHED,
+                          STAGE_OUTPUT, STAGE_PROGRESS, STAGE_STARTED, EventLog, ProgressParser)
+
+OPENMVG_HEADER = "0%   10   20   30   40   50   60   70   80   90   100%"
+
+
+def test_percentages():
+    parser = ProgressParser()
+    assert parser.feed("Estimated depth-maps 12 (8.33%, 1s, ETA 11s)...") == pytest.approx(8.33)
+    assert parser.feed("Fused depth-maps 3 (25%, 50% done)") == 50.0
+    assert parser.feed("Bogus 250%") == 100.0
+    assert parser.feed("Reading images") is None
+    # Unfinished lines are parsed only in progress bars
+    assert parser.feed("Densifying 40%", complete=False) is None
+
+
+def test_progress_bar():
+    parser = ProgressParser()
+    assert parser.feed(OPENMVG_HEADER) == 0.0
+    assert parser.feed("*" * 10, complete=False) == pytest.approx(100 * 10 / PROGRESS_BAR_LENGTH)
+    assert parser.feed("*" * 30, complete=False) == pytest.approx(100 * 30 / PROGRESS_BAR_LENGTH)
+    assert parser.feed("*" * PROGRESS_BAR_LENGTH) == 100.0
+    # Stars after the finished bar are not progress
+    assert parser.feed("*" * 10) is None
+
+
+def test_stars_without_header_are_not_progress():
+    assert ProgressParser().feed("*****", complete=False) is None
+
+
+def test_event_log(tmp_path):
+    log = EventLog(str(tmp_path / "logs" / "events.jsonl"))
+    log({"event": STAGE_STARTED, "stage": "a"})
+    log({"event": STAGE_FINISHED, "stage": "a"})
+    with open(tmp_path / "logs" / "events.jsonl") as log_file:
+        assert [json.loads(line)["event"] for line in log_file] == [STAGE_STARTED, STAGE_FINISHED]
+
+
+def test_command_output_and_progress_are_streamed():
+    script = "import sys\nfor percent in (0, 0.5, 30, 30.4, 100):\n    print(f'Working {percent}%', flush=True)\n" \
+             "sys.stdout.write('no line ending')\n"
+    events = []
+    Pipeline([Stage("tool", [sys.executable, "-c", script])], listeners=[events.append]).run()
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == PIPELINE_STARTED and kinds[-1] == PIPELINE_FINISHED
+    assert [event["line"] for event in events if event["event"] == STAGE_OUTPUT][-1] == "no line ending"
+    assert [event["percent"] for event in events if event["event"] == STAGE_PROGRESS] == [0.0, 30.0, 100.0]
+
+
+def test_failed_command_reports_its_output():
+    events = []
+    with pytest.raises(PipelineError) as error:
+        Pipeline([Stage("tool", [sys.executable, "-c", "print('bad input'); raise SystemExit(3)"])],
+                 listeners=[events.append]).run()
+    assert error.value.returncode == 3
+    assert list(error.value.output) == ["bad input"]
+    failed = [event for event in events if event["event"] == STAGE_FAILED]
+    assert failed[0]["stage"] == "tool" and failed[0]["returncode"] == 3
@@ -0,0 +1,41 @@
+"""Tests of stages of the reconstruction pipeline. Stages are only created, no tool is run."""
+from src.lod_pyramid import pyramid_paths
+from src.reconstruction import MESHERS, ProcessingOptions, image_stages, meshing_stages
+
+
+def test_sfm_reads_original_images_by_default(tmp_path):
+    options = ProcessingOptions(str(tmp_path / "images"), str(tmp_path / "model"),
+                                cache_directory=str(tmp_path / "cache"), preflight=False, deduplicate=False)
+    stages, images = image_stages(options)
+    assert stages == [] and images == options.input_directory
+
+    stages, images = image_stages(options.copy(deduplicate=True))
+    assert [stage.name for stage in stages] == ["dedup"]
+    assert images == stages[0].outputs[0]
+
+
+def test_images_are_scaled_on_request(tmp_path):
+    options = ProcessingOptions(str(tmp_path / "images"), str(tmp_path / "model"),
+                                cache_directory=str(tmp_path / "cache"), downscale_images=True)
+    stages, images = image_stages(options)
+    assert [stage.name for stage in stages] == ["preflight", "dedup", "resize"]
+    assert stages[2].inputs == [stages[1].outputs[0]]
+    assert stages[2].outputs == [images]
+    assert stages[2].parameters["max_resolution"] == options.max_resolution
+
+
+def test_preflight_writes_its_own_output(tmp_path):
+    options = ProcessingOptions(str(tmp_path / "images"), str(tmp_path / "model"))
+    preflight, dedup = image_stages(options)[0]
+    assert preflight.action.args[1] == preflight.outputs[0]
+    assert dedup.action.args[:2] == (preflight.outputs[0], dedup.outputs[0])
+
+
+def test_all_files_of_the_pyramid_are_outputs(tmp_path):
+    options = ProcessingOptions(str(tmp_path / "images"), str(tmp_path / "model"), lod=True)
+    for mesher in MESHERS:
+        stages, paths = meshing_stages(options.copy(mesher=mesher), str(tmp_path / "scene_dense.mvs"), str(tmp_path),
+                                       str(tmp_path), refine=False)
+        outputs = [path for stage in stages for path in stage.outputs]
+        assert set(pyramid_paths(paths["mesh"])) <= set(outputs)
+        assert paths["lod_manifest"] in outputs
@@ -0,0 +1,106 @@
+"""Tests of measurements of disk usage and of the report of a run."""
+import json
+import os
+import signal
+import subprocess
+import sys
+
+from src.progress import (PIPELINE_FAILED, PIPELINE_FINISHED, PIPELINE_STARTED, STAGE_FAILED, STAGE_FINISHED,
+                          STAGE_SKIPPED, STAGE_STARTED, create_event)
+from src.resources import DirectorySampler, RunReport, directory_size, format_report, wait_command
+
+
+def test_directory_size(tmp_path):
+    (tmp_path / "output" / "nested").mkdir(parents=True)
+    (tmp_path / "output" / "a.bin").write_bytes(b"a" * 100)
+    (tmp_path / "output" / "nested" / "b.bin").write_bytes(b"b" * 50)
+    os.symlink(tmp_path / "output" / "a.bin", tmp_path / "output" / "link.bin")
+    assert directory_size(str(tmp_path / "output")) == 150
+    assert directory_size(str(tmp_path / "missing")) == 0
+
+
+def test_hard_links_are_counted_once(tmp_path):
+    (tmp_path / "output").mkdir()
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "output" / "own.bin").write_bytes(b"o" * 200)
+    os.link(tmp_path / "output" / "own.bin", tmp_path / "output" / "own_copy.bin")
+    # Entry of the shared cache only linked into the output does not take space of the output
+    (tmp_path / "cache" / "entry.bin").write_bytes(b"c" * 1000)
+    os.link(tmp_path / "cache" / "entry.bin", tmp_path / "output" / "cached.bin")
+    assert directory_size(str(tmp_path / "output")) == 200
+    assert directory_size(str(tmp_path)) == 1200
+
+
+def test_directory_sampler(tmp_path):
+    (tmp_path / "file.bin").write_bytes(b"x" * 10)
+    sampler = DirectorySampler(str(tmp_path), interval=60)
+    sampler.start()
+    sampler.begin("stage")
+    (tmp_path / "big.bin").write_bytes(b"x" * 90)
+    sampler.sample()
+    assert sampler.end("stage") == 100
+    os.remove(tmp_path / "big.bin")
+    (tmp_path / "last.bin").write_bytes(b"x" * 200)
+    peaks = []
+    sampler.stop(peaks.append)
+    sampler.join(10)
+    assert peaks == [210] and sampler.peak == 210
+    assert sampler.end("unknown") == 210
+
+
+def stage_finished(stage: str, duration: float, **resources) -> dict:
+    return create_event(STAGE_FINISHED, stage, duration=duration, resources=resources)
+
+
+def test_report_totals(tmp_path):
+    report = RunReport(str(tmp_path / "report" / "run_report.json"), {"max_resolution": 800})
+    report(create_event(STAGE_STARTED, "ignored"))
+    for event in [create_event(PIPELINE_STARTED, stages=["a", "b", "c", "d"]),
+                  create_event(STAGE_STARTED, "a"),
+                  stage_finished("a", 10.0, cpu_user=5.0, cpu_system=1.0, peak_rss=300, read_bytes=10,
+                                 write_bytes=20),
+                  create_event(STAGE_STARTED, "b"),
+                  stage_finished("b", 30.0, cpu_user=20.0, cpu_system=None, peak_rss=500, read_bytes=5,
+                                 write_bytes=None),
+                  create_event(STAGE_SKIPPED, "c"),
+                  create_event(STAGE_STARTED, "d"),
+                  create_event(STAGE_FAILED, "d", error="broken"),
+                  create_event(PIPELINE_FAILED, "d", error="broken")]:
+        report(event)
+    with open(tmp_path / "report" / "run_report.json") as report_file:
+        written = json.load(report_file)
+    assert written["status"] == "failed" and written["failed_stage"] == "d"
+    assert written["options"] == {"max_resolution": 800}
+    assert sorted(written["stages"]) == ["a", "b"] and written["skipped"] == ["c"]
+    assert written["totals"] == {"cpu_user": 25.0, "cpu_system": 1.0, "read_bytes": 15, "write_bytes": 20,
+                                 "peak_rss": 500}
+    assert "Longest stages:\n  b: 0m 30s" in format_report(written)
+
+
+def test_report_of_disk_usage(tmp_path):
+    output = tmp_path / "output"
+    output.mkdir()
+    report = RunReport(str(output / "run_report.json"), directory=str(output))
+    report(create_event(PIPELINE_STARTED, stages=["a"]))
+    report(create_event(STAGE_STARTED, "a"))
+    (output / "result.bin").write_bytes(b"x" * 5000)
+    report.disk_sampler.sample()
+    report(stage_finished("a", 1.0))
+    (output / "late.bin").write_bytes(b"x" * 20000)
+    report(create_event(PIPELINE_FINISHED, completed=["a"], skipped=[]))
+    # The last sample is taken by the sampler thread after the pipeline ended
+    report.disk_sampler.join(10)
+    with open(output / "run_report.json") as report_file:
+        written = json.load(report_file)
+    assert written["stages"]["a"]["peak_disk"] >= 5000
+    assert written["totals"]["peak_disk"] >= 25000
+    assert not os.path.exists(str(output / "run_report.json") + ".tmp")
+
+
+def test_wait_command():
+    process = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    wait_command(process)
+    assert process.returncode == 3 and process.poll() == 3
+    process = subprocess.Popen([sys.executable, "-c", "import os, signal; os.kill(os.getpid(), signal.SIGKILL)"])
+    wait_command(process)
+    assert process.returncode == -signal.SIGKILL
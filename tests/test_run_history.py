@@ -0,0 +1,56 @@
+"""Tests of the history of finished runs and of predictions of stage durations."""
+import pytest
+
+from src.run_history import MIN_RUNS_FOR_REGRESSION, RunHistory, stage_kind
+
+
+@pytest.fixture
+def history(tmp_path):
+    return RunHistory(str(tmp_path / "history" / "run_history.sqlite"))
+
+
+def report(stages: dict, skipped: list = ()) -> dict:
+    return {"stages": {name: {"wall_time": seconds, "peak_rss": 100} for name, seconds in stages.items()},
+            "skipped": list(skipped), "wall_time": sum(stages.values()), "options": {}}
+
+
+def test_stage_kind():
+    assert stage_kind("chunk_03_densification") == "densification"
+    assert stage_kind("densification") == "densification"
+    assert stage_kind("merge_chunks") == "merge_chunks"
+
+
+def test_regression_with_enough_runs(history):
+    runs = [(10, 20.0), (20, 25.0), (40, 80.0), (80, 100.0), (30, 10.0)]
+    assert len(runs) >= MIN_RUNS_FOR_REGRESSION
+    for images, megapixels in runs:
+        history.record(report({"matching": 5.0 + 2.0 * images + 3.0 * megapixels}), images, megapixels)
+    assert history.predict(100, 50.0)["matching"] == pytest.approx(5.0 + 200.0 + 150.0)
+    # Only the constant part of the model is left for an empty dataset
+    assert history.predict(0, 0.0, ["matching"])["matching"] == pytest.approx(5.0)
+
+
+def test_duration_per_megapixel_with_few_runs(history):
+    history.record(report({"densification": 40.0}), 10, 20.0)
+    history.record(report({"densification": 60.0}), 50, 30.0)
+    assert history.predict(100, 10.0) == {"densification": pytest.approx(20.0)}
+    assert history.predict(100, 10.0, ["densification", "meshing"]) == {"densification": pytest.approx(20.0)}
+
+
+def test_stages_of_chunks_share_the_prediction(history):
+    history.record(report({"chunk_00_densification": 30.0, "chunk_01_densification": 10.0, "merge_chunks": 5.0}),
+                   10, 20.0)
+    assert history.stage_samples()["densification"].tolist() == [[10, 20.0, 40.0]]
+    predictions = history.predict(10, 40.0, ["chunk_00_densification", "chunk_01_densification",
+                                             "chunk_02_densification", "chunk_03_densification", "merge_chunks"])
+    assert predictions["chunk_00_densification"] == pytest.approx(80.0 / 4)
+    assert predictions["chunk_03_densification"] == pytest.approx(80.0 / 4)
+    assert predictions["merge_chunks"] == pytest.approx(10.0)
+
+
+def test_skipped_stages_are_not_recorded(history):
+    history.record(report({"matching": 1.0, "meshing": 50.0, "chunk_00_densification": 30.0,
+                           "chunk_01_densification": 0.0}, skipped=["matching", "chunk_01_densification"]),
+                   10, 20.0)
+    assert set(history.stage_samples()) == {"meshing"}
+    assert set(history.predict(10, 20.0, ["matching", "meshing", "densification"])) == {"meshing"}
@@ -0,0 +1,43 @@
+"""Tests of variants of meshing sweeps and of counting faces of their meshes."""
+import struct
+
+import pytest
+
+from src.sweep import count_faces, sweep_variants
+
+
+def test_variants_are_the_product_of_the_grid():
+    variants = sweep_variants({"smoothing_iterations": [0, 2, 4], "decimate": [1.0, 0.5]})
+    assert len(variants) == 6
+    assert variants[0] == {"decimate": 1.0, "smoothing_iterations": 0}
+    assert variants[-1] == {"decimate": 0.5, "smoothing_iterations": 4}
+    assert len({tuple(sorted(variant.items())) for variant in variants}) == 6
+    assert sweep_variants({"decimate": [0.5]}) == [{"decimate": 0.5}]
+
+
+def test_unknown_options_are_rejected():
+    with pytest.raises(ValueError, match="max_resolution, mesher can not be swept"):
+        sweep_variants({"decimate": [1.0], "mesher": ["bpa"], "max_resolution": [800]})
+
+
+def test_count_faces_of_ply(tmp_path):
+    header = (b"ply\nformat binary_little_endian 1.0\nelement vertex 3\nproperty float x\nproperty float y\n"
+              b"property float z\nelement face 2\nproperty list uchar int vertex_indices\nend_header\n")
+    # Binary body may contain anything, including the words of the header
+    body = struct.pack("<9f", *range(9)) + b"element face 7\n" + bytes(range(256))
+    (tmp_path / "mesh.ply").write_bytes(header + body)
+    assert count_faces(str(tmp_path / "mesh.ply")) == 2
+    (tmp_path / "points.PLY").write_bytes(b"ply\nformat ascii 1.0\nelement vertex 1\nproperty float x\nend_header\n1\n")
+    assert count_faces(str(tmp_path / "points.PLY")) == 0
+
+
+def test_count_faces_of_obj(tmp_path):
+    (tmp_path / "mesh.obj").write_text("# f 1 2 3\nv 0 0 0\nv 1 0 0\nv 0 1 0\nv 1 1 0\nvn 0 0 1\n"
+                                       "f 1 2 3\nf 2 4 3\nf 1//1 2//1 4//1\n")
+    assert count_faces(str(tmp_path / "mesh.obj")) == 3
+
+
+def test_count_faces_of_missing_or_unknown_files(tmp_path):
+    assert count_faces(str(tmp_path / "missing.ply")) is None
+    (tmp_path / "mesh.stl").write_bytes(b"solid mesh\n")
+    assert count_faces(str(tmp_path / "mesh.stl")) is None